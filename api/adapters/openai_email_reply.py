@@ -4,116 +4,431 @@ Adapter: OpenAI email reply drafting.
 
 from __future__ import annotations
 
-from typing import Any, Dict
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Tuple, Union
+import asyncio
+import functools
+import hashlib
+import json
 import os
+import re
+import threading
+import weakref
 
-# Try OpenAI import, fallback to mock if not available
 try:
-	from openai import OpenAI
-	OPENAI_AVAILABLE = True
-except ImportError:
-	OPENAI_AVAILABLE = False
+	from api.services import optional_deps  # type: ignore
+except Exception:
+	from services import optional_deps  # type: ignore
 
+# The OpenAI SDK is imported by get_client()/get_async_client() on first use (it is the
+# slowest import of the app); without it the adapter falls back to mock drafts.
+OPENAI_AVAILABLE = optional_deps.available("openai")
+OpenAI: Any = None
+AsyncOpenAI: Any = None
 
-def draft_reply(thread_text: str, controls: Dict[str, Any]) -> Dict[str, Any]:
+# Redis tier for the draft cache (best effort)
+try:
+	from api.services import persistence  # type: ignore
+	_PERSISTENCE_AVAILABLE = True
+except Exception:
+	try:
+		from services import persistence  # type: ignore
+		_PERSISTENCE_AVAILABLE = True
+	except Exception:
+		_PERSISTENCE_AVAILABLE = False
+
+DEFAULT_MODEL = "gpt-4.1-mini"
+
+# Part of the draft cache key: bump whenever _SYSTEM_PROMPT, _TONE_MAP, _controls_prompt or the
+# completion parameters change, so drafts produced by the old prompt are not served again
+PROMPT_VERSION = 1
+
+# Adapters accept plain thread text or a parsed thread (anything with to_text/subject/participants)
+ThreadInput = Union[str, Any]
+
+# Long-lived clients, rebuilt only when the API key changes: one sync pool per process and one
+# async pool per event loop (an AsyncClient's connections are bound to the loop they run on)
+_OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+_OPENAI_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "60"))
+_OPENAI_CONNECT_TIMEOUT_SECONDS = float(os.getenv("OPENAI_CONNECT_TIMEOUT_SECONDS", "5"))
+_OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+_client_lock = threading.Lock()
+_sync_client: Tuple[str, Any] | None = None
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Tuple[str, Any]]" = weakref.WeakKeyDictionary()
+_closing: set = set()
+
+# Content-addressed draft cache: in-process LRU in front of Redis.
+# Set DRAFT_CACHE_ENABLED=0 to disable; pass controls["regenerate"]=True to force a fresh variant.
+_DRAFT_CACHE_ENABLED = os.getenv("DRAFT_CACHE_ENABLED", "1") not in ("0", "false", "False")
+_DRAFT_CACHE_SIZE = int(os.getenv("DRAFT_CACHE_SIZE", "256"))
+_DRAFT_CACHE_TTL_SECONDS = int(os.getenv("DRAFT_CACHE_TTL_SECONDS", "86400"))
+_draft_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_draft_cache_lock = threading.Lock()
+
+
+def draft_reply(thread_text: ThreadInput, controls: Dict[str, Any]) -> Dict[str, Any]:
 	"""
 	Generate a polite, safe email draft based on the provided thread text.
 	Uses OpenAI GPT-4.1-mini to generate contextual replies.
+	Identical thread/controls/model combinations are served from the draft cache unless
+	controls["regenerate"] is set; meta["cache"] reports whether (and where) it hit.
 
 	Args:
-		thread_text: The email thread content to reply to
-		controls: Dictionary with tone, length, bullets settings
+		thread_text: The email thread to reply to, as plain text or a parsed thread
+			(services.mime.ParsedThread), which also fills meta subject/participants
+		controls: Dictionary with tone, length, bullets, regenerate settings
 
 	Returns:
 		{ "text": str, "meta": { "subject": str|None, "participants": list|None, "token_usage": dict|None } }
 	"""
-	tone = controls.get("tone", "friendly")
-	length = controls.get("length", 120)  # word count target
-	bullets = bool(controls.get("bullets", False))
+	thread_text, thread_meta = _thread_input(thread_text)
+	return _with_thread_meta(_draft_reply(thread_text, controls), thread_meta)
 
+
+def _draft_reply(thread_text: str, controls: Dict[str, Any]) -> Dict[str, Any]:
+	request = _DraftRequest(thread_text, controls)
 	# If OpenAI not available or no API key, return mock
-	api_key = os.getenv("OPENAI_API_KEY")
-	if not OPENAI_AVAILABLE or not api_key:
-		return _mock_draft(tone, length, bullets)
+	if not request.api_key:
+		return request.mock()
+	if request.read_cache:
+		cached, tier = _draft_cache_get(request.cache_key)
+		if cached:
+			return _cached_result(cached, tier)
 
 	try:
-		client = OpenAI(api_key=api_key)
-
-		# Build system prompt based on controls
-		system_prompt = _build_system_prompt(tone, length, bullets)
-
-		# Call OpenAI API
-		response = client.chat.completions.create(
-			model="gpt-4.1-mini",
-			messages=[
-				{"role": "system", "content": system_prompt},
-				{"role": "user", "content": f"Email thread to reply to:\n\n{thread_text}"}
-			],
-			temperature=0.7,
-			max_tokens=500,
-		)
-
-		draft_text = response.choices[0].message.content.strip()
-		token_usage = {
-			"prompt_tokens": response.usage.prompt_tokens,
-			"completion_tokens": response.usage.completion_tokens,
-			"total_tokens": response.usage.total_tokens,
-		}
-
-		return {
-			"text": draft_text,
-			"meta": {
-				"subject": None,  # Could parse from thread_text in future
-				"participants": None,  # Could parse from thread_text in future
-				"token_usage": token_usage,
-			},
-		}
+		response = get_client(request.api_key).chat.completions.create(**request.completion_kwargs())
+		result = _draft_from_response(response)
+		if request.cache_key:
+			_draft_cache_put(request.cache_key, result)
+		return result
 
 	except Exception as e:
 		# Log error and return fallback
 		print(f"OpenAI API error: {e}")
-		return _mock_draft(tone, length, bullets)
+		return request.mock()
 
 
-def _build_system_prompt(tone: str, length: int, bullets: bool) -> str:
-	"""Build system prompt based on user preferences."""
-	
-	# Base instruction
-	prompt = (
-		"You are a professional email assistant. Your task is to draft a polite, contextual reply "
-		"to an email thread. Follow these guidelines:\n\n"
-	)
+async def astream_draft_reply(thread_text: ThreadInput, controls: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+	"""
+	Streaming variant of draft_reply using the shared AsyncOpenAI client.
+
+	Yields { "type": "delta", "text": str } for each chunk as the model generates it, then a
+	final { "type": "done", "text": str, "meta": {...} } with the same shape as draft_reply().
+	Falls back to the mock draft (streamed word by word) when OpenAI is unavailable.
+	"""
+	thread_text, thread_meta = _thread_input(thread_text)
+	async for event in _astream_draft_reply(thread_text, controls):
+		yield _with_thread_meta(event, thread_meta) if event["type"] == "done" else event
+
+
+async def _astream_draft_reply(thread_text: str, controls: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+	request = _DraftRequest(thread_text, controls)
+	if not request.api_key:
+		for event in _stream_mock(request.mock()):
+			yield event
+		return
+	if request.read_cache:
+		cached, tier = await asyncio.to_thread(_draft_cache_get, request.cache_key)
+		if cached:
+			for event in _stream_mock(_cached_result(cached, tier)):
+				yield event
+			return
+
+	parts: list[str] = []
+	try:
+		stream = await get_async_client(request.api_key).chat.completions.create(**request.completion_kwargs(streaming=True))
+		token_usage = None
+		async for chunk in stream:
+			delta, usage = _read_chunk(chunk, parts)
+			if delta:
+				yield {"type": "delta", "text": delta}
+			token_usage = usage or token_usage
+
+		result = _draft_result("".join(parts).strip(), token_usage)
+		if request.cache_key and result["text"]:
+			await asyncio.to_thread(_draft_cache_put, request.cache_key, result)
+		yield {"type": "done", **result}
+
+	except Exception as e:
+		print(f"OpenAI streaming error: {e}")
+		for event in _interrupted_stream(request, parts):
+			yield event
+
 
-	# Tone
-	tone_map = {
-		"friendly": "Use a warm, friendly tone. Be conversational but professional.",
-		"formal": "Use a formal, professional tone. Be respectful and businesslike.",
-		"brief": "Be concise and to-the-point. Keep the reply short and efficient.",
-		"professional": "Use a balanced professional tone. Be clear and courteous.",
+class _DraftRequest:
+	"""Controls, credentials and cache key of one draft call, shared by every drafting path."""
+
+	__slots__ = ("thread_text", "tone", "length", "bullets", "api_key", "cache_key", "read_cache")
+
+	def __init__(self, thread_text: str, controls: Dict[str, Any]) -> None:
+		self.thread_text = thread_text
+		self.tone = controls.get("tone", "friendly")
+		self.length = controls.get("length", 120)  # word count target
+		self.bullets = bool(controls.get("bullets", False))
+		# None when the SDK or key is missing: callers fall back to the mock draft
+		self.api_key = os.getenv("OPENAI_API_KEY") if OPENAI_AVAILABLE else None
+		self.cache_key = (
+			_draft_cache_key(thread_text, self.tone, self.length, self.bullets, DEFAULT_MODEL)
+			if self.api_key and _DRAFT_CACHE_ENABLED else None
+		)
+		self.read_cache = bool(self.cache_key) and not controls.get("regenerate")
+
+	def completion_kwargs(self, streaming: bool = False) -> Dict[str, Any]:
+		kwargs = _completion_kwargs(self.thread_text, self.tone, self.length, self.bullets)
+		if streaming:
+			kwargs.update(stream=True, stream_options={"include_usage": True})
+		return kwargs
+
+	def mock(self) -> Dict[str, Any]:
+		return _mock_draft(self.tone, self.length, self.bullets)
+
+
+def _http_limits() -> Dict[str, Any]:
+	import httpx
+
+	return {
+		"limits": httpx.Limits(
+			max_connections=_OPENAI_MAX_CONNECTIONS,
+			max_keepalive_connections=_OPENAI_MAX_CONNECTIONS,
+		),
+		"timeout": httpx.Timeout(_OPENAI_TIMEOUT_SECONDS, connect=_OPENAI_CONNECT_TIMEOUT_SECONDS),
 	}
-	prompt += f"- Tone: {tone_map.get(tone, tone_map['friendly'])}\n"
 
-	# Length
-	prompt += f"- Target length: approximately {length} words\n"
 
-	# Bullets
-	if bullets:
-		prompt += "- Use bullet points to organize key information\n"
+def get_client(api_key: str | None = None) -> Any:
+	"""
+	Return the shared OpenAI client, building it on first use or when the key changes.
+	Pool size and timeouts come from OPENAI_MAX_CONNECTIONS / OPENAI_TIMEOUT_SECONDS.
+	"""
+	global _sync_client, OpenAI
+	api_key = api_key or os.getenv("OPENAI_API_KEY")
+	with _client_lock:
+		if _sync_client is None or _sync_client[0] != api_key:
+			import httpx
+			if OpenAI is None:
+				from openai import OpenAI
+
+			client = OpenAI(
+				api_key=api_key,
+				max_retries=_OPENAI_MAX_RETRIES,
+				http_client=httpx.Client(**_http_limits()),
+			)
+			_sync_client = (api_key, client)
+		return _sync_client[1]
+
+
+def get_async_client(api_key: str | None = None) -> Any:
+	"""
+	Async counterpart of get_client(): the shared AsyncOpenAI client of the running event loop.
+	A client replaced after a key change is closed in the background.
+	"""
+	global AsyncOpenAI
+	api_key = api_key or os.getenv("OPENAI_API_KEY")
+	loop = asyncio.get_running_loop()
+	with _client_lock:
+		current = _async_clients.get(loop)
+		if current is not None and current[0] == api_key:
+			return current[1]
+		import httpx
+		if AsyncOpenAI is None:
+			from openai import AsyncOpenAI
+
+		client = AsyncOpenAI(
+			api_key=api_key,
+			max_retries=_OPENAI_MAX_RETRIES,
+			http_client=httpx.AsyncClient(**_http_limits()),
+		)
+		_async_clients[loop] = (api_key, client)
+	if current is not None:
+		task = loop.create_task(current[1].close())
+		_closing.add(task)
+		task.add_done_callback(_closing.discard)
+	return client
+
+
+async def aclose() -> None:
+	"""Close the running event loop's AsyncOpenAI client (call on shutdown)."""
+	with _client_lock:
+		current = _async_clients.pop(asyncio.get_running_loop(), None)
+	if current is not None:
+		await current[1].close()
 
-	# Safety & best practices
-	prompt += (
-		"\nBest practices:\n"
-		"- Be polite and respectful\n"
-		"- Address the main points from the thread\n"
-		"- Do not include sensitive information (passwords, API keys, etc.)\n"
-		"- End with an appropriate closing (e.g., 'Best regards,' or 'Thank you,')\n"
-		"- Do NOT include a signature line with a name (the user will add their own)\n"
-		"- Focus on being helpful and constructive\n"
+
+def _completion_kwargs(thread_text: str, tone: str, length: int, bullets: bool) -> Dict[str, Any]:
+	"""Chat completion parameters shared by the sync, async and streaming paths."""
+	return {
+		"model": DEFAULT_MODEL,
+		"messages": _build_messages(thread_text, tone, length, bullets),
+		"temperature": 0.7,
+		"max_tokens": 500,
+	}
+
+
+def _draft_from_response(response: Any) -> Dict[str, Any]:
+	return _draft_result(response.choices[0].message.content.strip(), _token_usage(response.usage))
+
+
+def _draft_result(text: str, token_usage: Dict[str, Any] | None) -> Dict[str, Any]:
+	"""A freshly generated (not cached) draft in the adapter's return shape."""
+	return {
+		"text": text,
+		"meta": {
+			"subject": None,  # Filled from a parsed thread by draft_reply()
+			"participants": None,
+			"token_usage": token_usage,
+			"cache": {"hit": False, "tier": None},
+		},
+	}
+
+
+def _read_chunk(chunk: Any, parts: list[str]) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+	"""Text delta (also appended to parts) and token usage carried by one stream chunk."""
+	delta = None
+	if chunk.choices:
+		delta = chunk.choices[0].delta.content
+		if delta:
+			parts.append(delta)
+	# With include_usage the final chunk carries usage and no choices
+	usage = _token_usage(chunk.usage) if getattr(chunk, "usage", None) else None
+	return delta, usage
+
+
+def _interrupted_stream(request: _DraftRequest, parts: list[str]) -> Iterator[Dict[str, Any]]:
+	"""Events that close a stream that failed mid-way."""
+	if parts:
+		# Keep what the user has already seen rather than swapping in a different draft
+		yield {"type": "done", "text": "".join(parts).strip(), "meta": {"subject": None, "participants": None, "token_usage": None}}
+	else:
+		yield from _stream_mock(request.mock())
+
+
+def _thread_input(thread: ThreadInput) -> Tuple[str, Dict[str, Any]]:
+	"""Split the adapter input into prompt text and the subject/participants it carries."""
+	if isinstance(thread, str):
+		return thread, {}
+	# Parsed thread (services.mime.ParsedThread) or its compacted form (services.compaction)
+	thread_meta = {"subject": thread.subject, "participants": thread.participants or None}
+	stats = getattr(thread, "stats", None)
+	if stats:
+		thread_meta["compaction"] = stats
+	return thread.to_text(), thread_meta
+
+
+def _with_thread_meta(result: Dict[str, Any], thread_meta: Dict[str, Any]) -> Dict[str, Any]:
+	if not thread_meta:
+		return result
+	meta = {**(result.get("meta") or {})}
+	stats = thread_meta.get("compaction")
+	meta.update((k, v) for k, v in thread_meta.items() if k != "compaction")
+	if stats:
+		# Thread size before/after compaction sits next to the model's own counts
+		meta["token_usage"] = {**(meta.get("token_usage") or {}), **stats}
+	return {**result, "meta": meta}
+
+
+def _draft_cache_key(thread_text: str, tone: str, length: int, bullets: bool, model: str) -> str:
+	normalized = re.sub(r"\s+", " ", thread_text or "").strip()
+	material = json.dumps(
+		{"thread": normalized, "tone": tone, "length": length, "bullets": bullets, "model": model, "prompt": PROMPT_VERSION},
+		sort_keys=True,
+		separators=(",", ":"),
 	)
+	digest = hashlib.sha256(material.encode("utf-8")).hexdigest()
+	return f"{os.getenv('REDIS_PREFIX', 'emailreply')}:cache:draft:{digest}"
 
+
+def _draft_cache_get(key: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+	"""Look up a cached draft. Returns (draft, tier) where tier is "memory" or "redis"."""
+	with _draft_cache_lock:
+		draft = _draft_cache.get(key)
+		if draft is not None:
+			_draft_cache.move_to_end(key)
+			return draft, "memory"
+	if _PERSISTENCE_AVAILABLE:
+		draft = persistence.redis_get_json(key)
+		if draft and "text" in draft:
+			_draft_cache_put_local(key, draft)
+			return draft, "redis"
+	return None, None
+
+
+def _draft_cache_put_local(key: str, draft: Dict[str, Any]) -> None:
+	with _draft_cache_lock:
+		_draft_cache[key] = draft
+		_draft_cache.move_to_end(key)
+		while len(_draft_cache) > _DRAFT_CACHE_SIZE:
+			_draft_cache.popitem(last=False)
+
+
+def _draft_cache_put(key: str, draft: Dict[str, Any]) -> None:
+	entry = {"text": draft["text"], "meta": {k: v for k, v in draft["meta"].items() if k != "cache"}}
+	_draft_cache_put_local(key, entry)
+	if _PERSISTENCE_AVAILABLE:
+		persistence.redis_setex_json(key, _DRAFT_CACHE_TTL_SECONDS, entry)
+
+
+def _cached_result(draft: Dict[str, Any], tier: str) -> Dict[str, Any]:
+	# No tokens were spent on a hit: report zero usage, not the original generation's
+	usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cached_tokens": 0, "cached": True}
+	return {"text": draft["text"], "meta": {**draft["meta"], "token_usage": usage, "cache": {"hit": True, "tier": tier}}}
+
+
+# Static system prefix shared by every request. Keeping it byte-identical (and first) lets the
+# provider's prompt-prefix cache reuse it; per-request controls go in the last message.
+_SYSTEM_PROMPT = (
+	"You are a professional email assistant. Your task is to draft a polite, contextual reply "
+	"to an email thread. Follow the style instructions given after the thread.\n"
+	"\nBest practices:\n"
+	"- Be polite and respectful\n"
+	"- Address the main points from the thread\n"
+	"- Do not include sensitive information (passwords, API keys, etc.)\n"
+	"- End with an appropriate closing (e.g., 'Best regards,' or 'Thank you,')\n"
+	"- Do NOT include a signature line with a name (the user will add their own)\n"
+	"- Focus on being helpful and constructive\n"
+)
+
+_TONE_MAP = {
+	"friendly": "Use a warm, friendly tone. Be conversational but professional.",
+	"formal": "Use a formal, professional tone. Be respectful and businesslike.",
+	"brief": "Be concise and to-the-point. Keep the reply short and efficient.",
+	"professional": "Use a balanced professional tone. Be clear and courteous.",
+}
+
+
+def _build_messages(thread_text: str, tone: str, length: int, bullets: bool) -> list[Dict[str, str]]:
+	"""
+	Prompt layout, most stable first: static system prefix, then the thread (shared by
+	regenerations of the same thread), then the per-request controls.
+	"""
+	return [
+		{"role": "system", "content": _SYSTEM_PROMPT},
+		{"role": "user", "content": f"Email thread to reply to:\n\n{thread_text}"},
+		{"role": "system", "content": _controls_prompt(tone, length, bullets)},
+	]
+
+
+@functools.lru_cache(maxsize=64)
+def _controls_prompt(tone: str, length: int, bullets: bool) -> str:
+	"""Style instructions for one control combination (memoized)."""
+	prompt = "Reply style:\n"
+	prompt += f"- Tone: {_TONE_MAP.get(tone, _TONE_MAP['friendly'])}\n"
+	prompt += f"- Target length: approximately {length} words\n"
+	if bullets:
+		prompt += "- Use bullet points to organize key information\n"
 	return prompt
 
 
+def _token_usage(usage: Any) -> Dict[str, Any]:
+	"""Normalize an OpenAI usage block; cached_tokens is the prompt prefix served from the provider cache."""
+	details = getattr(usage, "prompt_tokens_details", None)
+	return {
+		"prompt_tokens": usage.prompt_tokens,
+		"completion_tokens": usage.completion_tokens,
+		"total_tokens": usage.total_tokens,
+		"cached_tokens": getattr(details, "cached_tokens", None) or 0,
+	}
+
+
 def _mock_draft(tone: str, length: int, bullets: bool) -> Dict[str, Any]:
 	"""Fallback mock draft when OpenAI is unavailable."""
 	prefix = "Hi," if tone == "formal" else "Hey,"
@@ -133,3 +448,13 @@ def _mock_draft(tone: str, length: int, bullets: bool) -> Dict[str, Any]:
 	}
 
 
+def _stream_mock(draft: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+	"""Emit a finished draft as word-sized deltas followed by the done event."""
+	text = draft["text"]
+	start = 0
+	while start < len(text):
+		end = text.find(" ", start + 1)
+		end = len(text) if end == -1 else end
+		yield {"type": "delta", "text": text[start:end]}
+		start = end
+	yield {"type": "done", "text": text, "meta": draft["meta"]}
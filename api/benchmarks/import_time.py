@@ -0,0 +1,106 @@
+"""
+Cold-start benchmark: import cost of the API app, measured with `python -X importtime`.
+
+Each run imports the module in a fresh interpreter and parses the importtime report, so the
+numbers match what a Railway scale-from-zero / redeploy pays before /jobs/health answers.
+
+	python -m api.benchmarks.import_time                   # median of 5 runs + slowest imports
+	python -m api.benchmarks.import_time --runs 10 --top 25
+	python -m api.benchmarks.import_time --history import_time.jsonl   # append a result line
+	python -m api.benchmarks.import_time --max-ms 800      # exit 1 when slower (CI guard)
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Tuple
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+# Imports that must stay off the cold-start path (loaded on first use)
+LAZY_MODULES = ("openai", "googleapiclient", "google_auth_oauthlib", "supabase")
+
+
+def measure(module: str = "api.main") -> Tuple[float, Dict[str, Tuple[float, float]]]:
+	"""
+	Import `module` in a fresh interpreter.
+	Returns (total ms, {imported module: (self ms, cumulative ms)}).
+	"""
+	env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+	proc = subprocess.run(
+		[sys.executable, "-X", "importtime", "-c", f"import {module}"],
+		cwd=REPO_ROOT,
+		env=env,
+		capture_output=True,
+		text=True,
+	)
+	if proc.returncode != 0:
+		raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+
+	imports: Dict[str, Tuple[float, float]] = {}
+	for line in proc.stderr.splitlines():
+		if not line.startswith("import time:") or "self [us]" in line:
+			continue
+		self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+		imports[name.strip()] = (int(self_us) / 1000, int(cumulative_us) / 1000)
+	if module not in imports:
+		raise RuntimeError(f"{module} missing from importtime output")
+	return imports[module][1], imports
+
+
+def run(module: str, runs: int) -> Dict[str, object]:
+	totals: List[float] = []
+	last: Dict[str, Tuple[float, float]] = {}
+	for _ in range(runs):
+		total, last = measure(module)
+		totals.append(total)
+	return {
+		"module": module,
+		"runs": runs,
+		"median_ms": round(statistics.median(totals), 1),
+		"min_ms": round(min(totals), 1),
+		"max_ms": round(max(totals), 1),
+		"eager_sdks": sorted(m for m in LAZY_MODULES if m in last),
+		"imports": last,
+	}
+
+
+def main(argv: List[str] | None = None) -> int:
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--module", default="api.main")
+	parser.add_argument("--runs", type=int, default=5)
+	parser.add_argument("--top", type=int, default=15, help="slowest imports to list (by self time)")
+	parser.add_argument("--history", help="append the result as a JSON line to this file")
+	parser.add_argument("--max-ms", type=float, help="fail if the median exceeds this")
+	args = parser.parse_args(argv)
+
+	result = run(args.module, max(1, args.runs))
+	imports = result.pop("imports")
+
+	print(f"⏱️  import {result['module']}: median {result['median_ms']} ms (min {result['min_ms']}, max {result['max_ms']}, {result['runs']} runs)")
+	print(f"{'self ms':>10} {'cumul ms':>10}  module")
+	for name, (self_ms, cumulative_ms) in sorted(imports.items(), key=lambda kv: kv[1][0], reverse=True)[:args.top]:
+		print(f"{self_ms:>10.1f} {cumulative_ms:>10.1f}  {name}")
+	if result["eager_sdks"]:
+		print(f"⚠️ SDKs imported at startup: {', '.join(result['eager_sdks'])}")
+
+	if args.history:
+		record = {"at": datetime.now(timezone.utc).isoformat(timespec="seconds"), "python": sys.version.split()[0], **result}
+		with open(args.history, "a", encoding="utf-8") as f:
+			f.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+	if args.max_ms is not None and result["median_ms"] > args.max_ms:
+		print(f"❌ median {result['median_ms']} ms exceeds --max-ms {args.max_ms}")
+		return 1
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
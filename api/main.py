@@ -1,22 +1,33 @@
 from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-import os, uuid, time, json
+from contextlib import asynccontextmanager
+import asyncio, os, uuid, time, json
 
 # Support both local package imports (repo root) and Railway service root ("api" as app root)
 try:
 	from api.adapters import openai_email_reply
-	from api.services import gmail, persistence
+	from api.services import async_http, compaction, gmail, gmail_client, gmail_quota, jobs, persistence
 	from api.routes import auth
 except ModuleNotFoundError:  # Running with cwd at api/ (e.g., Railway root=api)
 	from adapters import openai_email_reply
-	from services import gmail, persistence
+	from services import async_http, compaction, gmail, gmail_client, gmail_quota, jobs, persistence
 	from routes import auth
 
 APP_NAME = "emailreply"
 PREFIX = os.getenv("REDIS_PREFIX", APP_NAME)
 
-app = FastAPI(title="AI Email Reply Assistant API")
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    yield
+    # Let in-flight agent jobs finish, then flush queued draft rows
+    await asyncio.to_thread(jobs.shutdown, wait=True)
+    await asyncio.to_thread(persistence.drain_message_buffer)
+    await async_http.aclose()
+    await openai_email_reply.aclose()
+
+app = FastAPI(title="AI Email Reply Assistant API", lifespan=lifespan)
 
 # Include OAuth auth router
 app.include_router(auth.router)
@@ -46,104 +57,351 @@ class RunBody(BaseModel):
     input: str  # optional user nudge like "confirm Tuesday 3pm"
     meta: dict | None = None  # { threadId, tone, length, bullets }
 
+class BatchRunBody(BaseModel):
+    projectId: str
+    threadIds: list[str]
+    input: str = ""
+    meta: dict | None = None  # shared controls { tone, length, bullets }
+    concurrency: int | None = None  # max drafts in flight (capped by BATCH_MAX_CONCURRENCY)
+
 class SendEmailBody(BaseModel):
     projectId: str
     threadId: str
     draftText: str
     subject: str | None = None
 
-# In-memory fallback before wiring Redis/Supabase
-JOBS = {}
+# Size-capped, TTL-evicting job store; Redis holds a copy of finished jobs
+JOBS = jobs.store
+# Batch records hold the child jobIds/threadIds; progress is derived from the child jobs
+BATCHES = jobs.JobStore()
 
 @app.get("/jobs/health")
-def jobs_health():
+async def jobs_health():
     return {"status": "ok"}
 
-@app.post("/agent/run")
-def run_agent(body: RunBody):
-    if not body.meta or "threadId" not in body.meta:
-        raise HTTPException(status_code=400, detail="meta.threadId is required")
-    job_id = str(uuid.uuid4())
-    JOBS[job_id] = {"status": "queued", "result": None, "started_at": time.time()}
-
-    # Resolve Gmail token and fetch thread (stubbed)
-    access_token = gmail.resolve_oauth_token(body.projectId)
-    thread_text = gmail.fetch_thread_text(body.meta["threadId"], access_token)
-
-    # Generate draft via adapter
-    controls = dict(body.meta or {})
-    draft = openai_email_reply.draft_reply(thread_text=thread_text, controls=controls)
-
-    result_payload = {
+def _build_result_payload(project_id: str, thread_id: str, meta: dict, user_input: str, draft: dict) -> dict:
+    return {
         "text": draft.get("text", ""),
         "meta": {
-            "threadId": body.meta["threadId"],
-            "tone": body.meta.get("tone", "friendly"),
+            "threadId": thread_id,
+            "tone": meta.get("tone", "friendly"),
             "subject": draft.get("meta", {}).get("subject"),
             "participants": draft.get("meta", {}).get("participants"),
             "token_usage": draft.get("meta", {}).get("token_usage"),
+            "cache": draft.get("meta", {}).get("cache"),
         },
-        "projectId": body.projectId,
-        "input": body.input,
+        "projectId": project_id,
+        "input": user_input,
     }
 
-    # Best-effort persistence
+def _persist_draft(job_id: str, project_id: str, thread_id: str, meta: dict, draft: dict, result_payload: dict):
+    """Best-effort persistence: queue the message row and store the finished job in Redis."""
     message_payload = {
         "role": "assistant",
         "content": draft.get("text", ""),
         "meta": {
-            "projectId": body.projectId,
-            "threadId": body.meta["threadId"],
-            "tone": body.meta.get("tone", "friendly"),
-            "length": body.meta.get("length", 70),
-            "bullets": body.meta.get("bullets", False),
+            "projectId": project_id,
+            "threadId": thread_id,
+            "tone": meta.get("tone", "friendly"),
+            "length": meta.get("length", 70),
+            "bullets": meta.get("bullets", False),
             "subject": draft.get("meta", {}).get("subject", "No Subject"),
         },
     }
-    persistence.persist_message_to_supabase(body.projectId, message_payload)
-    persistence.write_job_to_redis(job_id, {"status": "done", "result": result_payload})
+    persistence.enqueue_message_to_supabase(project_id, message_payload)
+    persistence.write_job_to_redis(job_id, {"status": "done", "result": result_payload}, ttl_seconds=jobs.JOB_TTL_SECONDS)
+
+def _finish_job(job_id: str, project_id: str, thread_id: str, meta: dict, draft: dict, result_payload: dict):
+    """Persist a finished draft and mark its job done; on a persistence error the job is failed."""
+    try:
+        _persist_draft(job_id, project_id, thread_id, meta, draft, result_payload)
+    except Exception as e:
+        _fail_job(job_id, e)
+        raise
+    JOBS.update(job_id, status="done", stage=None, result=result_payload, finished_at=time.time())
+
+def _fail_job(job_id: str, error: Exception):
+    print(f"❌ Agent job {job_id} failed: {error}")
+    JOBS.update(job_id, status="error", error=str(error), finished_at=time.time())
+    persistence.write_job_to_redis(job_id, {"status": "error", "result": None, "error": str(error)}, ttl_seconds=jobs.JOB_TTL_SECONDS)
+
+def _draft_thread(job_id: str, project_id: str, thread_id: str, meta: dict, user_input: str, access_token: str | None):
+    """Fetch one thread, draft a reply, persist it and record the outcome on the job."""
+    try:
+        JOBS.update(job_id, status="running", stage="fetch")
+        # Served from the thread cache (in-process LRU, then Redis) when the thread was seen recently
+        thread = gmail_client.get_parsed_thread(project_id, thread_id, access_token=access_token)
+        if thread.error:
+            # No token, missing thread, quota...: nothing to draft from
+            _fail_job(job_id, RuntimeError(thread.error))
+            return
+        # Strip quoted history/signatures and keep the newest messages within THREAD_TOKEN_BUDGET
+        thread = compaction.compact_thread(thread)
 
-    JOBS[job_id] = {"status": "done", "result": result_payload, "started_at": time.time()}
-    return {"jobId": job_id}
+        # Generate draft via adapter (structured thread also fills subject/participants meta)
+        JOBS.update(job_id, stage="draft")
+        controls = {**meta, "threadId": thread_id}
+        draft = openai_email_reply.draft_reply(thread_text=thread, controls=controls)
+        result_payload = _build_result_payload(project_id, thread_id, meta, user_input, draft)
+
+        JOBS.update(job_id, stage="persist")
+        _persist_draft(job_id, project_id, thread_id, meta, draft, result_payload)
+
+        JOBS.update(job_id, status="done", stage=None, result=result_payload, finished_at=time.time())
+    except Exception as e:
+        _fail_job(job_id, e)
+
+def _run_agent_job(job_id: str, body: RunBody):
+    """Worker-side pipeline: resolve token -> fetch thread -> draft reply -> persist."""
+    try:
+        JOBS.update(job_id, status="running", stage="fetch")
+        access_token = gmail.resolve_oauth_token(body.projectId)
+    except Exception as e:
+        _fail_job(job_id, e)
+        return
+    _draft_thread(job_id, body.projectId, body.meta["threadId"], dict(body.meta), body.input, access_token)
+
+def _run_batch_job(batch_id: str, body: BatchRunBody, job_ids: list[str]):
+    """Resolve the OAuth token once, then draft every thread with bounded concurrency."""
+    BATCHES.update(batch_id, status="running")
+    meta = dict(body.meta or {})
+    try:
+        access_token = gmail.resolve_oauth_token(body.projectId)
+    except Exception as e:
+        print(f"❌ Batch {batch_id} token lookup failed: {e}")
+        for job_id in job_ids:
+            JOBS.update(job_id, status="error", error=str(e), finished_at=time.time())
+        BATCHES.update(batch_id, status="error", error=str(e), finished_at=time.time())
+        return
+
+    def draft_item(item):
+        # Batch drafts yield Gmail quota to interactive requests for the same project
+        with gmail_quota.background():
+            _draft_thread(item[0], body.projectId, item[1], meta, body.input, access_token)
+
+    concurrency = min(body.concurrency or jobs.BATCH_CONCURRENCY, jobs.BATCH_MAX_CONCURRENCY)
+    jobs.run_bounded(draft_item, list(zip(job_ids, body.threadIds)), concurrency)
+    failed = sum(1 for job_id in job_ids if (JOBS.get(job_id) or {}).get("status") != "done")
+    if not failed:
+        BATCHES.update(batch_id, status="done", finished_at=time.time())
+        return
+    # "error" when nothing was drafted, "partial" when only some drafts failed
+    status = "error" if failed == len(job_ids) else "partial"
+    print(f"⚠️ Batch {batch_id}: {failed}/{len(job_ids)} drafts failed")
+    BATCHES.update(batch_id, status=status, error=f"{failed} of {len(job_ids)} drafts failed", finished_at=time.time())
+
+@app.post("/agent/run")
+async def run_agent(body: RunBody):
+    """
+    Enqueue a draft job and return its id immediately.
+    Poll /jobs/{job_id} for queued -> running -> done/error.
+    """
+    if not body.meta or "threadId" not in body.meta:
+        raise HTTPException(status_code=400, detail="meta.threadId is required")
+    job_id = str(uuid.uuid4())
+    JOBS.create(job_id)
+    try:
+        jobs.submit(_run_agent_job, job_id, body)
+    except jobs.QueueFullError as e:
+        JOBS.pop(job_id)
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"jobId": job_id, "status": "queued"}
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+@app.post("/agent/run/stream")
+async def run_agent_stream(body: RunBody):
+    """
+    Draft a reply and stream it as Server-Sent Events while the model generates it.
+    Events: start {jobId}, delta {text}, done {result payload}, error {detail}.
+    The finished draft is persisted and its job stored, exactly as for /agent/run.
+    """
+    if not body.meta or "threadId" not in body.meta:
+        raise HTTPException(status_code=400, detail="meta.threadId is required")
+    job_id = str(uuid.uuid4())
+    JOBS.create(job_id, status="running")
+    thread_id = body.meta["threadId"]
+    meta = dict(body.meta)
+
+    async def events():
+        settled = False
+        yield _sse("start", {"jobId": job_id})
+        try:
+            JOBS.update(job_id, stage="fetch")
+            access_token = await gmail.resolve_oauth_token_async(body.projectId)
+            thread = await gmail_client.get_parsed_thread_async(body.projectId, thread_id, access_token=access_token)
+            if thread.error:
+                raise RuntimeError(thread.error)
+            thread = compaction.compact_thread(thread)
+
+            JOBS.update(job_id, stage="draft")
+            draft = None
+            async for event in openai_email_reply.astream_draft_reply(thread_text=thread, controls=meta):
+                if event["type"] == "delta":
+                    yield _sse("delta", {"text": event["text"]})
+                elif event["type"] == "done":
+                    draft = event
+            if draft is None:
+                raise RuntimeError("Draft stream ended without a result")
+
+            result_payload = _build_result_payload(body.projectId, thread_id, meta, body.input, draft)
+            JOBS.update(job_id, stage="persist")
+            # From here the worker thread settles the job, even if the client goes away meanwhile
+            settled = True
+            await asyncio.to_thread(_finish_job, job_id, body.projectId, thread_id, meta, draft, result_payload)
+            yield _sse("done", result_payload)
+        except Exception as e:
+            if not settled:
+                settled = True
+                await asyncio.to_thread(_fail_job, job_id, e)
+            yield _sse("error", {"detail": str(e)})
+        finally:
+            if not settled:
+                # Client went away mid-stream (GeneratorExit / cancellation): nothing was saved,
+                # so settle the job now instead of leaving it "running" until its TTL expires
+                error = RuntimeError("Client disconnected before the draft was finished")
+                try:
+                    jobs.submit(_fail_job, job_id, error)
+                except jobs.QueueFullError:
+                    _fail_job(job_id, error)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/agent/run/batch")
+async def run_agent_batch(body: BatchRunBody):
+    """
+    Enqueue drafts for many threads with shared controls.
+    Each thread gets its own job (pollable via /jobs/{job_id}); progress via /agent/batch/{batch_id}.
+    The batch finishes as done, partial (some drafts failed) or error (none succeeded).
+    """
+    thread_ids = list(dict.fromkeys(t for t in body.threadIds if t))
+    if not thread_ids:
+        raise HTTPException(status_code=400, detail="threadIds must not be empty")
+    if len(thread_ids) > jobs.BATCH_MAX_THREADS:
+        raise HTTPException(status_code=400, detail=f"At most {jobs.BATCH_MAX_THREADS} threads per batch")
+    body.threadIds = thread_ids
+
+    batch_id = f"batch_{uuid.uuid4()}"
+    job_ids = [str(uuid.uuid4()) for _ in thread_ids]
+    for job_id in job_ids:
+        JOBS.create(job_id)
+    BATCHES.create(batch_id)
+    BATCHES.update(batch_id, status="queued", result={"projectId": body.projectId, "jobIds": job_ids, "threadIds": thread_ids})
+    try:
+        jobs.submit(_run_batch_job, batch_id, body, job_ids)
+    except jobs.QueueFullError as e:
+        for job_id in job_ids:
+            JOBS.pop(job_id)
+        BATCHES.pop(batch_id)
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"batchId": batch_id, "jobIds": job_ids, "status": "queued"}
+
+@app.get("/agent/batch/{batch_id}")
+async def get_batch(batch_id: str):
+    batch = BATCHES.get(batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    info = batch["result"]
+    local = {job_id: JOBS.get(job_id) for job_id in info["jobIds"]}
+    # Fetch any jobs evicted locally from Redis in a single MGET
+    missing = [job_id for job_id, job in local.items() if not job]
+    remote = await persistence.read_jobs_from_redis_async(missing) if missing else {}
+    results = []
+    for job_id, thread_id in zip(info["jobIds"], info["threadIds"]):
+        job = local[job_id] or remote.get(job_id) or {"status": "unknown", "result": None}
+        item = {"jobId": job_id, "threadId": thread_id, "status": job["status"], "result": job.get("result")}
+        if job.get("stage"):
+            item["stage"] = job["stage"]
+        if job.get("error"):
+            item["error"] = job["error"]
+        results.append(item)
+    completed = sum(1 for r in results if r["status"] == "done")
+    failed = sum(1 for r in results if r["status"] == "error")
+    response = {
+        "batchId": batch_id,
+        "status": batch["status"],
+        "total": len(results),
+        "completed": completed,
+        "failed": failed,
+        "results": results,
+    }
+    if batch.get("error"):
+        response["error"] = batch["error"]
+    return response
 
 @app.get("/jobs/{job_id}")
-def get_job(job_id: str):
+async def get_job(job_id: str):
     data = JOBS.get(job_id)
     if not data:
-        raise HTTPException(status_code=404, detail="Job not found")
+        # Read through to Redis (evicted locally, or finished on another instance)
+        data = await persistence.read_job_from_redis_async(job_id)
+        if not data:
+            raise HTTPException(status_code=404, detail="Job not found")
+        JOBS.put(job_id, data)
     return data
 
 @app.get("/dashboard/stats")
-def get_dashboard_stats(projectId: str = Query(default="default")):
+async def get_dashboard_stats(projectId: str = Query(default="default")):
     """
     Get dashboard statistics (replies count, success rate, time saved, etc.)
     """
     try:
-        stats = persistence.get_dashboard_stats(projectId)
+        stats = await persistence.get_dashboard_stats_async(projectId)
         return stats
     except Exception as e:
         print(f"Error fetching dashboard stats: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch stats: {str(e)}")
 
+def _parse_draft_cursor(before: str | None) -> tuple[str, str] | None:
+    """Parse a `<created_at>,<id>` keyset cursor (as returned in nextCursor)."""
+    if not before:
+        return None
+    created_at, _, draft_id = before.rpartition(",")
+    try:
+        uuid.UUID(draft_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor; expected before=<created_at>,<id>")
+    if not created_at:
+        raise HTTPException(status_code=400, detail="Invalid cursor; expected before=<created_at>,<id>")
+    # An unencoded "+02:00" offset arrives as " 02:00"
+    return created_at.replace(" ", "+"), draft_id
+
 @app.get("/dashboard/recent-drafts")
-def get_recent_drafts(projectId: str = Query(default="default"), limit: int = Query(default=10)):
+async def get_recent_drafts(
+    projectId: str = Query(default="default"),
+    limit: int = Query(default=10),
+    before: str | None = Query(default=None),
+):
     """
-    Get recent drafts for the dashboard
+    Get recent drafts for the dashboard, newest first.
+    Pass the returned nextCursor as `before` to fetch the next page (null on the last page).
     """
+    cursor = _parse_draft_cursor(before)
+    limit = max(1, min(limit, 100))
     try:
-        drafts = persistence.get_recent_drafts(projectId, limit)
-        return {"items": drafts}
+        # One extra row tells us whether another page exists
+        drafts = await persistence.get_recent_drafts_async(projectId, limit + 1, before=cursor)
+        next_cursor = None
+        if len(drafts) > limit:
+            drafts = drafts[:limit]
+            next_cursor = f"{drafts[-1]['createdAt']},{drafts[-1]['id']}"
+        return {"items": drafts, "nextCursor": next_cursor}
     except Exception as e:
         print(f"Error fetching recent drafts: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch drafts: {str(e)}")
 
 @app.get("/drafts/{draft_id}")
-def get_draft_by_id(draft_id: str):
+async def get_draft_by_id(draft_id: str):
     """
     Get a specific draft by ID
     """
     try:
-        draft = persistence.get_draft_by_id(draft_id)
+        draft = await persistence.get_draft_by_id_async(draft_id)
         if not draft:
             raise HTTPException(status_code=404, detail="Draft not found")
         return draft
@@ -154,45 +412,81 @@ def get_draft_by_id(draft_id: str):
         raise HTTPException(status_code=500, detail=f"Failed to fetch draft: {str(e)}")
 
 @app.get("/messages")
-def get_messages(projectId: str = Query(...)):
+async def get_messages(
+    projectId: str = Query(...),
+    limit: int = Query(default=50),
+    before: str | None = Query(default=None),
+):
     # Legacy endpoint - redirect to recent drafts
-    return get_recent_drafts(projectId, 50)
+    return await get_recent_drafts(projectId, limit, before)
 
 @app.get("/threads")
-def get_threads(projectId: str = Query(default="default"), maxResults: int = Query(default=20)):
+async def get_threads(
+    projectId: str = Query(default="default"),
+    maxResults: int = Query(default=20),
+    prefetch: int | None = Query(default=None),
+):
     """
     Fetch Gmail threads for a project.
     Returns list of threads with id, subject, snippet, date.
+    The first `prefetch` threads (default THREAD_PREFETCH_COUNT, 0 disables) are fetched into
+    the thread cache in the background, within the project's prefetch budget.
     """
     try:
-        threads = gmail.list_threads(projectId, max_results=maxResults)
+        threads = await gmail_client.list_threads_async(projectId, max_results=maxResults)
+        gmail_client.prefetch_threads(projectId, [t["id"] for t in threads], count=prefetch)
         return {"items": threads}
     except Exception as e:
         print(f"Error fetching threads: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch threads: {str(e)}")
 
+@app.get("/threads/search")
+async def search_threads(projectId: str = Query(default="default"), q: str = Query(...), limit: int = Query(default=20)):
+    """
+    Full-text search over threads (subject, participants, snippet, body).
+    Answered from the local thread index; when it has fewer than `limit` matches, Gmail is queried
+    (with a short timeout) for threads not indexed yet and its results are merged in.
+    """
+    if not q.strip():
+        return {"items": [], "source": "index"}
+    try:
+        return await gmail_client.search_threads_async(projectId, q, limit=max(1, min(limit, 100)))
+    except Exception as e:
+        print(f"Error searching threads: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to search threads: {str(e)}")
+
+
+@app.get("/gmail/quota")
+async def get_gmail_quota():
+    """Gmail quota scheduler state per project (available units, queued calls, backoff)."""
+    return gmail_quota.snapshot()
 
 @app.post("/gmail/send")
-def send_email(body: SendEmailBody):
+async def send_email(body: SendEmailBody):
     """
     Send an email reply to a Gmail thread.
     """
     try:
         # Resolve OAuth token
-        access_token = gmail.resolve_oauth_token(body.projectId)
+        access_token = await gmail.resolve_oauth_token_async(body.projectId)
         if not access_token:
             raise HTTPException(
                 status_code=401,
                 detail="Gmail not connected or token expired. Please reconnect Gmail."
             )
         
-        # Send email
-        result = gmail.send_reply(
+        # Send email (reply headers captured when the thread was fetched skip a threads.get)
+        reply_meta = await asyncio.to_thread(gmail.cached_reply_meta, body.projectId, body.threadId)
+        result = await gmail.send_reply_async(
             thread_id=body.threadId,
             draft_text=body.draftText,
             access_token=access_token,
-            subject=body.subject
+            subject=body.subject,
+            reply_meta=reply_meta,
+            project_id=body.projectId,
         )
+        # The thread now ends with our reply; drop the cached copy so the next draft sees it
+        await gmail_client.invalidate_thread_async(body.projectId, body.threadId)
         
         return result
         
@@ -201,6 +495,7 @@ def send_email(body: SendEmailBody):
     except RuntimeError as e:
         error_msg = str(e)
         if "token expired" in error_msg.lower() or "unauthorized" in error_msg.lower():
+            gmail.invalidate_oauth_token(body.projectId)
             raise HTTPException(status_code=401, detail=error_msg)
         raise HTTPException(status_code=500, detail=error_msg)
     except Exception as e:
@@ -3,25 +3,23 @@ OAuth authentication routes for Gmail integration.
 """
 
 from fastapi import APIRouter, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import RedirectResponse
 import os
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 from datetime import datetime, timedelta, timezone
 
-# Try Google OAuth imports
 try:
-	from google_auth_oauthlib.flow import Flow
-	from google.oauth2.credentials import Credentials
-	GOOGLE_AUTH_AVAILABLE = True
-except ImportError:
-	GOOGLE_AUTH_AVAILABLE = False
+	from api.services import optional_deps  # type: ignore
+except Exception:
+	from services import optional_deps  # type: ignore
 
-# Try Supabase import
-try:
-	from supabase import create_client, Client
-	SUPABASE_AVAILABLE = True
-except ImportError:
-	SUPABASE_AVAILABLE = False
+if TYPE_CHECKING:
+	from supabase import Client
+
+# Google OAuth / Supabase SDKs are imported inside the handlers that use them
+GOOGLE_AUTH_AVAILABLE = optional_deps.available("google_auth_oauthlib", "google.oauth2")
+SUPABASE_AVAILABLE = optional_deps.available("supabase")
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -33,7 +31,7 @@ SCOPES = [
 ]
 
 
-def get_supabase_client() -> Optional[Client]:
+def get_supabase_client() -> Optional["Client"]:
 	"""Get Supabase client if available."""
 	if not SUPABASE_AVAILABLE:
 		return None
@@ -48,6 +46,7 @@ def get_supabase_client() -> Optional[Client]:
 		return None
 	
 	# Create client and set schema if supported
+	from supabase import create_client
 	client = create_client(url, key)
 	try:
 		client.postgrest.schema(schema)  # type: ignore[attr-defined]
@@ -89,6 +88,7 @@ def google_oauth_redirect(
 		}
 	}
 	
+	from google_auth_oauthlib.flow import Flow
 	flow = Flow.from_client_config(
 		client_config,
 		scopes=SCOPES,
@@ -144,15 +144,16 @@ async def oauth_callback(
 		}
 	}
 	
+	from google_auth_oauthlib.flow import Flow
 	flow = Flow.from_client_config(
 		client_config,
 		scopes=SCOPES,
 		redirect_uri=redirect_uri
 	)
 	
-	# Exchange code for tokens
+	# Exchange code for tokens (blocking HTTP call: keep it off the event loop)
 	try:
-		flow.fetch_token(code=code)
+		await run_in_threadpool(flow.fetch_token, code=code)
 		credentials = flow.credentials
 		
 		# Calculate expiry timestamp
@@ -175,7 +176,13 @@ async def oauth_callback(
 				"scopes": ",".join(credentials.scopes) if credentials.scopes else "",
 			}
 			print("💾 Storing token via REST to emailreply.oauth_tokens ...")
-			_ = supabase_rest.upsert_oauth_token(token_record)
+			_ = await run_in_threadpool(supabase_rest.upsert_oauth_token, token_record)
+			# Drop any cached (now stale) token so the next Gmail call picks up the new one
+			try:
+				from api.services import gmail  # type: ignore
+			except Exception:
+				from services import gmail  # type: ignore
+			gmail.invalidate_oauth_token(project_id)
 			print(f"✅ OAuth tokens stored in Supabase for project: {project_id}")
 		except Exception as e:
 			print(f"⚠️ Failed to store tokens in Supabase via REST: {e}")
@@ -202,7 +209,7 @@ async def oauth_callback(
 
 
 @router.get("/status")
-def auth_status(project_id: str = Query(default="default")):
+async def auth_status(project_id: str = Query(default="default")):
 	"""
 	Check if user has connected Gmail for a project.
 	"""
@@ -212,7 +219,7 @@ def auth_status(project_id: str = Query(default="default")):
 			from api.services import supabase_rest  # type: ignore
 		except Exception:
 			from services import supabase_rest  # type: ignore
-		token = supabase_rest.select_oauth_token(project_id=project_id, provider="google")
+		token = await supabase_rest.select_oauth_token_async(project_id=project_id, provider="google")
 		if token:
 			# Check if token is expired
 			if token.get("expires_at"):
@@ -0,0 +1,46 @@
+"""
+Shared httpx.AsyncClient pools for the async service layer (Supabase, Upstash).
+
+An AsyncClient is bound to the event loop it first runs on, so clients are kept per
+(event loop, name). In production there is one loop per worker, i.e. one pool per upstream.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict
+import asyncio
+import os
+import weakref
+
+import httpx
+
+
+_TIMEOUT_SECONDS = float(os.getenv("ASYNC_HTTP_TIMEOUT_SECONDS", "10"))
+_CONNECT_TIMEOUT_SECONDS = float(os.getenv("ASYNC_HTTP_CONNECT_TIMEOUT_SECONDS", "5"))
+
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, httpx.AsyncClient]]" = weakref.WeakKeyDictionary()
+
+
+def get_client(name: str, pool_size: int = 20) -> httpx.AsyncClient:
+	"""Return the pooled AsyncClient for `name` on the running event loop (created on first use)."""
+	loop = asyncio.get_running_loop()
+	clients = _clients.setdefault(loop, {})
+	client = clients.get(name)
+	if client is None or client.is_closed:
+		client = clients[name] = httpx.AsyncClient(
+			limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+			timeout=httpx.Timeout(_TIMEOUT_SECONDS, connect=_CONNECT_TIMEOUT_SECONDS),
+		)
+	return client
+
+
+async def aclose() -> None:
+	"""Close the clients of the running event loop (call on shutdown)."""
+	clients = _clients.pop(asyncio.get_running_loop(), {})
+	for client in clients.values():
+		await client.aclose()
+
+
+def raise_for_status(resp: Any) -> None:
+	if resp.status_code >= 400:
+		raise httpx.HTTPStatusError(f"{resp.status_code}: {resp.text}", request=resp.request, response=resp)
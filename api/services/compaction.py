@@ -0,0 +1,144 @@
+"""
+Token-budgeted thread compaction (runs between the Gmail fetch and the drafting adapter).
+
+Each message body has its quoted history ("On ... wrote:", "> " lines, forwarded /
+"Original Message" blocks) and signature removed, paragraphs repeated later in the
+thread are dropped from the older copy, and then the newest messages are kept until
+THREAD_TOKEN_BUDGET is reached. Before/after token estimates are reported so the adapter
+can put them in meta.token_usage.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, List
+import hashlib
+import os
+import re
+
+
+_COMPACTION_ENABLED = os.getenv("THREAD_COMPACTION_ENABLED", "1") not in ("0", "false", "False")
+_TOKEN_BUDGET = int(os.getenv("THREAD_TOKEN_BUDGET", "3000"))
+
+# Lines that start quoted history; everything from here to the end of the body is dropped
+_QUOTE_HEADER = re.compile(
+	r"^(On .{0,200} wrote:\s*$"
+	r"|-{2,}\s*Original Message\s*-{2,}"
+	r"|-{2,}\s*Forwarded message\s*-{2,}"
+	r"|From: .+\n(Sent|Date): )",
+	re.MULTILINE | re.IGNORECASE,
+)
+# Lines that start a signature block
+_SIGNATURE = re.compile(
+	r"^(-- ?$|Sent from my \w+|Get Outlook for \w+)",
+	re.MULTILINE | re.IGNORECASE,
+)
+
+
+def estimate_tokens(text: str) -> int:
+	"""Rough token estimate (~4 characters per token for English text)."""
+	return (len(text) + 3) // 4
+
+
+class CompactedThread:
+	"""Prompt-ready thread: same to_text/subject/participants surface as mime.ParsedThread."""
+
+	__slots__ = ("id", "subject", "participants", "text", "stats")
+
+	def __init__(self, id: str, subject: str | None, participants: List[str], text: str, stats: Dict[str, int]) -> None:
+		self.id = id
+		self.subject = subject
+		self.participants = participants
+		self.text = text
+		self.stats = stats
+
+	def to_text(self) -> str:
+		return self.text
+
+
+def strip_quoted(body: str) -> str:
+	"""Remove quoted reply history and "> " lines from a message body."""
+	match = _QUOTE_HEADER.search(body)
+	if match:
+		body = body[:match.start()]
+	return "\n".join(line for line in body.splitlines() if not line.lstrip().startswith(">"))
+
+
+def strip_signature(body: str) -> str:
+	match = _SIGNATURE.search(body)
+	return body[:match.start()] if match else body
+
+
+def _paragraph_key(paragraph: str) -> str:
+	normalized = re.sub(r"\s+", " ", paragraph).strip().lower()
+	return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def _clean_bodies(messages: List[Any]) -> List[str]:
+	# Newest first, so a repeated paragraph survives in its newest copy: the budget keeps the
+	# newest messages, and the message being replied to must never lose its own text
+	seen: set = set()
+	bodies = []
+	for message in reversed(messages):
+		paragraphs = []
+		for paragraph in re.split(r"\n\s*\n", strip_signature(strip_quoted(message.body))):
+			if not paragraph.strip():
+				continue
+			key = _paragraph_key(paragraph)
+			if key in seen:
+				continue
+			seen.add(key)
+			paragraphs.append(paragraph.strip())
+		bodies.append("\n\n".join(paragraphs))
+	bodies.reverse()
+	return bodies
+
+
+def _render(message: Any, body: str) -> str:
+	return f"From: {message.sender}\nDate: {message.date}\n\n{body or '[No new content]'}"
+
+
+def compact_thread(thread: Any, budget_tokens: int | None = None) -> Any:
+	"""
+	Compact a mime.ParsedThread into a CompactedThread that fits the token budget.
+	Plain-text input, failed fetches and empty threads are returned unchanged, as is
+	everything when THREAD_COMPACTION_ENABLED=0.
+	"""
+	if not _COMPACTION_ENABLED or isinstance(thread, str) or getattr(thread, "error", None) or not thread.messages:
+		return thread
+	budget = budget_tokens if budget_tokens is not None else _TOKEN_BUDGET
+
+	before = estimate_tokens(thread.to_text())
+	header = f"Subject: {thread.subject}"
+	blocks = _select_newest(thread.messages, _clean_bodies(thread.messages), budget - estimate_tokens(header))
+	omitted = len(thread.messages) - len(blocks)
+	parts = [header]
+	if omitted:
+		parts.append(f"[{omitted} earlier message(s) omitted]")
+	parts.extend(blocks)
+	text = "\n\n---\n\n".join(parts)
+
+	stats = {
+		"thread_tokens_before": before,
+		"thread_tokens_after": estimate_tokens(text),
+		"messages_total": len(thread.messages),
+		"messages_kept": len(blocks),
+	}
+	return CompactedThread(thread.id, thread.subject, thread.participants, text, stats)
+
+
+def _select_newest(messages: List[Any], bodies: List[str], budget: int) -> List[str]:
+	"""Walk from the newest message back, keeping whole messages while they fit the budget."""
+	kept: List[str] = []
+	used = 0
+	for message, body in zip(reversed(messages), reversed(bodies)):
+		block = _render(message, body)
+		cost = estimate_tokens(block)
+		if used + cost > budget:
+			if not kept:
+				# Always keep (a truncated) newest message so there is something to reply to
+				kept.append(block[:max(0, budget) * 4].rstrip() + "\n[truncated]")
+			break
+		kept.append(block)
+		used += cost
+	kept.reverse()
+	return kept
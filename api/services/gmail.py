@@ -4,24 +4,52 @@ Gmail service for fetching threads and sending messages.
 
 from __future__ import annotations
 
-from typing import Dict, Any, List, Optional
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+import asyncio
+import functools
 import os
+import threading
+import time
 from datetime import datetime, timezone
 
-# Try imports
 try:
-	from google.oauth2.credentials import Credentials
-	from googleapiclient.discovery import build
-	from googleapiclient.errors import HttpError
-	GMAIL_API_AVAILABLE = True
-except ImportError:
-	GMAIL_API_AVAILABLE = False
+	from api.services import gmail_quota, gmail_sync, mime, optional_deps  # type: ignore
+	from api.services.mime import ParsedThread  # type: ignore
+except Exception:
+	from services import gmail_quota, gmail_sync, mime, optional_deps  # type: ignore
+	from services.mime import ParsedThread  # type: ignore
+
+if TYPE_CHECKING:
+	from supabase import Client
+
+# The Google API client and Supabase SDKs are slow to import, so they are loaded on first
+# use (see _load_gmail_sdk / get_supabase_client) rather than on the cold-start path.
+GMAIL_API_AVAILABLE = optional_deps.available("googleapiclient", "google.oauth2")
+SUPABASE_AVAILABLE = optional_deps.available("supabase")
+Credentials: Any = None
+build: Any = None
+HttpError: Any = None
+
 
+def _load_gmail_sdk() -> None:
+	global Credentials, build, HttpError
+	if Credentials is None:
+		from google.oauth2.credentials import Credentials
+	if build is None:
+		from googleapiclient.discovery import build
+	if HttpError is None:
+		from googleapiclient.errors import HttpError
+
+# Redis tier for reply metadata (best effort)
 try:
-	from supabase import create_client, Client
-	SUPABASE_AVAILABLE = True
-except ImportError:
-	SUPABASE_AVAILABLE = False
+	from api.services import persistence  # type: ignore
+except Exception:
+	try:
+		from services import persistence  # type: ignore
+	except Exception:
+		persistence = None  # type: ignore
 
 # Fallback REST helper (bypass client schema issues). Try multiple import styles.
 _SUPA_REST_AVAILABLE = False
@@ -36,7 +64,7 @@ except Exception:
 		_SUPA_REST_AVAILABLE = False
 
 
-def get_supabase_client() -> Optional[Client]:
+def get_supabase_client() -> Optional["Client"]:
 	"""Get Supabase client if available and configured for emailreply schema."""
 	if not SUPABASE_AVAILABLE:
 		return None
@@ -53,6 +81,7 @@ def get_supabase_client() -> Optional[Client]:
 	print(f"✅ Supabase client created with schema: {schema}")
 	
 	# Create client and set schema if supported
+	from supabase import create_client
 	client = create_client(url, key)
 	try:
 		# Some supabase-py versions expose postgrest.schema to set the search path
@@ -63,9 +92,119 @@ def get_supabase_client() -> Optional[Client]:
 	return client
 
 
+# Gmail API service cache.
+# build() parses the discovery document and creates an HTTP transport; both are reused per access token.
+# httplib2 transports are not thread-safe, so each worker thread keeps its own services; the job,
+# batch and Gmail IO pools are long-lived, so those per-thread caches stay warm across requests.
+_GMAIL_SERVICE_TTL_SECONDS = float(os.getenv("GMAIL_SERVICE_TTL_SECONDS", "3300"))
+_GMAIL_SERVICE_CACHE_SIZE = int(os.getenv("GMAIL_SERVICE_CACHE_SIZE", "32"))
+_service_local = threading.local()
+_token_expiry: Dict[str, float] = {}
+_token_expiry_lock = threading.Lock()
+
+
+def _remember_token_expiry(access_token: str, expires_at: float) -> None:
+	"""Record when an access token expires so cached services for it are evicted in time."""
+	with _token_expiry_lock:
+		if len(_token_expiry) >= _GMAIL_SERVICE_CACHE_SIZE * 4:
+			now = time.time()
+			for tok in [t for t, exp in _token_expiry.items() if exp <= now]:
+				del _token_expiry[tok]
+		_token_expiry[access_token] = expires_at
+
+
+def _invalidate_gmail_service(access_token: str) -> None:
+	"""Mark a token's cached services as expired in every thread (e.g. after a 401)."""
+	_remember_token_expiry(access_token, 0.0)
+
+
+def _get_gmail_service(access_token: str) -> Any:
+	"""
+	Return a Gmail API service for this access token, reusing the calling thread's cached instance.
+	Entries expire after GMAIL_SERVICE_TTL_SECONDS or when the token's known expiry passes.
+	"""
+	cache: Dict[str, Tuple[Any, float]] | None = getattr(_service_local, "services", None)
+	if cache is None:
+		cache = _service_local.services = {}
+
+	now = time.time()
+	with _token_expiry_lock:
+		token_expiry = _token_expiry.get(access_token)
+
+	entry = cache.get(access_token)
+	if entry is not None:
+		service, expires_at = entry
+		if now < expires_at and (token_expiry is None or now < token_expiry):
+			return service
+		del cache[access_token]
+
+	# Drop expired entries, then the oldest if still over capacity
+	for tok in [t for t, (_, exp) in cache.items() if exp <= now]:
+		del cache[tok]
+	while len(cache) >= _GMAIL_SERVICE_CACHE_SIZE:
+		del cache[next(iter(cache))]
+
+	_load_gmail_sdk()
+	credentials = Credentials(token=access_token)
+	service = build('gmail', 'v1', credentials=credentials, static_discovery=True, cache_discovery=False)
+	expires_at = now + _GMAIL_SERVICE_TTL_SECONDS
+	if token_expiry is not None:
+		expires_at = min(expires_at, token_expiry)
+	cache[access_token] = (service, expires_at)
+	return service
+
+
+# Per-project OAuth token cache. Entries live until expires_at minus a safety margin
+# (or OAUTH_TOKEN_CACHE_TTL_SECONDS when the row has no expiry).
+_OAUTH_TOKEN_CACHE_MARGIN_SECONDS = float(os.getenv("OAUTH_TOKEN_CACHE_MARGIN_SECONDS", "120"))
+_OAUTH_TOKEN_CACHE_TTL_SECONDS = float(os.getenv("OAUTH_TOKEN_CACHE_TTL_SECONDS", "300"))
+_oauth_token_cache: Dict[str, Tuple[str, float]] = {}
+_oauth_token_cache_lock = threading.Lock()
+# In-flight Supabase lookups, shared by sync and async callers; entries are removed as soon
+# as the lookup finishes, so this only ever holds projects being looked up right now
+_oauth_token_lookups: Dict[str, "Future[str | None]"] = {}
+
+
+def _cached_oauth_token(project_id: str) -> str | None:
+	with _oauth_token_cache_lock:
+		entry = _oauth_token_cache.get(project_id)
+		if entry is None:
+			return None
+		token, valid_until = entry
+		if time.time() >= valid_until:
+			del _oauth_token_cache[project_id]
+			return None
+		return token
+
+
+def invalidate_oauth_token(project_id: str) -> None:
+	"""Drop the cached token for a project (call after storing a new token)."""
+	with _oauth_token_cache_lock:
+		_oauth_token_cache.pop(project_id, None)
+
+
+def _join_oauth_token_lookup(project_id: str) -> Tuple["Future[str | None]", bool]:
+	"""The project's in-flight token lookup, and whether the caller started it (and must run it)."""
+	with _oauth_token_cache_lock:
+		future = _oauth_token_lookups.get(project_id)
+		if future is not None:
+			return future, False
+		future = _oauth_token_lookups[project_id] = Future()
+		return future, True
+
+
+def _finish_oauth_token_lookup(project_id: str, future: "Future[str | None]", token: str | None) -> str | None:
+	with _oauth_token_cache_lock:
+		_oauth_token_lookups.pop(project_id, None)
+	future.set_result(token)
+	return token
+
+
 def resolve_oauth_token(project_id: str) -> str | None:
 	"""
 	Return an access token for Gmail API from Supabase.
+	Tokens are cached per project until shortly before they expire, and concurrent
+	misses for the same project share a single Supabase lookup.
 	
 	Args:
 		project_id: The project identifier
@@ -73,33 +212,106 @@ def resolve_oauth_token(project_id: str) -> str | None:
 	Returns:
 		Access token string or None if not found
 	"""
-	print(f"🔑 resolve_oauth_token called for project: {project_id}")
+	token = _cached_oauth_token(project_id)
+	if token:
+		return token
+
+	future, owner = _join_oauth_token_lookup(project_id)
+	if not owner:
+		return future.result()
+	token = None
+	try:
+		# A lookup that finished just before we joined may have filled the cache
+		token = _cached_oauth_token(project_id)
+		if not token:
+			token, expires_at = _lookup_oauth_token(project_id)
+			_cache_oauth_token(project_id, token, expires_at)
+	finally:
+		_finish_oauth_token_lookup(project_id, future, token)
+	return token
+
+
+async def resolve_oauth_token_async(project_id: str) -> str | None:
+	"""
+	Async resolve_oauth_token: cache hit first, then a native async Supabase REST lookup.
+	Falls back to the sync lookup (off the event loop) when the REST path is unavailable.
+	"""
+	token = _cached_oauth_token(project_id)
+	if token:
+		return token
+
+	future, owner = _join_oauth_token_lookup(project_id)
+	if not owner:
+		return await asyncio.wrap_future(future)
+	token = None
+	try:
+		token = _cached_oauth_token(project_id)
+		if token:
+			return token
+		expires_at = None
+		looked_up = False
+		if _SUPA_REST_AVAILABLE:
+			print(f"🔑 Looking up OAuth token for project: {project_id}")
+			try:
+				row = await supabase_rest.select_oauth_token_async(project_id=project_id, provider="google")
+				token, expires_at = _token_from_row(project_id, row)
+				looked_up = True
+			except Exception as e:
+				print(f"❌ REST token query failed: {e}")
+		if not looked_up:
+			token, expires_at = await asyncio.to_thread(_lookup_oauth_token, project_id)
+		_cache_oauth_token(project_id, token, expires_at)
+		return token
+	finally:
+		_finish_oauth_token_lookup(project_id, future, token)
+
+
+def _cache_oauth_token(project_id: str, token: str | None, expires_at: float | None) -> None:
+	if not token:
+		return
+	now = time.time()
+	if expires_at is not None:
+		valid_until = expires_at - _OAUTH_TOKEN_CACHE_MARGIN_SECONDS
+	else:
+		valid_until = now + _OAUTH_TOKEN_CACHE_TTL_SECONDS
+	if valid_until > now:
+		with _oauth_token_cache_lock:
+			_oauth_token_cache[project_id] = (token, valid_until)
+
+
+def _token_from_row(project_id: str, token: Dict[str, Any] | None) -> Tuple[str | None, float | None]:
+	"""(access_token, expires_at epoch or None) for an oauth_tokens row; (None, None) if missing or expired."""
+	if not token:
+		print(f"❌ No token found for project {project_id}")
+		return None, None
+
+	# Check if expired
+	expires_ts = None
+	if token.get("expires_at"):
+		expires_at = datetime.fromisoformat(token["expires_at"])
+		# Normalize to timezone-aware UTC
+		if expires_at.tzinfo is None:
+			expires_at = expires_at.replace(tzinfo=timezone.utc)
+		now = datetime.now(timezone.utc)
+		if now >= expires_at:
+			print(f"❌ Token expired for project {project_id} (expired {expires_at})")
+			return None, None
+		print(f"✅ Token valid ({(expires_at - now).total_seconds() / 3600:.1f} hours remaining)")
+		expires_ts = expires_at.timestamp()
+		if token.get("access_token"):
+			_remember_token_expiry(token["access_token"], expires_ts)
+
+	return token.get("access_token"), expires_ts
+
+
+def _lookup_oauth_token(project_id: str) -> Tuple[str | None, float | None]:
+	"""Query Supabase for the project's token. Returns (access_token, expires_at epoch or None)."""
+	print(f"🔑 Looking up OAuth token for project: {project_id}")
 	
 	# Prefer REST helper to force schema-qualified access
 	if _SUPA_REST_AVAILABLE:
 		try:
-			print("🌐 Using Supabase REST to query emailreply.oauth_tokens ...")
-			token = supabase_rest.select_oauth_token(project_id=project_id, provider="google")
-			if not token:
-				print(f"❌ No token found for project {project_id}")
-				return None
-
-			print(f"✅ Token found, created: {token.get('created_at')}")
-
-			# Check if expired
-			if token.get("expires_at"):
-				expires_at = datetime.fromisoformat(token["expires_at"])
-				# Normalize to timezone-aware UTC
-				if expires_at.tzinfo is None:
-					expires_at = expires_at.replace(tzinfo=timezone.utc)
-				now = datetime.now(timezone.utc)
-				print(f"⏰ Token expires: {expires_at}, Now: {now}")
-				if now >= expires_at:
-					print(f"❌ Token expired for project {project_id}")
-					return None
-				print(f"✅ Token still valid ({(expires_at - now).total_seconds() / 3600:.1f} hours remaining)")
-
-			return token.get("access_token")
+			return _token_from_row(project_id, supabase_rest.select_oauth_token(project_id=project_id, provider="google"))
 		except Exception as e:
 			print(f"❌ REST token query failed: {e}")
 
@@ -107,126 +319,181 @@ def resolve_oauth_token(project_id: str) -> str | None:
 	supabase = get_supabase_client()
 	if not supabase:
 		print("❌ Supabase not available for token lookup")
-		return None
+		return None, None
 
 	try:
 		print("🔍 Querying oauth_tokens via supabase client ...")
 		result = supabase.table("oauth_tokens").select("*").eq("project_id", project_id).eq("provider", "google").execute()
 		if result.data and len(result.data) > 0:
 			token = result.data[0]
-			return token.get("access_token")
+			return token.get("access_token"), None
 		print(f"❌ No token found for project {project_id}")
-		return None
+		return None, None
 	except Exception as e:
 		print(f"❌ Error resolving OAuth token (client): {e}")
-		return None
+		return None, None
+
+
+# googleapiclient (httplib2) is sync-only, so async callers run Gmail calls on a dedicated
+# bounded pool instead of the default executor shared with everything else.
+_GMAIL_IO_THREADS = int(os.getenv("GMAIL_IO_THREADS", "16"))
+_gmail_io_executor = ThreadPoolExecutor(max_workers=_GMAIL_IO_THREADS, thread_name_prefix="gmail-io")
+
+
+async def run_gmail_io(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+	"""Await a blocking Gmail call on the Gmail I/O pool."""
+	loop = asyncio.get_running_loop()
+	return await loop.run_in_executor(_gmail_io_executor, functools.partial(fn, *args, **kwargs))
+
+
+def submit_gmail_io(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+	"""Run a blocking Gmail call on the Gmail I/O pool from synchronous code."""
+	return _gmail_io_executor.submit(fn, *args, **kwargs)
+
+
+# Reply metadata (Subject/From/Message-ID/References of the message being replied to),
+# captured when a thread is fetched for drafting so send_reply can skip its threads.get.
+_REPLY_META_TTL_SECONDS = int(os.getenv("REPLY_META_TTL_SECONDS", "86400"))
+_REPLY_META_CACHE_SIZE = int(os.getenv("REPLY_META_CACHE_SIZE", "1024"))
+_reply_meta_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_reply_meta_lock = threading.Lock()
+
+
+def _reply_meta_key(project_id: str, thread_id: str) -> str:
+	prefix = os.getenv("REDIS_PREFIX", "emailreply")
+	return f"{prefix}:cache:replymeta:{project_id}:{thread_id}"
+
+
+def reply_metadata(message: Any) -> Dict[str, Any]:
+	"""Reply headers from a parsed message (mime.ParsedMessage)."""
+	return {
+		"subject": message.subject,
+		"from": message.header('from'),
+		"messageId": message.header('message-id') or None,
+		"references": message.header('references') or None,
+	}
 
 
-def fetch_thread_text(thread_id: str, access_token: str | None) -> str:
+def remember_reply_meta(project_id: str, thread_id: str, meta: Dict[str, Any]) -> None:
+	key = _reply_meta_key(project_id, thread_id)
+	with _reply_meta_lock:
+		unchanged = _reply_meta_cache.get(key) == meta
+		_reply_meta_cache[key] = meta
+		_reply_meta_cache.move_to_end(key)
+		while len(_reply_meta_cache) > _REPLY_META_CACHE_SIZE:
+			_reply_meta_cache.popitem(last=False)
+	if persistence is not None and not unchanged:
+		persistence.redis_setex_json(key, _REPLY_META_TTL_SECONDS, meta)
+
+
+def cached_reply_meta(project_id: str, thread_id: str) -> Optional[Dict[str, Any]]:
+	"""Reply metadata captured by an earlier fetch_thread, or None on a miss."""
+	key = _reply_meta_key(project_id, thread_id)
+	with _reply_meta_lock:
+		meta = _reply_meta_cache.get(key)
+		if meta is not None:
+			_reply_meta_cache.move_to_end(key)
+			return meta
+	meta = persistence.redis_get_json(key) if persistence is not None else None
+	if meta and meta.get("from"):
+		with _reply_meta_lock:
+			_reply_meta_cache[key] = meta
+		return meta
+	return None
+
+
+def fetch_thread(thread_id: str, access_token: str | None, project_id: str | None = None) -> ParsedThread:
 	"""
-	Return a normalized plain text for the Gmail thread.
+	Fetch a Gmail thread and parse it into a structured ParsedThread.
+	With a project_id (and GMAIL_INCREMENTAL_SYNC on) threads are kept in the per-project
+	sync cache and only messages added since the last fetch are downloaded.
+	On failure the returned thread has no messages and `error` describes the problem.
 	
 	Args:
 		thread_id: Gmail thread ID
 		access_token: Valid Gmail API access token
+		project_id: Project whose sync state should be used (optional)
 		
 	Returns:
-		Plain text representation of the thread
+		ParsedThread (messages in chronological order)
 	"""
 	if not access_token:
-		return f"[Thread {thread_id}] No access token available."
+		return ParsedThread(thread_id, [], error=f"[Thread {thread_id}] No access token available.")
 	
 	if not GMAIL_API_AVAILABLE:
-		return f"[Thread {thread_id}] Gmail API library not available."
+		return ParsedThread(thread_id, [], error=f"[Thread {thread_id}] Gmail API library not available.")
+	_load_gmail_sdk()
 	
 	try:
-		# Build Gmail API client
-		credentials = Credentials(token=access_token)
-		service = build('gmail', 'v1', credentials=credentials)
+		service = _get_gmail_service(access_token)
 		
-		# Fetch thread
-		thread = service.users().threads().get(
-			userId='me',
-			id=thread_id,
-			format='full'
-		).execute()
-		
-		# Extract messages
-		messages = thread.get('messages', [])
-		if not messages:
-			return f"[Thread {thread_id}] No messages found."
-		
-		# Build plain text representation
-		thread_text = []
-		for msg in messages:
-			headers = msg.get('payload', {}).get('headers', [])
-			
-			# Extract relevant headers
-			subject = next((h['value'] for h in headers if h['name'].lower() == 'subject'), 'No Subject')
-			from_email = next((h['value'] for h in headers if h['name'].lower() == 'from'), 'Unknown')
-			date = next((h['value'] for h in headers if h['name'].lower() == 'date'), '')
-			
-			# Extract body
-			body = _extract_message_body(msg.get('payload', {}))
-			
-			# Format message
-			thread_text.append(f"From: {from_email}")
-			thread_text.append(f"Date: {date}")
-			thread_text.append(f"Subject: {subject}")
-			thread_text.append(f"\n{body}\n")
-			thread_text.append("-" * 80)
+		if project_id and gmail_sync.enabled():
+			messages = gmail_sync.fetch_thread(project_id, thread_id, service, mime.parse_message)
+		else:
+			# Fetch thread
+			thread = gmail_quota.execute(project_id, service.users().threads().get(
+				userId='me',
+				id=thread_id,
+				format='full'
+			), 'threads.get')
+			messages = [mime.parse_message(msg) for msg in thread.get('messages', [])]
 		
-		return "\n".join(thread_text)
+		if project_id and messages:
+			remember_reply_meta(project_id, thread_id, reply_metadata(messages[0]))
+		return ParsedThread(thread_id, messages)
 		
 	except HttpError as error:
 		print(f"Gmail API error: {error}")
-		return f"[Thread {thread_id}] Error fetching thread: {error}"
+		if getattr(error.resp, 'status', None) == 401:
+			_invalidate_gmail_service(access_token)
+		return ParsedThread(thread_id, [], error=f"[Thread {thread_id}] Error fetching thread: {error}")
 	except Exception as e:
 		print(f"Unexpected error fetching thread: {e}")
-		return f"[Thread {thread_id}] Unexpected error: {e}"
+		return ParsedThread(thread_id, [], error=f"[Thread {thread_id}] Unexpected error: {e}")
 
 
-def _extract_message_body(payload: Dict[str, Any]) -> str:
-	"""Extract plain text body from message payload."""
-	import base64
-	
-	# Check if body is directly in payload
-	if 'body' in payload and 'data' in payload['body']:
-		try:
-			return base64.urlsafe_b64decode(payload['body']['data']).decode('utf-8')
-		except Exception as e:
-			print(f"Error decoding body: {e}")
-			return "[Could not decode message body]"
-	
-	# Check parts (multipart message)
-	if 'parts' in payload:
-		for part in payload['parts']:
-			mime_type = part.get('mimeType', '')
-			
-			# Prefer plain text
-			if mime_type == 'text/plain' and 'data' in part.get('body', {}):
-				try:
-					return base64.urlsafe_b64decode(part['body']['data']).decode('utf-8')
-				except Exception as e:
-					print(f"Error decoding part: {e}")
-					continue
-			
-			# Recursively check nested parts
-			if 'parts' in part:
-				nested_body = _extract_message_body(part)
-				if nested_body and nested_body != "[Could not decode message body]":
-					return nested_body
-	
-	return "[No readable content]"
+def sync_mailbox(project_id: str, access_token: str | None = None) -> Optional[float]:
+	"""
+	Apply the project's mailbox history delta (one history.list call, at most once per
+	GMAIL_HISTORY_CHECK_SECONDS) without fetching threads; changed threads are reported to
+	gmail_sync.on_threads_changed listeners.
+	Returns the time since which changes are tracked, or None when incremental sync is
+	unavailable or the check failed.
+	"""
+	if not gmail_sync.enabled() or not GMAIL_API_AVAILABLE:
+		return None
+	try:
+		access_token = access_token or resolve_oauth_token(project_id)
+		if not access_token:
+			return None
+		service = _get_gmail_service(access_token)
+		gmail_sync.sync_history(project_id, service, max_age=gmail_sync.history_check_seconds())
+		if gmail_sync.tracking_since(project_id) is None:
+			# History was reset (expired or failed): take a new baseline, so cached copies
+			# from before it are refetched rather than trusted
+			gmail_sync.sync_history(project_id, service)
+		return gmail_sync.tracking_since(project_id)
+	except Exception as e:
+		print(f"⚠️ Mailbox history check failed for project {project_id}: {e}")
+		return None
+
 
+def fetch_thread_text(thread_id: str, access_token: str | None, project_id: str | None = None) -> str:
+	"""
+	Return a normalized plain text for the Gmail thread (see fetch_thread).
+	Errors are returned as a bracketed "[Thread <id>] ..." message instead of raising.
+	"""
+	return fetch_thread(thread_id, access_token, project_id=project_id).to_text()
 
-def list_threads(project_id: str, max_results: int = 20) -> List[Dict[str, Any]]:
+
+def list_threads(project_id: str, max_results: int = 20, query: str | None = None) -> List[Dict[str, Any]]:
 	"""
 	List Gmail threads for a project.
 	
 	Args:
 		project_id: The project identifier
 		max_results: Maximum number of threads to return
+		query: Optional Gmail search query (same syntax as the Gmail search box)
 		
 	Returns:
 		List of thread dictionaries with id, subject, snippet, date
@@ -243,11 +510,10 @@ def list_threads(project_id: str, max_results: int = 20) -> List[Dict[str, Any]]
 	if not GMAIL_API_AVAILABLE:
 		print("❌ Gmail API library not available")
 		return []
+	_load_gmail_sdk()
 	
 	try:
-		# Build Gmail API client
-		credentials = Credentials(token=access_token)
-		service = build('gmail', 'v1', credentials=credentials)
+		service = _get_gmail_service(access_token)
 		
 		# List threads
 		label_whitelist = os.getenv("GMAIL_LABEL_WHITELIST", "INBOX").split(",")
@@ -255,12 +521,21 @@ def list_threads(project_id: str, max_results: int = 20) -> List[Dict[str, Any]]
 		
 		print(f"🏷️  Fetching threads from label: {selected_label}")
 		
+		# Incremental mode: if mailbox history shows no change, serve the previous listing
+		listing_key = (selected_label, max_results)
+		incremental = gmail_sync.enabled()
+		if incremental:
+			gmail_sync.sync_history(project_id, service)
+			cached = gmail_sync.cached_listing(project_id, listing_key) if not query else None
+			if cached is not None:
+				print(f"✅ Returning {len(cached)} threads (unchanged since last sync)")
+				return cached
+		
 		# Fetch threads from first label
-		results = service.users().threads().list(
-			userId='me',
-			maxResults=max_results,
-			labelIds=[selected_label]
-		).execute()
+		list_kwargs: Dict[str, Any] = {'userId': 'me', 'maxResults': max_results, 'labelIds': [selected_label]}
+		if query:
+			list_kwargs['q'] = query
+		results = gmail_quota.execute(project_id, service.users().threads().list(**list_kwargs), 'threads.list')
 		
 		print(f"📧 Gmail API response: {results.keys()}")
 		
@@ -271,19 +546,21 @@ def list_threads(project_id: str, max_results: int = 20) -> List[Dict[str, Any]]
 			print("⚠️  No threads returned from Gmail API")
 			return []
 		
-		# Fetch details for each thread
+		# Fetch metadata via Gmail HTTP batch requests (one round-trip per chunk),
+		# skipping threads whose metadata is still valid in the sync cache
+		thread_ids = [t['id'] for t in threads_data]
+		known = gmail_sync.cached_metadata(project_id, thread_ids) if incremental else {}
+		missing = [tid for tid in thread_ids if tid not in known]
+		details = _batch_get_thread_metadata(service, missing, ['Subject', 'From', 'Date'], project_id=project_id) if missing else {}
+		
 		threads = []
-		for i, thread_data in enumerate(threads_data):
-			thread_id = thread_data['id']
-			print(f"📨 Fetching thread {i+1}/{len(threads_data)}: {thread_id}")
-			
-			# Fetch full thread to get subject and snippet
-			thread = service.users().threads().get(
-				userId='me',
-				id=thread_id,
-				format='metadata',
-				metadataHeaders=['Subject', 'From', 'Date']
-			).execute()
+		for thread_id in thread_ids:
+			if thread_id in known:
+				threads.append(known[thread_id])
+				continue
+			thread = details.get(thread_id)
+			if not thread:
+				continue
 			
 			# Extract first message headers
 			messages = thread.get('messages', [])
@@ -291,41 +568,92 @@ def list_threads(project_id: str, max_results: int = 20) -> List[Dict[str, Any]]
 				print(f"⚠️  No messages in thread {thread_id}")
 				continue
 			
-			first_msg = messages[0]
-			headers = first_msg.get('payload', {}).get('headers', [])
-			
-			subject = next((h['value'] for h in headers if h['name'].lower() == 'subject'), 'No Subject')
-			from_email = next((h['value'] for h in headers if h['name'].lower() == 'from'), 'Unknown')
-			date = next((h['value'] for h in headers if h['name'].lower() == 'date'), '')
-			
+			first_msg = mime.parse_message(messages[0], with_body=False)
 			snippet = thread.get('snippet', '')
 			
-			print(f"✉️  Thread: '{subject[:50]}' from {from_email[:30]}")
-			
 			threads.append({
 				'id': thread_id,
-				'subject': subject,
-				'from': from_email,
-				'date': date,
+				'subject': first_msg.subject,
+				'from': first_msg.sender,
+				'date': first_msg.date,
 				'snippet': snippet[:100] + '...' if len(snippet) > 100 else snippet,
 			})
 		
+		if incremental and not query:
+			gmail_sync.store_listing(project_id, listing_key, threads)
+		
 		print(f"✅ Returning {len(threads)} threads")
 		return threads
 		
 	except HttpError as error:
 		print(f"Gmail API error: {error}")
+		if getattr(error.resp, 'status', None) == 401:
+			_invalidate_gmail_service(access_token)
 		return []
 	except Exception as e:
 		print(f"Unexpected error listing threads: {e}")
 		return []
 
 
+def _batch_get_thread_metadata(
+	service: Any,
+	thread_ids: List[str],
+	metadata_headers: List[str],
+	project_id: str | None = None,
+) -> Dict[str, Dict[str, Any]]:
+	"""
+	Fetch threads.get(format='metadata') for many threads using Gmail HTTP batch requests.
+	Requests are grouped in chunks of GMAIL_BATCH_SIZE (Gmail allows up to 100 per batch);
+	each chunk is charged to the project's quota as one threads.get per thread.
+	Returns a dict of thread_id -> thread resource; threads that failed are omitted.
+	Items rejected by Gmail's rate limiter are retried (after a project backoff) in a new batch.
+	"""
+	results: Dict[str, Dict[str, Any]] = {}
+	rate_limited: List[str] = []
+	
+	def _on_response(request_id: str, response: Dict[str, Any], exception: Exception | None) -> None:
+		if exception is not None:
+			if gmail_quota.is_rate_limited(exception):
+				rate_limited.append(request_id)
+				return
+			print(f"⚠️  Failed to fetch thread {request_id}: {exception}")
+			return
+		results[request_id] = response
+	
+	chunk_size = max(1, min(int(os.getenv("GMAIL_BATCH_SIZE", "50")), 100))
+	for start in range(0, len(thread_ids), chunk_size):
+		chunk = thread_ids[start:start + chunk_size]
+		attempt = 0
+		while chunk:
+			rate_limited.clear()
+			batch = service.new_batch_http_request(callback=_on_response)
+			for thread_id in chunk:
+				batch.add(
+					service.users().threads().get(
+						userId='me',
+						id=thread_id,
+						format='metadata',
+						metadataHeaders=metadata_headers
+					),
+					request_id=thread_id,
+				)
+			gmail_quota.execute(project_id, batch, 'threads.get', units=gmail_quota.QUOTA_UNITS['threads.get'] * len(chunk))
+			if rate_limited and not gmail_quota.retry_after_rate_limit(project_id, 'threads.get', attempt):
+				print(f"⚠️  Giving up on {len(rate_limited)} rate-limited thread(s)")
+				break
+			chunk = list(rate_limited)
+			attempt += 1
+	
+	return results
+
+
 def send_reply(
 	thread_id: str,
 	draft_text: str,
 	access_token: str | None,
-	subject: str | None = None
+	subject: str | None = None,
+	reply_meta: Dict[str, Any] | None = None,
+	project_id: str | None = None,
 ) -> Dict[str, Any]:
 	"""
 	Send an email reply to a Gmail thread.
@@ -335,6 +663,9 @@ def send_reply(
 		draft_text: The email body content
 		access_token: Valid Gmail API access token
 		subject: Optional subject (defaults to "Re: " + original subject)
+		reply_meta: Reply headers captured at fetch time (see cached_reply_meta);
+			when given, the send is a single Gmail call with no threads.get lookup
+		project_id: Project whose Gmail quota the calls are charged to
 		
 	Returns:
 		Dict with success status, messageId, and threadId
@@ -347,48 +678,34 @@ def send_reply(
 	
 	if not GMAIL_API_AVAILABLE:
 		raise RuntimeError("Gmail API library not available.")
+	_load_gmail_sdk()
 	
 	try:
 		from email.mime.text import MIMEText
 		import base64
 		
-		# Build Gmail API client
-		credentials = Credentials(token=access_token)
-		service = build('gmail', 'v1', credentials=credentials)
+		service = _get_gmail_service(access_token)
 		
-		# Fetch original thread to get message IDs and recipients
-		print(f"📧 Fetching thread {thread_id} for reply metadata...")
-		thread = service.users().threads().get(
-			userId='me',
-			id=thread_id,
-			format='metadata',
-			metadataHeaders=['Subject', 'From', 'To', 'Message-ID', 'References']
-		).execute()
-		
-		if not thread.get('messages'):
-			raise RuntimeError("Thread has no messages.")
-		
-		# Get the first message (original email)
-		first_message = thread['messages'][0]
-		headers = first_message.get('payload', {}).get('headers', [])
-		
-		# Extract headers
-		original_subject = next(
-			(h['value'] for h in headers if h['name'].lower() == 'subject'),
-			'No Subject'
-		)
-		original_from = next(
-			(h['value'] for h in headers if h['name'].lower() == 'from'),
-			''
-		)
-		original_message_id = next(
-			(h['value'] for h in headers if h['name'].lower() == 'message-id'),
-			None
-		)
-		original_references = next(
-			(h['value'] for h in headers if h['name'].lower() == 'references'),
-			None
-		)
+		if not reply_meta:
+			# Fetch original thread to get message IDs and recipients
+			print(f"📧 Fetching thread {thread_id} for reply metadata...")
+			thread = gmail_quota.execute(project_id, service.users().threads().get(
+				userId='me',
+				id=thread_id,
+				format='metadata',
+				metadataHeaders=['Subject', 'From', 'To', 'Message-ID', 'References']
+			), 'threads.get')
+			
+			if not thread.get('messages'):
+				raise RuntimeError("Thread has no messages.")
+			
+			# Get the first message (original email) and extract headers
+			reply_meta = reply_metadata(mime.parse_message(thread['messages'][0], with_body=False))
+		
+		original_subject = reply_meta.get('subject') or 'No Subject'
+		original_from = reply_meta.get('from') or ''
+		original_message_id = reply_meta.get('messageId')
+		original_references = reply_meta.get('references')
 		
 		print(f"✉️  Replying to: '{original_subject}' from {original_from}")
 		
@@ -414,13 +731,13 @@ def send_reply(
 		
 		# Send via Gmail API
 		print(f"📤 Sending email reply...")
-		sent_message = service.users().messages().send(
+		sent_message = gmail_quota.execute(project_id, service.users().messages().send(
 			userId='me',
 			body={
 				'raw': raw_message,
 				'threadId': thread_id  # Ensures reply is threaded
 			}
-		).execute()
+		), 'messages.send')
 		
 		print(f"✅ Email sent successfully: {sent_message['id']}")
 		
@@ -434,8 +751,20 @@ def send_reply(
 		print(f"❌ Gmail API error sending email: {error}")
 		error_msg = str(error)
 		if "401" in error_msg or "unauthorized" in error_msg.lower():
+			_invalidate_gmail_service(access_token)
 			raise RuntimeError("Gmail token expired. Please reconnect Gmail.")
 		raise RuntimeError(f"Gmail API error: {error}")
 	except Exception as e:
 		print(f"❌ Unexpected error sending email: {e}")
 		raise RuntimeError(f"Failed to send email: {e}")
+
+
+async def send_reply_async(
+	thread_id: str,
+	draft_text: str,
+	access_token: str | None,
+	subject: str | None = None,
+	reply_meta: Dict[str, Any] | None = None,
+	project_id: str | None = None,
+) -> Dict[str, Any]:
+	return await run_gmail_io(send_reply, thread_id, draft_text, access_token, subject, reply_meta=reply_meta, project_id=project_id)
@@ -1,65 +1,463 @@
 """
 Gmail Client integration (scaffold).
 - Uses server-side OAuth tokens (not exposed to client)
-- Caches normalized threads in Redis
-- Stores thread index in Supabase table emailreply.gmail_threads (stubbed)
+- Caches normalized threads in-process (LRU) in front of Redis, stale-while-revalidate
+- Indexes threads in a local full-text index for fast search (see thread_index)
+- Prefetches the top threads of a listing in the background (see prefetch_threads)
 """
 
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Dict, List, Optional, Set, Tuple
+import threading
 import time
 import os
 
-from api.services.gmail import resolve_oauth_token, fetch_thread_text
-from api.services.persistence import (
-	redis_get_json,
-	redis_setex_json,
-	persist_gmail_thread_index,
-)
+try:
+	from api.services import gmail, gmail_quota, gmail_sync, thread_index
+	from api.services.mime import ParsedMessage, ParsedThread
+	from api.services.persistence import (
+		redis_get_json,
+		redis_pipeline,
+		redis_pipeline_async,
+		redis_setex_json,
+		persist_gmail_thread_index,
+	)
+except ModuleNotFoundError:  # Running with cwd at api/
+	from services import gmail, gmail_quota, gmail_sync, thread_index
+	from services.mime import ParsedMessage, ParsedThread
+	from services.persistence import (
+		redis_get_json,
+		redis_pipeline,
+		redis_pipeline_async,
+		redis_setex_json,
+		persist_gmail_thread_index,
+	)
 
 
 NormalizedThread = Dict[str, Any]
 
+# Two-tier thread cache: an in-process LRU (bounded by entries and by message characters)
+# in front of Redis. Entries younger than THREAD_CACHE_FRESH_SECONDS are served as is; older
+# ones, up to THREAD_CACHE_TTL_SECONDS, are served stale while a background refresh runs.
+_THREAD_CACHE_TTL_SECONDS = int(os.getenv("THREAD_CACHE_TTL_SECONDS", "300"))
+_THREAD_CACHE_FRESH_SECONDS = float(os.getenv("THREAD_CACHE_FRESH_SECONDS", "60"))
+_THREAD_CACHE_SIZE = int(os.getenv("THREAD_CACHE_SIZE", "256"))
+_THREAD_CACHE_MAX_CHARS = int(os.getenv("THREAD_CACHE_MAX_CHARS", "5000000"))
+_thread_cache: "OrderedDict[str, Tuple[NormalizedThread, int]]" = OrderedDict()
+_thread_cache_chars = 0
+_thread_cache_lock = threading.Lock()
+# Bumped on invalidation so a fetch that started before it does not re-cache the old thread;
+# key -> (generation, invalidated at), pruned after _GENERATION_HORIZON_SECONDS
+_thread_generations: Dict[str, Tuple[int, float]] = {}
+_GENERATION_HORIZON_SECONDS = 600.0
+_refreshing: Set[str] = set()
 
-def _cache_key_for_thread(thread_id: str) -> str:
+# Headers kept per cached message (enough to rebuild prompts and reply metadata)
+_CACHED_HEADERS = ("from", "to", "cc", "date", "subject", "message-id", "references")
+
+# Background prefetch of listed threads. Each project may start at most
+# THREAD_PREFETCH_BUDGET prefetches per THREAD_PREFETCH_WINDOW_SECONDS.
+THREAD_PREFETCH_COUNT = int(os.getenv("THREAD_PREFETCH_COUNT", "3"))
+_PREFETCH_BUDGET = int(os.getenv("THREAD_PREFETCH_BUDGET", "20"))
+_PREFETCH_WINDOW_SECONDS = float(os.getenv("THREAD_PREFETCH_WINDOW_SECONDS", "60"))
+_BACKGROUND_WORKERS = int(os.getenv("THREAD_PREFETCH_WORKERS", "2"))
+_background_executor: ThreadPoolExecutor | None = None
+_prefetch_lock = threading.Lock()
+_prefetch_windows: Dict[str, Tuple[float, int]] = {}
+_prefetched: Dict[Tuple[str, str], float] = {}
+# (project, normalized query) -> when a background Gmail search top-up last ran
+_search_topups: Dict[Tuple[str, str], float] = {}
+# How long a short index answer waits for Gmail's matches before returning without them
+_SEARCH_GMAIL_TIMEOUT_SECONDS = float(os.getenv("THREAD_SEARCH_GMAIL_TIMEOUT_SECONDS", "3"))
+
+
+def _cache_key_for_thread(profile_id: str, thread_id: str) -> str:
 	prefix = os.getenv("REDIS_PREFIX", "emailreply")
-	return f"{prefix}:cache:thread:{thread_id}"
+	return f"{prefix}:cache:thread:{profile_id}:{thread_id}"
 
 
-def get_thread(profile_id: str, thread_id: str, label_whitelist: Optional[List[str]] = None) -> NormalizedThread:
+def get_thread(
+	profile_id: str,
+	thread_id: str,
+	label_whitelist: Optional[List[str]] = None,
+	access_token: str | None = None,
+) -> NormalizedThread:
 	"""
 	Fetch a Gmail thread and return a normalized structure.
-	Cache for 300s using Upstash Redis if configured.
+	Served from the two-tier thread cache (in-process LRU, then Upstash Redis if configured)
+	for THREAD_CACHE_TTL_SECONDS; stale entries are refreshed in the background.
 	"""
-	key = _cache_key_for_thread(thread_id)
-	cached = redis_get_json(key)
+	cached = _lookup(profile_id, thread_id)
 	if cached:
 		return cached
+	return _fetch(profile_id, thread_id, access_token)[1]
+
+
+def get_parsed_thread(profile_id: str, thread_id: str, access_token: str | None = None) -> ParsedThread:
+	"""
+	Cached thread as a ParsedThread (the input of compaction and the drafting adapter).
+	Failed fetches come back with .error set and are not cached.
+	"""
+	cached = _lookup(profile_id, thread_id)
+	if cached:
+		# Check the cheap history delta before drafting from a cached copy: threads it reports as
+		# changed are dropped (_on_threads_changed), and copies older than the tracked history
+		# window cannot be vouched for. The check runs at most once per GMAIL_HISTORY_CHECK_SECONDS
+		# per project, and a miss right after it reuses it instead of calling history.list again.
+		since = gmail.sync_mailbox(profile_id, access_token)
+		if since is not None:
+			cached = _local_get(_cache_key_for_thread(profile_id, thread_id)) if cached.get("updated_at", 0) >= int(since) else None
+	if cached:
+		return _parsed_from_cache(cached)
+	return _fetch(profile_id, thread_id, access_token)[0]
+
+
+async def get_parsed_thread_async(profile_id: str, thread_id: str, access_token: str | None = None) -> ParsedThread:
+	return await gmail.run_gmail_io(get_parsed_thread, profile_id, thread_id, access_token=access_token)
+
+
+def invalidate_thread(profile_id: str, thread_id: str) -> None:
+	"""Drop a thread from both cache tiers (call after the thread changed, e.g. a reply was sent)."""
+	key = _forget(profile_id, thread_id)
+	redis_pipeline([["DEL", key]])
+
+
+async def invalidate_thread_async(profile_id: str, thread_id: str) -> None:
+	key = _forget(profile_id, thread_id)
+	await redis_pipeline_async([["DEL", key]])
+
+
+def reset_cache() -> None:
+	"""Clear the in-process thread cache, prefetch budgets and prefetch marks (tests)."""
+	global _thread_cache_chars
+	with _thread_cache_lock:
+		_thread_cache.clear()
+		_thread_cache_chars = 0
+		_thread_generations.clear()
+	reset_prefetch()
+
+
+def _lookup(profile_id: str, thread_id: str) -> Optional[NormalizedThread]:
+	key = _cache_key_for_thread(profile_id, thread_id)
+	cached = _local_get(key)
+	if cached is None:
+		cached = redis_get_json(key)
+		if cached:
+			_local_put(key, cached)
+	if not cached:
+		return None
+	if time.time() - cached.get("updated_at", 0) >= _THREAD_CACHE_FRESH_SECONDS:
+		_schedule_refresh(profile_id, thread_id)
+	return cached
+
 
-	# Resolve OAuth token (server-side only) and fetch thread text (stubbed)
-	access_token = resolve_oauth_token(profile_id)
-	thread_text = fetch_thread_text(thread_id, access_token)
+def _fetch(profile_id: str, thread_id: str, access_token: str | None = None) -> Tuple[ParsedThread, NormalizedThread]:
+	"""Fetch from Gmail, then fill both cache tiers and the search index (successful fetches only)."""
+	key = _cache_key_for_thread(profile_id, thread_id)
+	generation = _generation(key)
 
-	# Naive normalization for scaffold
-	snippet = (thread_text or "").strip().replace("\n", " ")
+	# Resolve OAuth token (server-side only) unless the caller already has one
+	if access_token is None:
+		access_token = gmail.resolve_oauth_token(profile_id)
+	thread = gmail.fetch_thread(thread_id, access_token, project_id=profile_id)
+	normalized = _normalize(thread)
+	if thread.error or not thread.messages:
+		return thread, normalized
+
+	# Skip caching if the thread was invalidated while it was being fetched
+	if not _local_put(key, normalized, generation):
+		return thread, normalized
+	if _generation(key) == generation:
+		redis_setex_json(key, _THREAD_CACHE_TTL_SECONDS, normalized)
+	persist_gmail_thread_index(profile_id, normalized)
+	return thread, normalized
+
+
+def _normalize(thread: ParsedThread) -> NormalizedThread:
+	messages = [
+		{
+			"id": m.id,
+			"from": m.sender,
+			"date": m.date,
+			"text": m.body,
+			"ts": m.internal_date // 1000,
+			"headers": {h: m.headers[h] for h in _CACHED_HEADERS if h in m.headers},
+		}
+		for m in thread.messages
+	] or [{"text": thread.to_text(), "ts": int(time.time())}]
+	snippet = (messages[-1]["text"] or "").strip().replace("\n", " ")
 	if len(snippet) > 160:
 		snippet = snippet[:157] + "..."
-	normalized: NormalizedThread = {
-		"id": thread_id,
-		"subject": None,
-		"participants": [],
+	first = thread.messages[0] if thread.messages else None
+	return {
+		"id": thread.id,
+		"subject": thread.subject,
+		# Same fields as the thread list (taken from the first message)
+		"from": first.sender if first else None,
+		"date": first.date if first else None,
+		"participants": thread.participants,
 		"snippet": snippet,
-		"messages": [
-			{"text": thread_text or "", "ts": int(time.time())},
-		],
+		"messages": messages,
 		"updated_at": int(time.time()),
 	}
 
-	# Cache and persist index (best effort)
-	redis_setex_json(key, 300, normalized)
-	persist_gmail_thread_index(profile_id, normalized)
-	return normalized
+
+def _parsed_from_cache(normalized: NormalizedThread) -> ParsedThread:
+	thread_id = normalized["id"]
+	return ParsedThread(thread_id, [
+		ParsedMessage(
+			id=m.get("id", ""),
+			thread_id=thread_id,
+			internal_date=int(m.get("ts") or 0) * 1000,
+			headers=m.get("headers") or {"from": m.get("from") or "", "date": m.get("date") or ""},
+			body=m.get("text") or "",
+		)
+		for m in normalized.get("messages", [])
+	])
+
+
+def _local_get(key: str) -> Optional[NormalizedThread]:
+	with _thread_cache_lock:
+		entry = _thread_cache.get(key)
+		if entry is None:
+			return None
+		if time.time() - entry[0].get("updated_at", 0) >= _THREAD_CACHE_TTL_SECONDS:
+			_local_pop(key)
+			return None
+		_thread_cache.move_to_end(key)
+		return entry[0]
+
+
+def _local_put(key: str, thread: NormalizedThread, generation: int | None = None) -> bool:
+	"""Store in the LRU; with `generation`, only if the key was not invalidated since. Returns False if skipped."""
+	global _thread_cache_chars
+	size = sum(len(m.get("text") or "") for m in thread.get("messages", [])) + len(thread.get("subject") or "")
+	with _thread_cache_lock:
+		if generation is not None and _thread_generations.get(key, (0, 0.0))[0] != generation:
+			return False
+		if size > _THREAD_CACHE_MAX_CHARS:
+			return True
+		_local_pop(key)
+		_thread_cache[key] = (thread, size)
+		_thread_cache_chars += size
+		while len(_thread_cache) > _THREAD_CACHE_SIZE or _thread_cache_chars > _THREAD_CACHE_MAX_CHARS:
+			_local_pop(next(iter(_thread_cache)))
+	return True
+
+
+def _local_pop(key: str) -> None:
+	# Caller holds _thread_cache_lock
+	global _thread_cache_chars
+	entry = _thread_cache.pop(key, None)
+	if entry is not None:
+		_thread_cache_chars -= entry[1]
+
+
+def _generation(key: str) -> int:
+	with _thread_cache_lock:
+		return _thread_generations.get(key, (0, 0.0))[0]
+
+
+def _forget(profile_id: str, thread_id: str) -> str:
+	key = _cache_key_for_thread(profile_id, thread_id)
+	now = time.time()
+	with _thread_cache_lock:
+		_local_pop(key)
+		_thread_generations[key] = (_thread_generations.get(key, (0, 0.0))[0] + 1, now)
+		# Generations only matter to fetches in flight; drop old ones so the map stays bounded
+		if len(_thread_generations) > _THREAD_CACHE_SIZE:
+			for stale in [k for k, (_, at) in _thread_generations.items() if now - at >= _GENERATION_HORIZON_SECONDS]:
+				del _thread_generations[stale]
+	with _prefetch_lock:
+		_prefetched.pop((profile_id, thread_id), None)
+	return key
+
+
+def _on_threads_changed(profile_id: str, thread_ids: Set[str]) -> None:
+	"""gmail_sync listener: drop threads that changed in the mailbox from both cache tiers."""
+	keys = [_forget(profile_id, thread_id) for thread_id in thread_ids]
+	redis_pipeline([["DEL", *keys]])
+
+
+gmail_sync.on_threads_changed(_on_threads_changed)
+
+
+def _schedule_refresh(profile_id: str, thread_id: str) -> None:
+	key = _cache_key_for_thread(profile_id, thread_id)
+	with _thread_cache_lock:
+		if key in _refreshing:
+			return
+		_refreshing.add(key)
+	_get_background_executor().submit(_refresh_thread, profile_id, thread_id, key)
+
+
+def _refresh_thread(profile_id: str, thread_id: str, key: str) -> None:
+	try:
+		with gmail_quota.background():
+			_fetch(profile_id, thread_id)
+	except Exception as e:
+		print(f"⚠️ Refresh of thread {thread_id} failed: {e}")
+	finally:
+		with _thread_cache_lock:
+			_refreshing.discard(key)
+
+
+def prefetch_threads(profile_id: str, thread_ids: List[str], count: int | None = None) -> List[Future]:
+	"""
+	Warm the thread cache for the first `count` threads (default THREAD_PREFETCH_COUNT) in the
+	background, so a draft requested right after listing starts with the thread local.
+	Threads prefetched within the cache TTL are skipped, and the project's prefetch budget
+	caps how many Gmail fetches this can start. Returns the futures of the queued fetches.
+	"""
+	count = THREAD_PREFETCH_COUNT if count is None else count
+	if count <= 0 or _PREFETCH_BUDGET <= 0:
+		return []
+
+	now = time.time()
+	queued: List[str] = []
+	with _prefetch_lock:
+		for key in [k for k, ts in _prefetched.items() if now - ts >= _THREAD_CACHE_TTL_SECONDS]:
+			del _prefetched[key]
+		window_start, spent = _prefetch_windows.get(profile_id, (now, 0))
+		if now - window_start >= _PREFETCH_WINDOW_SECONDS:
+			window_start, spent = now, 0
+		for thread_id in thread_ids[:count]:
+			if spent >= _PREFETCH_BUDGET:
+				break
+			if (profile_id, thread_id) in _prefetched:
+				continue
+			_prefetched[(profile_id, thread_id)] = now
+			queued.append(thread_id)
+			spent += 1
+		_prefetch_windows[profile_id] = (window_start, spent)
+
+	if queued:
+		print(f"📥 Prefetching {len(queued)} thread(s) for project {profile_id}")
+	return [_get_background_executor().submit(_prefetch_thread, profile_id, thread_id) for thread_id in queued]
+
+
+def _prefetch_thread(profile_id: str, thread_id: str) -> None:
+	try:
+		# Prefetches yield Gmail quota to interactive requests for the same project
+		with gmail_quota.background():
+			get_thread(profile_id, thread_id)
+	except Exception as e:
+		print(f"⚠️ Prefetch of thread {thread_id} failed: {e}")
+		with _prefetch_lock:
+			_prefetched.pop((profile_id, thread_id), None)
+
+
+def _get_background_executor() -> ThreadPoolExecutor:
+	"""Small pool shared by prefetches and stale-while-revalidate refreshes."""
+	global _background_executor
+	if _background_executor is None:
+		with _prefetch_lock:
+			if _background_executor is None:
+				_background_executor = ThreadPoolExecutor(max_workers=_BACKGROUND_WORKERS, thread_name_prefix="thread-cache")
+	return _background_executor
+
+
+def reset_prefetch() -> None:
+	"""Forget prefetch budgets and recently prefetched threads (tests)."""
+	with _prefetch_lock:
+		_prefetch_windows.clear()
+		_prefetched.clear()
+		_search_topups.clear()
+
+
+def list_threads(profile_id: str, max_results: int = 20) -> List[Dict[str, Any]]:
+	"""
+	List threads from Gmail and add their list-view fields to the local search index.
+	"""
+	threads = gmail.list_threads(profile_id, max_results=max_results)
+	for item in threads:
+		_index_list_item(profile_id, item)
+	return threads
+
+
+def search_threads(profile_id: str, query: str, limit: int = 20) -> Dict[str, Any]:
+	"""
+	Search threads in the local index first. When it has fewer than `limit` matches, Gmail
+	(q=query) is asked for the rest and waited on for up to THREAD_SEARCH_GMAIL_TIMEOUT_SECONDS;
+	its threads are merged in and indexed. A slower Gmail answer still indexes its threads for
+	the next search. A full index answer is returned at once and refreshed in the background.
+	Returns { items, source } where source is "index" or "index+gmail".
+	"""
+	items = thread_index.search(profile_id, query, limit=limit)
+	if len(items) >= limit:
+		_schedule_search_topup(profile_id, query, limit)
+		return {"items": items, "source": "index"}
+
+	remote = gmail.submit_gmail_io(_search_gmail, profile_id, query, limit, [])
+	try:
+		found = remote.result(timeout=_SEARCH_GMAIL_TIMEOUT_SECONDS)["items"]
+	except FutureTimeout:
+		print(f"⏳ Gmail search for '{query}' still running after {_SEARCH_GMAIL_TIMEOUT_SECONDS}s; answering from the index")
+		return {"items": items, "source": "index"}
+	except Exception as e:
+		print(f"⚠️ Gmail search for '{query}' failed: {e}")
+		return {"items": items, "source": "index"}
+	seen = {item["id"] for item in items}
+	for item in found:
+		if item["id"] not in seen and len(items) < limit:
+			items.append(item)
+			seen.add(item["id"])
+	return {"items": items, "source": "index+gmail"}
+
+
+def _search_gmail(profile_id: str, query: str, limit: int, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+	seen = {item["id"] for item in items}
+	remote = gmail.list_threads(profile_id, max_results=limit, query=query)
+	for item in remote:
+		_index_list_item(profile_id, item)
+		if item["id"] not in seen and len(items) < limit:
+			items.append(item)
+			seen.add(item["id"])
+	return {"items": items, "source": "index+gmail"}
+
+
+def _schedule_search_topup(profile_id: str, query: str, limit: int) -> Optional[Future]:
+	"""Refresh Gmail's matches for `query` into the index in the background (at most once per cache TTL per query)."""
+	now = time.time()
+	key = (profile_id, " ".join(query.lower().split()))
+	with _prefetch_lock:
+		for stale in [k for k, ts in _search_topups.items() if now - ts >= _THREAD_CACHE_TTL_SECONDS]:
+			del _search_topups[stale]
+		if key in _search_topups:
+			return None
+		_search_topups[key] = now
+	return _get_background_executor().submit(_search_topup, profile_id, query, limit)
+
+
+def _search_topup(profile_id: str, query: str, limit: int) -> None:
+	try:
+		with gmail_quota.background():
+			_search_gmail(profile_id, query, limit, [])
+	except Exception as e:
+		print(f"⚠️ Background Gmail search for '{query}' failed: {e}")
+
+
+async def list_threads_async(profile_id: str, max_results: int = 20) -> List[Dict[str, Any]]:
+	return await gmail.run_gmail_io(list_threads, profile_id, max_results)
+
+
+async def search_threads_async(profile_id: str, query: str, limit: int = 20) -> Dict[str, Any]:
+	return await gmail.run_gmail_io(search_threads, profile_id, query, limit)
+
+
+def _index_list_item(profile_id: str, item: Dict[str, Any]) -> None:
+	thread_index.upsert_thread(
+		profile_id,
+		item["id"],
+		subject=item.get("subject"),
+		sender=item.get("from"),
+		participants=[item["from"]] if item.get("from") else None,
+		snippet=item.get("snippet"),
+		date=item.get("date"),
+	)
 
 
 def send_message(profile_id: str, raw_mime: str) -> str:
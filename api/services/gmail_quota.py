@@ -0,0 +1,207 @@
+"""
+Per-project Gmail quota scheduler.
+
+Every Gmail API call goes through execute(): it takes the method's quota units from a
+per-project token bucket (Gmail's per-user limit is 250 units/second), lets interactive
+callers go ahead of background work (batch drafts, prefetch) and backs off with jitter
+when Gmail answers 429 / 403 rateLimitExceeded. snapshot() exposes the bucket state.
+"""
+
+from __future__ import annotations
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator
+import os
+import random
+import threading
+import time
+
+
+_QUOTA_ENABLED = os.getenv("GMAIL_QUOTA_ENABLED", "1") not in ("0", "false", "False")
+_UNITS_PER_SECOND = float(os.getenv("GMAIL_QUOTA_UNITS_PER_SECOND", "250"))
+_BURST_UNITS = float(os.getenv("GMAIL_QUOTA_BURST_UNITS", "250"))
+_MAX_WAIT_SECONDS = float(os.getenv("GMAIL_QUOTA_MAX_WAIT_SECONDS", "30"))
+_MAX_RETRIES = int(os.getenv("GMAIL_QUOTA_MAX_RETRIES", "3"))
+_BACKOFF_SECONDS = float(os.getenv("GMAIL_QUOTA_BACKOFF_SECONDS", "1"))
+
+# Quota units per method (https://developers.google.com/gmail/api/reference/quota)
+QUOTA_UNITS: Dict[str, int] = {
+	"getProfile": 1,
+	"history.list": 2,
+	"messages.list": 5,
+	"messages.get": 5,
+	"messages.send": 100,
+	"threads.list": 10,
+	"threads.get": 10,
+}
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+_priority: ContextVar[str] = ContextVar("gmail_quota_priority", default=INTERACTIVE)
+
+
+class GmailQuotaTimeout(RuntimeError):
+	"""Raised when a call waited longer than GMAIL_QUOTA_MAX_WAIT_SECONDS for quota."""
+
+
+class _Bucket:
+	__slots__ = ("tokens", "updated_at", "backoff_until", "waiting", "units_used", "throttled", "cond")
+
+	def __init__(self) -> None:
+		self.tokens = _BURST_UNITS
+		self.updated_at = time.monotonic()
+		self.backoff_until = 0.0
+		self.waiting = {INTERACTIVE: 0, BACKGROUND: 0}
+		self.units_used = 0
+		self.throttled = 0
+		self.cond = threading.Condition()
+
+	def refill(self, now: float) -> None:
+		self.tokens = min(_BURST_UNITS, self.tokens + (now - self.updated_at) * _UNITS_PER_SECOND)
+		self.updated_at = now
+
+
+_buckets: Dict[str, _Bucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def _bucket(project_id: str) -> _Bucket:
+	with _buckets_lock:
+		bucket = _buckets.get(project_id)
+		if bucket is None:
+			bucket = _buckets[project_id] = _Bucket()
+		return bucket
+
+
+def reset() -> None:
+	"""Forget all buckets (mainly for tests)."""
+	with _buckets_lock:
+		_buckets.clear()
+
+
+@contextmanager
+def background() -> Iterator[None]:
+	"""Mark Gmail calls made in this block (on this thread) as background work."""
+	token = _priority.set(BACKGROUND)
+	try:
+		yield
+	finally:
+		_priority.reset(token)
+
+
+def acquire(project_id: str, units: int, priority: str | None = None) -> float:
+	"""
+	Block until `units` quota units are available for the project; returns seconds waited.
+	Background callers also wait while any interactive caller is queued for the same project.
+	A request larger than the bucket is admitted once the bucket is full and leaves it in debt.
+	"""
+	if not _QUOTA_ENABLED:
+		return 0.0
+	priority = priority or _priority.get()
+	bucket = _bucket(project_id)
+	started = time.monotonic()
+	deadline = started + _MAX_WAIT_SECONDS
+	needed = min(units, _BURST_UNITS)
+	with bucket.cond:
+		bucket.waiting[priority] += 1
+		try:
+			while True:
+				now = time.monotonic()
+				bucket.refill(now)
+				blocked_by_interactive = priority == BACKGROUND and bucket.waiting[INTERACTIVE] > 0
+				if now >= bucket.backoff_until and bucket.tokens >= needed and not blocked_by_interactive:
+					break
+				if now >= deadline:
+					raise GmailQuotaTimeout(f"Gmail quota wait exceeded {_MAX_WAIT_SECONDS:.0f}s for project {project_id}")
+				wait = max(bucket.backoff_until - now, (needed - bucket.tokens) / _UNITS_PER_SECOND, 0.005)
+				bucket.cond.wait(min(wait, deadline - now))
+			bucket.tokens -= units
+			bucket.units_used += units
+		finally:
+			bucket.waiting[priority] -= 1
+			bucket.cond.notify_all()
+	return time.monotonic() - started
+
+
+def is_rate_limited(error: Exception) -> bool:
+	"""True for Gmail 429s and 403 rateLimitExceeded/userRateLimitExceeded errors."""
+	status = getattr(getattr(error, "resp", None), "status", None)
+	if status == 429:
+		return True
+	if status == 403:
+		content = getattr(error, "content", b"") or b""
+		if isinstance(content, bytes):
+			content = content.decode("utf-8", errors="replace")
+		return "ratelimitexceeded" in f"{content} {error}".lower()
+	return False
+
+
+def _back_off(project_id: str, attempt: int) -> float:
+	delay = _BACKOFF_SECONDS * (2 ** attempt)
+	delay += random.uniform(0, delay / 2)
+	bucket = _bucket(project_id)
+	with bucket.cond:
+		bucket.throttled += 1
+		bucket.backoff_until = max(bucket.backoff_until, time.monotonic() + delay)
+		bucket.cond.notify_all()
+	return delay
+
+
+def retry_after_rate_limit(project_id: str | None, method: str, attempt: int) -> bool:
+	"""
+	Back off after a rate-limit error that execute() could not see (e.g. one item of an HTTP
+	batch). Pauses the project like execute() does; returns False once retries are exhausted.
+	"""
+	if not _QUOTA_ENABLED or attempt >= _MAX_RETRIES:
+		return False
+	project_id = project_id or "_anonymous"
+	delay = _back_off(project_id, attempt)
+	print(f"⏳ Gmail rate limit on {method} for project {project_id}; backing off {delay:.1f}s")
+	return True
+
+
+def execute(project_id: str | None, request: Any, method: str, units: int | None = None) -> Any:
+	"""
+	Run request.execute() under the project's quota. `method` picks the unit cost from
+	QUOTA_UNITS unless `units` is given (e.g. a batch of several calls). Rate-limit errors
+	pause the whole project (backoff with jitter) and are retried up to GMAIL_QUOTA_MAX_RETRIES.
+	"""
+	project_id = project_id or "_anonymous"
+	cost = units if units is not None else QUOTA_UNITS.get(method, 5)
+	attempt = 0
+	while True:
+		acquire(project_id, cost)
+		try:
+			return request.execute()
+		except Exception as error:
+			if not _QUOTA_ENABLED or not is_rate_limited(error) or attempt >= _MAX_RETRIES:
+				raise
+			delay = _back_off(project_id, attempt)
+			print(f"⏳ Gmail rate limit on {method} for project {project_id}; backing off {delay:.1f}s")
+			attempt += 1
+
+
+def snapshot() -> Dict[str, Any]:
+	"""Monitoring view: per-project bucket level, queue depth, backoff and usage counters."""
+	with _buckets_lock:
+		items = list(_buckets.items())
+	projects = {}
+	now = time.monotonic()
+	for project_id, bucket in items:
+		with bucket.cond:
+			bucket.refill(now)
+			projects[project_id] = {
+				"availableUnits": round(bucket.tokens, 1),
+				"waitingInteractive": bucket.waiting[INTERACTIVE],
+				"waitingBackground": bucket.waiting[BACKGROUND],
+				"backoffSeconds": round(max(0.0, bucket.backoff_until - now), 2),
+				"unitsUsed": bucket.units_used,
+				"throttled": bucket.throttled,
+			}
+	return {
+		"enabled": _QUOTA_ENABLED,
+		"unitsPerSecond": _UNITS_PER_SECOND,
+		"burstUnits": _BURST_UNITS,
+		"projects": projects,
+	}
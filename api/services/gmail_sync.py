@@ -0,0 +1,279 @@
+"""
+Incremental Gmail sync based on users.history.list.
+
+Per project we keep the last seen mailbox historyId plus a bounded, in-process cache of
+normalized threads and thread-list metadata. Each sync pulls only the history records
+since that historyId and applies them to the cache, so a thread that was already fetched
+costs a small delta (new messages only) instead of a full threads.get(format='full').
+"""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+import os
+import threading
+import time
+
+try:
+	from api.services import gmail_quota  # type: ignore
+except Exception:
+	from services import gmail_quota  # type: ignore
+
+
+_SYNC_ENABLED = os.getenv("GMAIL_INCREMENTAL_SYNC", "1") not in ("0", "false", "False")
+_MAX_THREADS = int(os.getenv("GMAIL_SYNC_MAX_THREADS", "200"))
+_HISTORY_TYPES = ["messageAdded", "messageDeleted", "labelAdded", "labelRemoved"]
+# Thread reads skip the history.list call when the project was synced this recently
+_HISTORY_CHECK_SECONDS = float(os.getenv("GMAIL_HISTORY_CHECK_SECONDS", "10"))
+
+
+class _CachedThread:
+	__slots__ = ("messages", "pending")
+
+	def __init__(self) -> None:
+		# message_id -> (internalDate, normalized message)
+		self.messages: Dict[str, Tuple[int, Any]] = {}
+		# message ids added since the thread was cached and not fetched yet
+		self.pending: Set[str] = set()
+
+
+class _SyncState:
+	__slots__ = ("history_id", "since", "synced_at", "threads", "metadata", "listing", "lock")
+
+	def __init__(self) -> None:
+		self.history_id: Optional[str] = None
+		# When history_id was first recorded: changes before this are not tracked
+		self.since: Optional[float] = None
+		# time.monotonic() of the last successful sync
+		self.synced_at: Optional[float] = None
+		self.threads: "OrderedDict[str, _CachedThread]" = OrderedDict()
+		self.metadata: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+		self.listing: Optional[Tuple[Any, List[str]]] = None
+		self.lock = threading.Lock()
+
+	def clear(self) -> None:
+		self.history_id = None
+		self.since = None
+		self.synced_at = None
+		self.threads.clear()
+		self.metadata.clear()
+		self.listing = None
+
+
+_states: Dict[str, _SyncState] = {}
+_states_lock = threading.Lock()
+_change_listeners: List[Callable[[str, Set[str]], None]] = []
+
+
+def on_threads_changed(listener: Callable[[str, Set[str]], None]) -> None:
+	"""Call `listener(project_id, thread_ids)` whenever a history sync reports changed threads."""
+	_change_listeners.append(listener)
+
+
+def enabled() -> bool:
+	return _SYNC_ENABLED
+
+
+def history_check_seconds() -> float:
+	return _HISTORY_CHECK_SECONDS
+
+
+def _state(project_id: str) -> _SyncState:
+	with _states_lock:
+		state = _states.get(project_id)
+		if state is None:
+			state = _states[project_id] = _SyncState()
+		return state
+
+
+def reset(project_id: str | None = None) -> None:
+	"""Forget sync state for one project (or all), forcing a full refetch next time."""
+	with _states_lock:
+		states = list(_states.values()) if project_id is None else [_states[project_id]] if project_id in _states else []
+	for state in states:
+		with state.lock:
+			state.clear()
+
+
+def last_history_id(project_id: str) -> Optional[str]:
+	state = _state(project_id)
+	with state.lock:
+		return state.history_id
+
+
+def tracking_since(project_id: str) -> Optional[float]:
+	"""Time since which mailbox changes are tracked for the project (None before the first sync)."""
+	state = _state(project_id)
+	with state.lock:
+		return state.since
+
+
+def _http_status(error: Exception) -> Optional[int]:
+	return getattr(getattr(error, "resp", None), "status", None)
+
+
+def sync_history(project_id: str, service: Any, max_age: float | None = None) -> None:
+	"""
+	Apply mailbox changes since the stored historyId to the project's cache.
+	With `max_age`, nothing is called when the project was synced within that many seconds.
+	The first call records a baseline from users.getProfile. If history.list fails (the stored
+	historyId is too old for Gmail, a 5xx, quota...), the cache is dropped and the next fetch
+	starts from scratch instead of failing the caller.
+	"""
+	state = _state(project_id)
+	with state.lock:
+		start = state.history_id
+		if max_age is not None and state.synced_at is not None and time.monotonic() - state.synced_at < max_age:
+			return
+
+	if start is None:
+		profile = gmail_quota.execute(project_id, service.users().getProfile(userId='me'), 'getProfile')
+		with state.lock:
+			if state.history_id is None:
+				state.history_id = str(profile.get('historyId') or "") or None
+				state.since = time.time() if state.history_id else None
+				state.synced_at = time.monotonic() if state.history_id else None
+		return
+
+	added: Dict[str, List[str]] = {}
+	deleted: Dict[str, Set[str]] = {}
+	touched: Set[str] = set()
+	latest = start
+	page_token = None
+	try:
+		while True:
+			resp = gmail_quota.execute(project_id, service.users().history().list(
+				userId='me',
+				startHistoryId=start,
+				historyTypes=_HISTORY_TYPES,
+				pageToken=page_token,
+			), 'history.list')
+			for record in resp.get('history', []):
+				for item in record.get('messagesAdded', []):
+					msg = item.get('message', {})
+					added.setdefault(msg.get('threadId'), []).append(msg.get('id'))
+					touched.add(msg.get('threadId'))
+				for item in record.get('messagesDeleted', []):
+					msg = item.get('message', {})
+					deleted.setdefault(msg.get('threadId'), set()).add(msg.get('id'))
+					touched.add(msg.get('threadId'))
+				for key in ('labelsAdded', 'labelsRemoved'):
+					for item in record.get(key, []):
+						touched.add(item.get('message', {}).get('threadId'))
+			latest = str(resp.get('historyId') or latest)
+			page_token = resp.get('nextPageToken')
+			if not page_token:
+				break
+	except Exception as error:
+		if _http_status(error) == 404:
+			print(f"♻️  Gmail history {start} expired for project {project_id}; resetting sync state")
+		else:
+			print(f"⚠️ Gmail history sync failed for project {project_id} ({error}); falling back to a full fetch")
+		with state.lock:
+			state.clear()
+		return
+
+	with state.lock:
+		for thread_id in touched:
+			state.metadata.pop(thread_id, None)
+		if touched:
+			state.listing = None
+		for thread_id, message_ids in added.items():
+			entry = state.threads.get(thread_id)
+			if entry is not None:
+				entry.pending.update(mid for mid in message_ids if mid not in entry.messages)
+		for thread_id, message_ids in deleted.items():
+			entry = state.threads.get(thread_id)
+			if entry is not None:
+				for mid in message_ids:
+					entry.messages.pop(mid, None)
+					entry.pending.discard(mid)
+		if state.history_id is None or int(latest) > int(state.history_id):
+			state.history_id = latest
+		state.synced_at = time.monotonic()
+	touched.discard(None)
+	if touched:
+		print(f"🔄 Gmail history sync: {len(touched)} thread(s) changed for project {project_id}")
+		for listener in _change_listeners:
+			try:
+				listener(project_id, touched)
+			except Exception as e:
+				print(f"⚠️ Thread change listener failed: {e}")
+
+
+def fetch_thread(project_id: str, thread_id: str, service: Any, normalize: Callable[[Dict[str, Any]], Any]) -> List[Any]:
+	"""
+	Return the thread's messages (each passed through `normalize`) in chronological order.
+	Cached threads only fetch messages added since they were cached; others are fetched in full.
+	The history check is skipped if the project was synced in the last GMAIL_HISTORY_CHECK_SECONDS
+	(e.g. by the thread cache's check just before a miss).
+	"""
+	sync_history(project_id, service, max_age=_HISTORY_CHECK_SECONDS)
+	state = _state(project_id)
+	with state.lock:
+		entry = state.threads.get(thread_id)
+		pending = sorted(entry.pending) if entry is not None else []
+		if entry is not None:
+			state.threads.move_to_end(thread_id)
+
+	if entry is None:
+		thread = gmail_quota.execute(project_id, service.users().threads().get(userId='me', id=thread_id, format='full'), 'threads.get')
+		entry = _CachedThread()
+		for msg in thread.get('messages', []):
+			entry.messages[msg['id']] = (int(msg.get('internalDate') or 0), normalize(msg))
+		with state.lock:
+			state.threads[thread_id] = entry
+			while len(state.threads) > _MAX_THREADS:
+				state.threads.popitem(last=False)
+	elif pending:
+		fetched = []
+		for message_id in pending:
+			try:
+				msg = gmail_quota.execute(project_id, service.users().messages().get(userId='me', id=message_id, format='full'), 'messages.get')
+			except Exception as error:
+				if _http_status(error) == 404:  # deleted before we got to it
+					fetched.append((message_id, None))
+					continue
+				raise
+			fetched.append((message_id, msg))
+		with state.lock:
+			for message_id, msg in fetched:
+				entry.pending.discard(message_id)
+				if msg is not None:
+					entry.messages[message_id] = (int(msg.get('internalDate') or 0), normalize(msg))
+		print(f"🔄 Thread {thread_id}: fetched {len(pending)} new message(s) incrementally")
+
+	with state.lock:
+		return [normalized for _, normalized in sorted(entry.messages.values(), key=lambda item: item[0])]
+
+
+def cached_listing(project_id: str, key: Any) -> Optional[List[Dict[str, Any]]]:
+	"""Return the cached thread list for `key` if nothing in it changed since it was stored."""
+	state = _state(project_id)
+	with state.lock:
+		if state.listing is None or state.listing[0] != key:
+			return None
+		items = [state.metadata.get(tid) for tid in state.listing[1]]
+		if any(item is None for item in items):
+			return None
+		return [dict(item) for item in items]
+
+
+def cached_metadata(project_id: str, thread_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+	"""Return list-view metadata for the given threads that is still valid."""
+	state = _state(project_id)
+	with state.lock:
+		return {tid: dict(state.metadata[tid]) for tid in thread_ids if tid in state.metadata}
+
+
+def store_listing(project_id: str, key: Any, items: List[Dict[str, Any]]) -> None:
+	"""Remember a thread list and its per-thread metadata for the next incremental sync."""
+	state = _state(project_id)
+	with state.lock:
+		for item in items:
+			state.metadata[item['id']] = dict(item)
+			state.metadata.move_to_end(item['id'])
+		while len(state.metadata) > _MAX_THREADS:
+			state.metadata.popitem(last=False)
+		state.listing = (key, [item['id'] for item in items])
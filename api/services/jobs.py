@@ -0,0 +1,230 @@
+"""
+Background job runner for agent work (fetch -> draft -> persist).
+Jobs are submitted to a bounded thread pool so HTTP handlers can return a jobId immediately,
+and their status lives in a size-capped, TTL-evicting in-process store.
+"""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+import os
+import threading
+import time
+
+
+class QueueFullError(RuntimeError):
+	"""Raised when the job queue is at capacity and cannot accept more work."""
+
+
+def _env_int(name: str, default: int) -> int:
+	try:
+		return max(1, int(os.getenv(name, str(default))))
+	except ValueError:
+		return default
+
+
+AGENT_WORKERS = _env_int("AGENT_WORKERS", 4)
+AGENT_QUEUE_MAX = _env_int("AGENT_QUEUE_MAX", 100)
+JOB_STORE_MAX = _env_int("JOB_STORE_MAX", 1000)
+JOB_TTL_SECONDS = _env_int("JOB_TTL_SECONDS", 3600)
+BATCH_CONCURRENCY = _env_int("BATCH_CONCURRENCY", 5)
+BATCH_MAX_CONCURRENCY = _env_int("BATCH_MAX_CONCURRENCY", 10)
+BATCH_MAX_THREADS = _env_int("BATCH_MAX_THREADS", 50)
+
+_executor: ThreadPoolExecutor | None = None
+_batch_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+_pending = 0
+_pending_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+	global _executor
+	if _executor is None:
+		with _executor_lock:
+			if _executor is None:
+				_executor = ThreadPoolExecutor(max_workers=AGENT_WORKERS, thread_name_prefix="agent-job")
+	return _executor
+
+
+def _release(_: Future) -> None:
+	global _pending
+	with _pending_lock:
+		_pending -= 1
+
+
+def submit(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+	"""
+	Submit a job function to the worker pool.
+	Raises QueueFullError when AGENT_QUEUE_MAX jobs are already queued or running.
+	"""
+	global _pending
+	with _pending_lock:
+		if _pending >= AGENT_QUEUE_MAX:
+			raise QueueFullError(f"Job queue full ({AGENT_QUEUE_MAX} pending)")
+		_pending += 1
+	try:
+		future = _get_executor().submit(fn, *args, **kwargs)
+	except Exception:
+		with _pending_lock:
+			_pending -= 1
+		raise
+	future.add_done_callback(_release)
+	return future
+
+
+def _get_batch_executor() -> ThreadPoolExecutor:
+	# Long-lived, so batch workers keep their thread-local clients (Gmail service, HTTP) across batches.
+	# Sized for every job worker running a batch at full concurrency at once.
+	global _batch_executor
+	if _batch_executor is None:
+		with _executor_lock:
+			if _batch_executor is None:
+				_batch_executor = ThreadPoolExecutor(
+					max_workers=AGENT_WORKERS * BATCH_MAX_CONCURRENCY, thread_name_prefix="agent-batch"
+				)
+	return _batch_executor
+
+
+def run_bounded(fn: Callable[[Any], Any], items: Iterable[Any], concurrency: int) -> List[Any]:
+	"""
+	Run fn over items with at most `concurrency` calls in flight and wait for all of them.
+	Used by batch jobs to fan out work from inside a pool worker without starving the main pool.
+	Results are returned in input order; exceptions are returned in place of results.
+	"""
+	items = list(items)
+	if not items:
+		return []
+	slots = threading.BoundedSemaphore(max(1, min(concurrency, len(items))))
+	pool = _get_batch_executor()
+	futures = []
+	for item in items:
+		slots.acquire()
+		future = pool.submit(fn, item)
+		future.add_done_callback(lambda _: slots.release())
+		futures.append(future)
+	results: List[Any] = []
+	for future in futures:
+		try:
+			results.append(future.result())
+		except Exception as e:
+			results.append(e)
+	return results
+
+
+def pending_count() -> int:
+	"""Number of jobs currently queued or running."""
+	with _pending_lock:
+		return _pending
+
+
+def shutdown(wait: bool = True) -> None:
+	"""Stop accepting work and optionally wait for in-flight jobs to finish."""
+	global _executor, _batch_executor
+	with _executor_lock:
+		executor, _executor = _executor, None
+		batch_executor, _batch_executor = _batch_executor, None
+	# Job workers first: running batches still need the batch pool to finish their items
+	for pool in (executor, batch_executor):
+		if pool is not None:
+			pool.shutdown(wait=wait, cancel_futures=not wait)
+
+
+class _JobRecord:
+	"""Compact job record; serialized to the public job shape on read."""
+
+	__slots__ = ("status", "stage", "result", "error", "started_at", "finished_at", "touched_at")
+
+	def __init__(self, status: str, started_at: float) -> None:
+		self.status = status
+		self.stage: Optional[str] = None
+		self.result: Optional[Dict[str, Any]] = None
+		self.error: Optional[str] = None
+		self.started_at = started_at
+		self.finished_at: Optional[float] = None
+		self.touched_at = started_at
+
+	def to_dict(self) -> Dict[str, Any]:
+		data: Dict[str, Any] = {"status": self.status, "result": self.result, "started_at": self.started_at}
+		if self.stage is not None:
+			data["stage"] = self.stage
+		if self.error is not None:
+			data["error"] = self.error
+		if self.finished_at is not None:
+			data["finished_at"] = self.finished_at
+		return data
+
+
+class JobStore:
+	"""
+	Thread-safe job store with a size cap and TTL eviction.
+	Records are kept in least-recently-updated order; expired records are purged on every write
+	and the oldest record is dropped once max_items is reached.
+	"""
+
+	_FIELDS = ("status", "stage", "result", "error", "finished_at")
+
+	def __init__(self, max_items: int = JOB_STORE_MAX, ttl_seconds: float = JOB_TTL_SECONDS) -> None:
+		self.max_items = max_items
+		self.ttl_seconds = ttl_seconds
+		self._items: "OrderedDict[str, _JobRecord]" = OrderedDict()
+		self._lock = threading.Lock()
+
+	def create(self, job_id: str, status: str = "queued") -> None:
+		now = time.time()
+		with self._lock:
+			self._items[job_id] = _JobRecord(status, now)
+			self._items.move_to_end(job_id)
+			self._evict(now)
+
+	def update(self, job_id: str, **fields: Any) -> None:
+		"""Update fields on a job; a missing (evicted) job is recreated so late updates are not lost."""
+		now = time.time()
+		with self._lock:
+			record = self._items.get(job_id)
+			if record is None:
+				record = self._items[job_id] = _JobRecord(fields.get("status", "running"), now)
+			for name, value in fields.items():
+				if name not in self._FIELDS:
+					raise KeyError(f"Unknown job field: {name}")
+				setattr(record, name, value)
+			record.touched_at = now
+			self._items.move_to_end(job_id)
+			self._evict(now)
+
+	def put(self, job_id: str, data: Dict[str, Any]) -> None:
+		"""Insert a job from its public dict shape (e.g. a copy read back from Redis)."""
+		self.create(job_id, data.get("status", "done"))
+		self.update(job_id, **{k: v for k, v in data.items() if k in self._FIELDS})
+
+	def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+		now = time.time()
+		with self._lock:
+			record = self._items.get(job_id)
+			if record is None:
+				return None
+			if now - record.touched_at > self.ttl_seconds:
+				del self._items[job_id]
+				return None
+			return record.to_dict()
+
+	def pop(self, job_id: str) -> None:
+		with self._lock:
+			self._items.pop(job_id, None)
+
+	def __len__(self) -> int:
+		with self._lock:
+			return len(self._items)
+
+	def _evict(self, now: float) -> None:
+		# Oldest-touched records sit at the front
+		while self._items:
+			job_id, record = next(iter(self._items.items()))
+			if now - record.touched_at <= self.ttl_seconds and len(self._items) <= self.max_items:
+				break
+			del self._items[job_id]
+
+
+store = JobStore()
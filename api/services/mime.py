@@ -0,0 +1,187 @@
+"""
+Single-pass parser for Gmail API message resources.
+
+parse_message() walks a message payload once, builds a lowercase header map, picks the
+best text body (text/plain, else text/html converted to text) and decodes base64 only for
+that part. parse_thread() combines messages into a ParsedThread with subject and participants.
+"""
+
+from __future__ import annotations
+
+from email.utils import formataddr, getaddresses
+from html.parser import HTMLParser
+from typing import Any, Dict, List, Optional
+import base64
+import re
+
+
+NO_BODY = "[No readable content]"
+UNDECODABLE_BODY = "[Could not decode message body]"
+SEPARATOR = "-" * 80
+
+_ADDRESS_HEADERS = ("from", "to", "cc")
+
+
+class ParsedMessage:
+	__slots__ = ("id", "thread_id", "internal_date", "headers", "body")
+
+	def __init__(self, id: str, thread_id: str, internal_date: int, headers: Dict[str, str], body: str) -> None:
+		self.id = id
+		self.thread_id = thread_id
+		self.internal_date = internal_date
+		self.headers = headers
+		self.body = body
+
+	def header(self, name: str, default: str = "") -> str:
+		return self.headers.get(name.lower(), default)
+
+	@property
+	def subject(self) -> str:
+		return self.headers.get("subject", "No Subject")
+
+	@property
+	def sender(self) -> str:
+		return self.headers.get("from", "Unknown")
+
+	@property
+	def date(self) -> str:
+		return self.headers.get("date", "")
+
+	def addresses(self) -> List[str]:
+		"""From/To/Cc addresses of this message, formatted as 'Name <email>'."""
+		values = [self.headers[h] for h in _ADDRESS_HEADERS if h in self.headers]
+		return [formataddr((name, addr)) for name, addr in getaddresses(values) if addr]
+
+	def to_text(self) -> str:
+		"""Plain-text block used in prompts (From/Date/Subject, body, separator)."""
+		return "\n".join([
+			f"From: {self.sender}",
+			f"Date: {self.date}",
+			f"Subject: {self.subject}",
+			f"\n{self.body}\n",
+			SEPARATOR,
+		])
+
+
+class ParsedThread:
+	__slots__ = ("id", "messages", "error")
+
+	def __init__(self, id: str, messages: List[ParsedMessage], error: str | None = None) -> None:
+		self.id = id
+		self.messages = messages
+		# Set when the thread could not be fetched; to_text() then returns this message
+		self.error = error
+
+	@property
+	def subject(self) -> Optional[str]:
+		return self.messages[0].subject if self.messages else None
+
+	@property
+	def participants(self) -> List[str]:
+		"""Unique participants across the thread in order of first appearance (deduplicated by email)."""
+		seen: Dict[str, str] = {}
+		for message in self.messages:
+			for formatted in message.addresses():
+				key = getaddresses([formatted])[0][1].lower()
+				seen.setdefault(key, formatted)
+		return list(seen.values())
+
+	def to_text(self) -> str:
+		if self.error:
+			return self.error
+		if not self.messages:
+			return f"[Thread {self.id}] No messages found."
+		return "\n".join(message.to_text() for message in self.messages)
+
+
+def parse_message(msg: Dict[str, Any], with_body: bool = True) -> ParsedMessage:
+	"""Parse one Gmail message resource; pass with_body=False for format='metadata'."""
+	payload = msg.get("payload", {})
+	headers: Dict[str, str] = {}
+	for h in payload.get("headers", []):
+		headers.setdefault(h["name"].lower(), h["value"])
+
+	return ParsedMessage(
+		id=msg.get("id", ""),
+		thread_id=msg.get("threadId", ""),
+		internal_date=int(msg.get("internalDate") or 0),
+		headers=headers,
+		body=_best_body(payload) if with_body else "",
+	)
+
+
+def parse_thread(thread: Dict[str, Any]) -> ParsedThread:
+	"""Parse a Gmail thread resource; messages keep Gmail's chronological order."""
+	return ParsedThread(thread.get("id", ""), [parse_message(m) for m in thread.get("messages", [])])
+
+
+def _best_body(payload: Dict[str, Any]) -> str:
+	# Walk the MIME tree once (depth-first, document order) remembering the first
+	# text/plain and text/html parts; only the chosen one is decoded.
+	plain = html = None
+	stack = [payload]
+	while stack:
+		part = stack.pop()
+		children = part.get("parts")
+		if children:
+			stack.extend(reversed(children))
+			continue
+		if "data" not in part.get("body", {}):
+			continue
+		mime_type = part.get("mimeType", "")
+		if mime_type == "text/plain" or (not mime_type and part is payload):
+			plain = part
+			break
+		if mime_type == "text/html" and html is None:
+			html = part
+
+	chosen = plain or html
+	if chosen is None:
+		return NO_BODY
+	try:
+		text = _decode(chosen["body"]["data"])
+	except Exception as e:
+		print(f"Error decoding body: {e}")
+		return UNDECODABLE_BODY
+	return text if chosen is plain else html_to_text(text)
+
+
+def _decode(data: str) -> str:
+	return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4)).decode("utf-8", errors="replace")
+
+
+class _TextExtractor(HTMLParser):
+	_BLOCK_TAGS = {"p", "div", "br", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6", "blockquote"}
+	_SKIP_TAGS = {"script", "style", "head"}
+
+	def __init__(self) -> None:
+		super().__init__(convert_charrefs=True)
+		self.chunks: List[str] = []
+		self._skip = 0
+
+	def handle_starttag(self, tag: str, attrs: Any) -> None:
+		if tag in self._SKIP_TAGS:
+			self._skip += 1
+		elif tag in self._BLOCK_TAGS:
+			self.chunks.append("\n")
+
+	def handle_endtag(self, tag: str) -> None:
+		if tag in self._SKIP_TAGS and self._skip:
+			self._skip -= 1
+		elif tag in self._BLOCK_TAGS:
+			self.chunks.append("\n")
+
+	def handle_data(self, data: str) -> None:
+		if not self._skip:
+			self.chunks.append(data)
+
+
+def html_to_text(html: str) -> str:
+	"""Cheap HTML to plain-text conversion (drops scripts/styles, keeps block breaks)."""
+	parser = _TextExtractor()
+	parser.feed(html)
+	parser.close()
+	text = "".join(parser.chunks)
+	text = re.sub(r"[ \t\r\f\v]+", " ", text)
+	text = re.sub(r" *\n *", "\n", text)
+	return re.sub(r"\n{3,}", "\n\n", text).strip()
@@ -0,0 +1,21 @@
+"""
+Cheap availability checks for optional SDKs.
+
+importlib.util.find_spec locates a module without executing it, so the *_AVAILABLE flags
+can be computed at import time while the SDK itself is only imported on first use.
+"""
+
+from __future__ import annotations
+
+import importlib.util
+
+
+def available(*modules: str) -> bool:
+	"""True if every module can be imported (none of them is actually imported)."""
+	for name in modules:
+		try:
+			if importlib.util.find_spec(name) is None:
+				return False
+		except (ImportError, ValueError):
+			return False
+	return True
@@ -5,21 +5,51 @@ These are minimal, network-optional stubs suitable for a scaffold.
 
 from __future__ import annotations
 
-from typing import Any, Dict, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 import json
 import os
-import urllib.request
+import threading
+
+# Shared pooled HTTP session for Supabase REST (keep-alive + TLS reuse)
+try:
+	from api.services import supabase_rest  # type: ignore
+except Exception:
+	try:
+		from services import supabase_rest  # type: ignore
+	except Exception:
+		supabase_rest = None  # type: ignore
 
 
-def _http_post_json(url: str, payload: Dict[str, Any], headers: Dict[str, str], timeout_seconds: float = 5.0) -> Dict[str, Any] | None:
-	data = json.dumps(payload).encode("utf-8")
-	req = urllib.request.Request(url=url, data=data, headers=headers, method="POST")
-	with urllib.request.urlopen(req, timeout=timeout_seconds) as resp:
-		body = resp.read().decode("utf-8")
-		try:
-			return json.loads(body)
-		except json.JSONDecodeError:
-			return {"raw": body}
+# Pooled httpx.AsyncClient per upstream for the async variants
+try:
+	from api.services import async_http  # type: ignore
+except Exception:
+	try:
+		from services import async_http  # type: ignore
+	except Exception:
+		async_http = None  # type: ignore
+
+
+# Local full-text thread index (SQLite FTS5)
+try:
+	from api.services import thread_index  # type: ignore
+except Exception:
+	try:
+		from services import thread_index  # type: ignore
+	except Exception:
+		thread_index = None  # type: ignore
+
+
+try:
+	from api.services.write_behind import PermanentFlushError, WriteBehindBuffer  # type: ignore
+except Exception:
+	from services.write_behind import PermanentFlushError, WriteBehindBuffer  # type: ignore
+
+
+def _supabase_session() -> Any:
+	if supabase_rest is None:
+		raise RuntimeError("Supabase REST helper not available")
+	return supabase_rest.get_session()
 
 
 def _upstash_base() -> Tuple[str, str]:
@@ -28,263 +58,362 @@ def _upstash_base() -> Tuple[str, str]:
 	return base_url, token
 
 
-def redis_get_json(key: str) -> Optional[Dict[str, Any]]:
+_upstash_session_obj: Any = None
+_upstash_session_lock = threading.Lock()
+
+
+def _upstash_session() -> Any:
+	"""Pooled keep-alive session for Upstash REST (separate pool from Supabase)."""
+	global _upstash_session_obj
+	if _upstash_session_obj is None:
+		with _upstash_session_lock:
+			if _upstash_session_obj is None:
+				import requests
+				from requests.adapters import HTTPAdapter
+				session = requests.Session()
+				session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=int(os.getenv("UPSTASH_HTTP_POOL_SIZE", "20"))))
+				_upstash_session_obj = session
+	return _upstash_session_obj
+
+
+def redis_pipeline(commands: List[List[str]], timeout_seconds: float = 5.0) -> Optional[List[Any]]:
 	"""
-	Read a JSON value from Upstash Redis via pipeline GET.
-	Returns parsed JSON or None if not found/error.
+	Send several Redis commands to Upstash in a single /pipeline request.
+	Returns one result per command (None for commands that errored), or None if
+	Redis is not configured or the request failed.
 	"""
 	base_url, token = _upstash_base()
-	if not base_url or not token:
+	if not base_url or not token or not commands:
 		return None
-	url = f"{base_url}/pipeline"
 	headers = {
 		"Content-Type": "application/json",
 		"Authorization": f"Bearer {token}",
 	}
-	payload = {"commands": [{"command": "GET", "args": [key]}]}
 	try:
-		resp = _http_post_json(url, payload, headers) or {}
-		# Upstash pipeline returns e.g. {"result":[{"result":"..."}]}
-		results = (resp.get("result") or [])
-		if not results:
-			return None
-		raw = results[0].get("result")
-		if not raw:
-			return None
-		return json.loads(raw)
-	except Exception:
+		resp = _upstash_session().post(f"{base_url}/pipeline", headers=headers, json=commands, timeout=timeout_seconds)
+		resp.raise_for_status()
+		# Upstash pipeline returns [{"result": ...} | {"error": ...}, ...]
+		items = resp.json()
+		if isinstance(items, dict):
+			items = items.get("result") or []
+		return [item.get("result") if isinstance(item, dict) else None for item in items]
+	except Exception as e:
+		print(f"⚠️ Upstash pipeline failed: {e}")
 		return None
 
 
-def redis_setex_json(key: str, ttl_seconds: int, value: Dict[str, Any]) -> bool:
-	"""
-	Write a JSON value to Upstash Redis with TTL.
-	"""
+async def redis_pipeline_async(commands: List[List[str]], timeout_seconds: float = 5.0) -> Optional[List[Any]]:
+	"""Async counterpart of redis_pipeline over a pooled httpx.AsyncClient."""
 	base_url, token = _upstash_base()
-	if not base_url or not token:
-		return False
-	url = f"{base_url}/pipeline"
+	if not base_url or not token or not commands or async_http is None:
+		return None
 	headers = {
 		"Content-Type": "application/json",
 		"Authorization": f"Bearer {token}",
 	}
-	payload = {
-		"commands": [
-			{"command": "SETEX", "args": [key, str(ttl_seconds), json.dumps(value, separators=(',', ':'))]},
-		]
-	}
 	try:
-		_http_post_json(url, payload, headers)
+		client = async_http.get_client("upstash", int(os.getenv("UPSTASH_HTTP_POOL_SIZE", "20")))
+		resp = await client.post(f"{base_url}/pipeline", headers=headers, json=commands, timeout=timeout_seconds)
+		async_http.raise_for_status(resp)
+		items = resp.json()
+		if isinstance(items, dict):
+			items = items.get("result") or []
+		return [item.get("result") if isinstance(item, dict) else None for item in items]
+	except Exception as e:
+		print(f"⚠️ Upstash pipeline failed: {e}")
+		return None
+
+
+def _loads(raw: Any) -> Optional[Dict[str, Any]]:
+	if not raw:
+		return None
+	try:
+		return json.loads(raw)
+	except (TypeError, json.JSONDecodeError):
+		return None
+
+
+def _dumps(value: Dict[str, Any]) -> str:
+	return json.dumps(value, separators=(',', ':'))
+
+
+def redis_get_json(key: str) -> Optional[Dict[str, Any]]:
+	"""
+	Read a JSON value from Upstash Redis via pipeline GET.
+	Returns parsed JSON or None if not found/error.
+	"""
+	results = redis_pipeline([["GET", key]])
+	return _loads(results[0]) if results else None
+
+
+def redis_mget_json(keys: List[str]) -> Dict[str, Dict[str, Any]]:
+	"""
+	Read many JSON values in one round-trip (MGET).
+	Returns a dict of key -> parsed value for the keys that were found.
+	"""
+	if not keys:
+		return {}
+	results = redis_pipeline([["MGET", *keys]])
+	if not results or not isinstance(results[0], list):
+		return {}
+	found: Dict[str, Dict[str, Any]] = {}
+	for key, raw in zip(keys, results[0]):
+		value = _loads(raw)
+		if value is not None:
+			found[key] = value
+	return found
+
+
+async def redis_get_json_async(key: str) -> Optional[Dict[str, Any]]:
+	results = await redis_pipeline_async([["GET", key]])
+	return _loads(results[0]) if results else None
+
+
+async def redis_mget_json_async(keys: List[str]) -> Dict[str, Dict[str, Any]]:
+	if not keys:
+		return {}
+	results = await redis_pipeline_async([["MGET", *keys]])
+	if not results or not isinstance(results[0], list):
+		return {}
+	return {key: value for key, value in ((k, _loads(raw)) for k, raw in zip(keys, results[0])) if value is not None}
+
+
+def redis_setex_json(key: str, ttl_seconds: int, value: Dict[str, Any]) -> bool:
+	"""
+	Write a JSON value to Upstash Redis with TTL.
+	"""
+	return redis_pipeline([["SETEX", key, str(ttl_seconds), _dumps(value)]]) is not None
+
+
+def redis_msetex_json(items: Dict[str, Dict[str, Any]], ttl_seconds: int) -> bool:
+	"""
+	Write many JSON values with the same TTL in one pipeline request.
+	"""
+	if not items:
 		return True
-	except Exception:
-		return False
+	commands = [["SETEX", key, str(ttl_seconds), _dumps(value)] for key, value in items.items()]
+	return redis_pipeline(commands) is not None
+
 
+def _job_key(job_key: str) -> str:
+	return f"{os.getenv('REDIS_PREFIX', 'emailreply')}:job:{job_key}"
 
-def write_job_to_redis(job_key: str, value: Dict[str, Any]) -> bool:
+
+def write_job_to_redis(job_key: str, value: Dict[str, Any], ttl_seconds: int | None = None) -> bool:
 	"""
 	Write job result to Upstash Redis via REST API if configured.
+	With ttl_seconds the key expires (SETEX) so finished jobs do not accumulate in Redis.
 	Returns True on best-effort success, False otherwise.
 	"""
-	base_url, token = _upstash_base()
-	if not base_url or not token:
-		return False
+	if ttl_seconds:
+		return redis_setex_json(_job_key(job_key), ttl_seconds, value)
+	return redis_pipeline([["SET", _job_key(job_key), _dumps(value)]]) is not None
 
-	url = f"{base_url}/pipeline"
-	headers = {
-		"Content-Type": "application/json",
-		"Authorization": f"Bearer {token}",
-	}
-	key = f"{os.getenv('REDIS_PREFIX', 'emailreply')}:job:{job_key}"
-	payload = {
-		"commands": [
-			{"command": "SET", "args": [key, json.dumps(value, separators=(',', ':'))]},
-		]
+
+def read_job_from_redis(job_key: str) -> Optional[Dict[str, Any]]:
+	"""
+	Read a job previously written by write_job_to_redis.
+	Returns None if Redis is not configured, the key expired, or on error.
+	"""
+	return redis_get_json(_job_key(job_key))
+
+
+async def read_job_from_redis_async(job_key: str) -> Optional[Dict[str, Any]]:
+	return await redis_get_json_async(_job_key(job_key))
+
+
+async def read_jobs_from_redis_async(job_keys: List[str]) -> Dict[str, Dict[str, Any]]:
+	"""Read many jobs in one round-trip. Returns a dict of job_key -> job for those found."""
+	found = await redis_mget_json_async([_job_key(k) for k in job_keys])
+	return {k: found[_job_key(k)] for k in job_keys if _job_key(k) in found}
+
+
+def _message_record(project_id: str, message: Dict[str, Any]) -> Dict[str, Any]:
+	return {
+		"project_id": project_id,  # Will be mapped to UUID in a real multi-project setup
+		"role": message.get("role", "assistant"),
+		"content": message.get("content", ""),
+		"meta": message.get("meta", {}),
 	}
-	try:
-		_http_post_json(url, payload, headers)
-		return True
-	except Exception:
-		return False
 
 
-def persist_message_to_supabase(project_id: str, message: Dict[str, Any]) -> bool:
+def persist_messages_to_supabase(records: List[Dict[str, Any]]) -> bool:
 	"""
-	Persist a message to Supabase emailreply.messages table.
+	Bulk insert message records into emailreply.messages in one array POST (return=minimal).
+	Returns True on success (or when Supabase is not configured, so callers do not retry),
+	False on a retryable HTTP error (5xx, 408, 429). Other 4xx responses mean the rows were
+	rejected and raise PermanentFlushError, so the write-behind buffer does not retry them.
 	"""
-	try:
-		import requests
-		base_url = os.getenv("SUPABASE_URL") or os.getenv("NEXT_PUBLIC_SUPABASE_URL")
-		service_key = os.getenv("SUPABASE_SERVICE_ROLE")
-		
-		if not base_url or not service_key:
-			print("⚠️ Supabase URL or service role key not configured")
-			return False
-		
-		url = f"{base_url.rstrip('/')}/rest/v1/messages"
-		headers = {
-			"apikey": service_key,
-			"Authorization": f"Bearer {service_key}",
-			"Content-Type": "application/json",
-			"Prefer": "return=representation",
-		}
-		
-		# Build message record
-		record = {
-			"project_id": project_id,  # Will be mapped to UUID in a real multi-project setup
-			"role": message.get("role", "assistant"),
-			"content": message.get("content", ""),
-			"meta": message.get("meta", {}),
-		}
-		
-		resp = requests.post(url, headers=headers, json=record, timeout=10)
-		if resp.status_code >= 400:
-			print(f"⚠️ Failed to persist message to Supabase: {resp.status_code} {resp.text}")
-			return False
-		
-		print(f"✅ Message persisted to Supabase: {resp.json()}")
+	if not records:
 		return True
-		
-	except Exception as e:
-		print(f"⚠️ Error persisting message to Supabase: {e}")
+	base_url = os.getenv("SUPABASE_URL") or os.getenv("NEXT_PUBLIC_SUPABASE_URL")
+	service_key = os.getenv("SUPABASE_SERVICE_ROLE")
+	if not base_url or not service_key:
+		print(f"⚠️ Supabase not configured; skipping {len(records)} message(s)")
+		return True
+
+	url = f"{base_url.rstrip('/')}/rest/v1/messages"
+	headers = {
+		"apikey": service_key,
+		"Authorization": f"Bearer {service_key}",
+		"Content-Type": "application/json",
+		"Prefer": "return=minimal",
+	}
+	resp = _supabase_session().post(url, headers=headers, json=records, timeout=10)
+	if resp.status_code >= 400:
+		print(f"⚠️ Failed to persist {len(records)} message(s) to Supabase: {resp.status_code} {resp.text}")
+		if resp.status_code < 500 and resp.status_code not in (408, 429):
+			raise PermanentFlushError(f"Supabase rejected {len(records)} message(s): {resp.status_code}")
 		return False
+	print(f"✅ Persisted {len(records)} message(s) to Supabase")
+	return True
+
 
+_message_buffer = WriteBehindBuffer(
+	persist_messages_to_supabase,
+	batch_size=int(os.getenv("MESSAGE_WRITE_BATCH_SIZE", "50")),
+	flush_interval=float(os.getenv("MESSAGE_WRITE_FLUSH_SECONDS", "1.0")),
+	max_retries=int(os.getenv("MESSAGE_WRITE_MAX_RETRIES", "3")),
+	name="supabase-messages",
+)
 
-def get_dashboard_stats(project_id: str = "default") -> Dict[str, Any]:
+
+def enqueue_message_to_supabase(project_id: str, message: Dict[str, Any]) -> bool:
 	"""
-	Get dashboard statistics via RPC function.
+	Queue a message for write-behind persistence; returns without touching the network.
+	Rows are flushed in bulk by a background thread (size- or time-triggered).
 	"""
+	return _message_buffer.enqueue(_message_record(project_id, message))
+
+
+def drain_message_buffer(timeout: float = 10.0) -> None:
+	"""Flush queued messages and stop the background writer (call on shutdown)."""
+	_message_buffer.drain(timeout)
+
+
+def _rpc_target(name: str) -> Tuple[str, Dict[str, str]]:
+	"""URL and headers for a Supabase RPC function (raises if Supabase is not configured)."""
+	base_url = os.getenv("SUPABASE_URL") or os.getenv("NEXT_PUBLIC_SUPABASE_URL")
+	service_key = os.getenv("SUPABASE_SERVICE_ROLE")
+	
+	if not base_url or not service_key:
+		raise RuntimeError("Supabase not configured")
+	
+	url = f"{base_url.rstrip('/')}/rest/v1/rpc/{name}"
+	headers = {
+		"apikey": service_key,
+		"Authorization": f"Bearer {service_key}",
+		"Content-Type": "application/json",
+	}
+	return url, headers
+
+
+def _default_dashboard_stats() -> Dict[str, Any]:
+	return {
+		"repliesGenerated": 0,
+		"successRate": 100,
+		"avgDraftLength": 0,
+		"timeSavedMinutes": 0,
+		"activeProjects": 1,
+	}
+
+
+def _recent_drafts_body(project_id: str, limit: int, before: Tuple[str, str] | None) -> Dict[str, Any]:
+	return {
+		"p_project_id": project_id,
+		"p_limit": limit,
+		"p_before_created_at": before[0] if before else None,
+		"p_before_id": before[1] if before else None,
+	}
+
+
+def _format_recent_draft(d: Dict[str, Any]) -> Dict[str, Any]:
+	return {
+		"id": d["id"],
+		"subject": d["subject"],
+		"snippet": d["snippet"],
+		"threadId": d["thread_id"],
+		"tone": d["tone"],
+		"createdAt": d["created_at"],
+	}
+
+
+def _format_draft(d: Dict[str, Any]) -> Dict[str, Any]:
+	return {
+		"id": d["id"],
+		"subject": d["subject"],
+		"content": d["content"],
+		"threadId": d["thread_id"],
+		"tone": d["tone"],
+		"length": d["length"],
+		"bullets": d["bullets"],
+		"createdAt": d["created_at"],
+	}
+
+
+# --- Dashboard reads (Supabase RPC functions, called from the async API routes) ---
+
+async def _rpc_async(name: str, body: Dict[str, Any]) -> Any:
+	if supabase_rest is None:
+		raise RuntimeError("Supabase REST helper not available")
+	url, headers = _rpc_target(name)
+	resp = await supabase_rest.get_async_client().post(url, headers=headers, json=body)
+	async_http.raise_for_status(resp)
+	return resp.json()
+
+
+async def get_dashboard_stats_async(project_id: str = "default") -> Dict[str, Any]:
+	"""Dashboard statistics via the get_dashboard_stats RPC (defaults on error)."""
 	try:
-		import requests
-		base_url = os.getenv("SUPABASE_URL") or os.getenv("NEXT_PUBLIC_SUPABASE_URL")
-		service_key = os.getenv("SUPABASE_SERVICE_ROLE")
-		
-		if not base_url or not service_key:
-			raise RuntimeError("Supabase not configured")
-		
-		url = f"{base_url.rstrip('/')}/rest/v1/rpc/get_dashboard_stats"
-		headers = {
-			"apikey": service_key,
-			"Authorization": f"Bearer {service_key}",
-			"Content-Type": "application/json",
-		}
-		body = {"p_project_id": project_id}
-		
-		resp = requests.post(url, headers=headers, json=body, timeout=10)
-		resp.raise_for_status()
-		
-		return resp.json()
-		
+		return await _rpc_async("get_dashboard_stats", {"p_project_id": project_id})
 	except Exception as e:
 		print(f"Error fetching dashboard stats: {e}")
-		# Return default values on error
-		return {
-			"repliesGenerated": 0,
-			"successRate": 100,
-			"avgDraftLength": 0,
-			"timeSavedMinutes": 0,
-			"activeProjects": 1,
-		}
+		return _default_dashboard_stats()
 
 
-def get_recent_drafts(project_id: str = "default", limit: int = 10) -> list:
+async def get_recent_drafts_async(project_id: str = "default", limit: int = 10, before: Tuple[str, str] | None = None) -> list:
 	"""
-	Get recent drafts via RPC function.
+	Recent drafts (newest first) via the keyset-paginated RPC function.
+	`before` is the (created_at, id) of the last draft of the previous page.
 	"""
 	try:
-		import requests
-		base_url = os.getenv("SUPABASE_URL") or os.getenv("NEXT_PUBLIC_SUPABASE_URL")
-		service_key = os.getenv("SUPABASE_SERVICE_ROLE")
-		
-		if not base_url or not service_key:
-			raise RuntimeError("Supabase not configured")
-		
-		url = f"{base_url.rstrip('/')}/rest/v1/rpc/get_recent_drafts"
-		headers = {
-			"apikey": service_key,
-			"Authorization": f"Bearer {service_key}",
-			"Content-Type": "application/json",
-		}
-		body = {"p_project_id": project_id, "p_limit": limit}
-		
-		resp = requests.post(url, headers=headers, json=body, timeout=10)
-		resp.raise_for_status()
-		
-		drafts = resp.json()
-		
-		# Format response
-		return [
-			{
-				"id": d["id"],
-				"subject": d["subject"],
-				"snippet": d["snippet"],
-				"threadId": d["thread_id"],
-				"tone": d["tone"],
-				"createdAt": d["created_at"],
-			}
-			for d in drafts
-		]
-		
+		drafts = await _rpc_async("get_recent_drafts_page", _recent_drafts_body(project_id, limit, before))
+		return [_format_recent_draft(d) for d in drafts]
 	except Exception as e:
 		print(f"Error fetching recent drafts: {e}")
 		return []
 
 
-def get_draft_by_id(draft_id: str) -> Optional[Dict[str, Any]]:
-	"""
-	Get a specific draft by ID via RPC function.
-	"""
+async def get_draft_by_id_async(draft_id: str) -> Optional[Dict[str, Any]]:
+	"""A single draft by UUID via RPC (None if missing, invalid or on error)."""
 	try:
-		import requests
 		from uuid import UUID
-		
-		# Validate UUID
 		UUID(draft_id)
-		
-		base_url = os.getenv("SUPABASE_URL") or os.getenv("NEXT_PUBLIC_SUPABASE_URL")
-		service_key = os.getenv("SUPABASE_SERVICE_ROLE")
-		
-		if not base_url or not service_key:
-			raise RuntimeError("Supabase not configured")
-		
-		url = f"{base_url.rstrip('/')}/rest/v1/rpc/get_draft_by_id"
-		headers = {
-			"apikey": service_key,
-			"Authorization": f"Bearer {service_key}",
-			"Content-Type": "application/json",
-		}
-		body = {"p_draft_id": draft_id}
-		
-		resp = requests.post(url, headers=headers, json=body, timeout=10)
-		resp.raise_for_status()
-		
-		drafts = resp.json()
-		if not drafts:
-			return None
-		
-		d = drafts[0]
-		return {
-			"id": d["id"],
-			"subject": d["subject"],
-			"content": d["content"],
-			"threadId": d["thread_id"],
-			"tone": d["tone"],
-			"length": d["length"],
-			"bullets": d["bullets"],
-			"createdAt": d["created_at"],
-		}
-		
+		drafts = await _rpc_async("get_draft_by_id", {"p_draft_id": draft_id})
+		return _format_draft(drafts[0]) if drafts else None
 	except Exception as e:
 		print(f"Error fetching draft by ID: {e}")
 		return None
 
 
-
 def persist_gmail_thread_index(profile_id: str, normalized_thread: Dict[str, Any]) -> bool:
 	"""
-	Best-effort stub for storing thread index into emailreply.gmail_threads.
-	Fields: subject, participants, snippet, updated_at.
+	Best-effort write of a normalized thread into the local full-text thread index.
+	Fields: subject, participants, snippet, body (joined message text), updated_at.
 	"""
-	_ = profile_id, normalized_thread
-	return False
+	if thread_index is None:
+		return False
+	messages = normalized_thread.get("messages")
+	body = "\n".join(m.get("text") or "" for m in messages) if messages else None
+	return thread_index.upsert_thread(
+		profile_id,
+		normalized_thread["id"],
+		subject=normalized_thread.get("subject"),
+		sender=normalized_thread.get("from"),
+		participants=normalized_thread.get("participants") or None,
+		snippet=normalized_thread.get("snippet"),
+		body=body,
+		date=normalized_thread.get("date"),
+	)
 
 
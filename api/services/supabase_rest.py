@@ -1,12 +1,46 @@
 """
 Minimal Supabase REST helpers to force schema-qualified access.
+All calls share one pooled requests.Session (keep-alive + TLS reuse; async callers use a
+pooled httpx.AsyncClient), and the access strategy that works on this deployment is
+remembered so later calls go straight to it.
 """
 
 from __future__ import annotations
 
-from typing import Any, Dict, Optional
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 import os
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+
+try:
+	from api.services import async_http  # type: ignore
+except Exception:
+	from services import async_http  # type: ignore
+
+
+_SESSION: Optional[requests.Session] = None
+_SESSION_LOCK = threading.Lock()
+
+
+def get_session() -> requests.Session:
+	"""Return the module-level pooled session used for all Supabase REST traffic."""
+	global _SESSION
+	if _SESSION is None:
+		with _SESSION_LOCK:
+			if _SESSION is None:
+				pool_size = int(os.getenv("SUPABASE_HTTP_POOL_SIZE", "20"))
+				session = requests.Session()
+				adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+				session.mount("https://", adapter)
+				session.mount("http://", adapter)
+				_SESSION = session
+	return _SESSION
+
+
+def get_async_client() -> Any:
+	"""Pooled httpx.AsyncClient for Supabase REST on the running event loop."""
+	return async_http.get_client("supabase", int(os.getenv("SUPABASE_HTTP_POOL_SIZE", "20")))
 
 
 def _get_base_headers() -> Dict[str, str]:
@@ -20,6 +54,68 @@ def _get_base_headers() -> Dict[str, str]:
 	}
 
 
+def _raise_for_status(resp: Any) -> None:
+	if resp.status_code >= 400:
+		raise requests.HTTPError(f"{resp.status_code} {resp.reason}: {resp.text}", response=resp)
+
+
+# Sticky strategy selection: remember which access path works and try it first.
+# On an error the remaining strategies are re-probed and the winner becomes the new default.
+_strategy_lock = threading.Lock()
+_sticky_strategy: Dict[str, Optional[str]] = {"select": None, "upsert": None}
+
+
+def _strategy_order(kind: str, names: List[str]) -> Tuple[Optional[str], List[str]]:
+	with _strategy_lock:
+		preferred = _sticky_strategy.get(kind)
+	order = list(names)
+	if preferred in names:
+		order.remove(preferred)
+		order.insert(0, preferred)
+	return preferred, order
+
+
+def _remember_strategy(kind: str, name: Optional[str], preferred: Optional[str]) -> None:
+	if name != preferred:
+		if name:
+			print(f"🔀 Supabase {kind} strategy: {name}")
+		with _strategy_lock:
+			_sticky_strategy[kind] = name
+
+
+def _run_strategies(kind: str, strategies: Dict[str, Callable[[], Any]]) -> Any:
+	preferred, order = _strategy_order(kind, list(strategies))
+	last_error: Exception | None = None
+	for name in order:
+		try:
+			result = strategies[name]()
+		except Exception as e:
+			last_error = e
+			continue
+		_remember_strategy(kind, name, preferred)
+		return result
+
+	_remember_strategy(kind, None, preferred)
+	raise last_error or RuntimeError(f"No Supabase {kind} strategy available")
+
+
+async def _arun_strategies(kind: str, strategies: Dict[str, Callable[[], Awaitable[Any]]]) -> Any:
+	"""Async counterpart of _run_strategies (shares the sticky strategy state)."""
+	preferred, order = _strategy_order(kind, list(strategies))
+	last_error: Exception | None = None
+	for name in order:
+		try:
+			result = await strategies[name]()
+		except Exception as e:
+			last_error = e
+			continue
+		_remember_strategy(kind, name, preferred)
+		return result
+
+	_remember_strategy(kind, None, preferred)
+	raise last_error or RuntimeError(f"No Supabase {kind} strategy available")
+
+
 def select_oauth_token(project_id: str, provider: str = "google") -> Optional[Dict[str, Any]]:
 	cfg = _get_base_headers()
 	params = {
@@ -28,71 +124,117 @@ def select_oauth_token(project_id: str, provider: str = "google") -> Optional[Di
 		"provider": f"eq.{provider}",
 		"limit": "1",
 	}
+
+	def _first(resp: requests.Response) -> Optional[Dict[str, Any]]:
+		_raise_for_status(resp)
+		items = resp.json()
+		return items[0] if isinstance(items, list) and items else None
+
 	# Strategy 1: default path + Accept-Profile
-	url_1 = f"{cfg['base_url']}/rest/v1/oauth_tokens"
-	headers_1 = {
+	def _profile() -> Optional[Dict[str, Any]]:
+		headers = {
+			"apikey": cfg["apikey"],
+			"Authorization": f"Bearer {cfg['apikey']}",
+			"Accept": "application/json",
+			"Accept-Profile": "emailreply",
+		}
+		return _first(get_session().get(f"{cfg['base_url']}/rest/v1/oauth_tokens", headers=headers, params=params, timeout=10))
+
+	# Strategy 2: schema-qualified path (for older PostgREST)
+	def _qualified() -> Optional[Dict[str, Any]]:
+		headers = {
+			"apikey": cfg["apikey"],
+			"Authorization": f"Bearer {cfg['apikey']}",
+			"Accept": "application/json",
+		}
+		return _first(get_session().get(f"{cfg['base_url']}/rest/v1/emailreply.oauth_tokens", headers=headers, params=params, timeout=10))
+
+	# Strategy 3: RPC via public schema
+	return _run_strategies("select", {
+		"profile": _profile,
+		"qualified": _qualified,
+		"rpc": lambda: _rpc_select_oauth_token(project_id, provider),
+	})
+
+
+async def select_oauth_token_async(project_id: str, provider: str = "google") -> Optional[Dict[str, Any]]:
+	"""Async counterpart of select_oauth_token over the shared httpx.AsyncClient."""
+	cfg = _get_base_headers()
+	client = get_async_client()
+	params = {
+		"select": "*",
+		"project_id": f"eq.{project_id}",
+		"provider": f"eq.{provider}",
+		"limit": "1",
+	}
+	headers = {
 		"apikey": cfg["apikey"],
 		"Authorization": f"Bearer {cfg['apikey']}",
 		"Accept": "application/json",
-		"Accept-Profile": "emailreply",
 	}
-	try:
-		resp = requests.get(url_1, headers=headers_1, params=params, timeout=10)
-		if resp.status_code >= 400:
-			# Try RPC fallback before failing
-			try:
-				return _rpc_select_oauth_token(project_id, provider)
-			except Exception:
-				raise requests.HTTPError(f"{resp.status_code} {resp.reason}: {resp.text}", response=resp)
+
+	def _first(resp: Any) -> Optional[Dict[str, Any]]:
+		_raise_for_status(resp)
 		items = resp.json()
 		return items[0] if isinstance(items, list) and items else None
-	except Exception as e:
-		# Strategy 2: schema-qualified path (for older PostgREST)
-		url_2 = f"{cfg['base_url']}/rest/v1/emailreply.oauth_tokens"
-		headers_2 = {
-			"apikey": cfg["apikey"],
-			"Authorization": f"Bearer {cfg['apikey']}",
-			"Accept": "application/json",
-		}
-		resp2 = requests.get(url_2, headers=headers_2, params=params, timeout=10)
-		if resp2.status_code >= 400:
-			# RPC fallback
-			return _rpc_select_oauth_token(project_id, provider)
-		items2 = resp2.json()
-		return items2[0] if isinstance(items2, list) and items2 else None
+
+	async def _profile() -> Optional[Dict[str, Any]]:
+		return _first(await client.get(f"{cfg['base_url']}/rest/v1/oauth_tokens", headers={**headers, "Accept-Profile": "emailreply"}, params=params))
+
+	async def _qualified() -> Optional[Dict[str, Any]]:
+		return _first(await client.get(f"{cfg['base_url']}/rest/v1/emailreply.oauth_tokens", headers=headers, params=params))
+
+	async def _rpc() -> Optional[Dict[str, Any]]:
+		resp = await client.post(
+			f"{cfg['base_url']}/rest/v1/rpc/get_oauth_token",
+			headers={**headers, "Content-Type": "application/json"},
+			json={"p_project_id": project_id, "p_provider": provider},
+		)
+		_raise_for_status(resp)
+		data = resp.json()
+		if isinstance(data, list):
+			return data[0] if data else None
+		return data if isinstance(data, dict) else None
+
+	return await _arun_strategies("select", {"profile": _profile, "qualified": _qualified, "rpc": _rpc})
 
 
 def upsert_oauth_token(record: Dict[str, Any]) -> Dict[str, Any]:
 	cfg = _get_base_headers()
 	body = [record]
+
+	def _first(resp: requests.Response) -> Dict[str, Any]:
+		_raise_for_status(resp)
+		items = resp.json()
+		return items[0] if isinstance(items, list) and items else record
+
 	# Strategy 1: default path + Content-Profile
-	url_1 = f"{cfg['base_url']}/rest/v1/oauth_tokens"
-	headers_1 = {
-		"apikey": cfg["apikey"],
-		"Authorization": f"Bearer {cfg['apikey']}",
-		"Content-Type": "application/json",
-		"Prefer": "resolution=merge-duplicates,return=representation",
-		"Content-Profile": "emailreply",
-	}
-	resp = requests.post(url_1, headers=headers_1, json=body, timeout=10)
-	if resp.status_code >= 400:
-		# Strategy 2: schema-qualified path (older PostgREST)
-		url_2 = f"{cfg['base_url']}/rest/v1/emailreply.oauth_tokens"
-		headers_2 = {
+	def _profile() -> Dict[str, Any]:
+		headers = {
+			"apikey": cfg["apikey"],
+			"Authorization": f"Bearer {cfg['apikey']}",
+			"Content-Type": "application/json",
+			"Prefer": "resolution=merge-duplicates,return=representation",
+			"Content-Profile": "emailreply",
+		}
+		return _first(get_session().post(f"{cfg['base_url']}/rest/v1/oauth_tokens", headers=headers, json=body, timeout=10))
+
+	# Strategy 2: schema-qualified path (older PostgREST)
+	def _qualified() -> Dict[str, Any]:
+		headers = {
 			"apikey": cfg["apikey"],
 			"Authorization": f"Bearer {cfg['apikey']}",
 			"Content-Type": "application/json",
 			"Prefer": "resolution=merge-duplicates,return=representation",
 		}
-		resp2 = requests.post(url_2, headers=headers_2, json=body, timeout=10)
-		if resp2.status_code >= 400:
-			# RPC fallback
-			return _rpc_upsert_oauth_token(record)
-		items2 = resp2.json()
-		return items2[0] if isinstance(items2, list) and items2 else record
+		return _first(get_session().post(f"{cfg['base_url']}/rest/v1/emailreply.oauth_tokens", headers=headers, json=body, timeout=10))
 
-	items = resp.json()
-	return items[0] if isinstance(items, list) and items else record
+	# Strategy 3: RPC fallback
+	return _run_strategies("upsert", {
+		"profile": _profile,
+		"qualified": _qualified,
+		"rpc": lambda: _rpc_upsert_oauth_token(record),
+	})
 
 
 def _rpc_select_oauth_token(project_id: str, provider: str = "google") -> Optional[Dict[str, Any]]:
@@ -108,9 +250,8 @@ def _rpc_select_oauth_token(project_id: str, provider: str = "google") -> Option
 		"p_project_id": project_id,
 		"p_provider": provider,
 	}
-	resp = requests.post(url, headers=headers, json=payload, timeout=10)
-	if resp.status_code >= 400:
-		raise requests.HTTPError(f"{resp.status_code} {resp.reason}: {resp.text}", response=resp)
+	resp = get_session().post(url, headers=headers, json=payload, timeout=10)
+	_raise_for_status(resp)
 	data = resp.json()
 	# RPC RETURNS TABLE → usually an array; handle both forms defensively
 	if isinstance(data, list):
@@ -137,9 +278,8 @@ def _rpc_upsert_oauth_token(record: Dict[str, Any]) -> Dict[str, Any]:
 		"p_expires_at": record.get("expires_at"),
 		"p_scopes": record.get("scopes"),
 	}
-	resp = requests.post(url, headers=headers, json=payload, timeout=10)
-	if resp.status_code >= 400:
-		raise requests.HTTPError(f"{resp.status_code} {resp.reason}: {resp.text}", response=resp)
+	resp = get_session().post(url, headers=headers, json=payload, timeout=10)
+	_raise_for_status(resp)
 	data = resp.json()
 	# Function returns one row (composite); handle object or single-element array
 	if isinstance(data, list):
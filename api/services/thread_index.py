@@ -0,0 +1,225 @@
+"""
+Local full-text thread index (embedded SQLite with FTS5).
+Stores subject, participants, snippet and body per (project, thread) so thread search
+can be answered locally instead of hitting Gmail every time.
+Falls back to LIKE matching if this SQLite build lacks FTS5.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional
+import os
+import re
+import sqlite3
+import threading
+import time
+
+
+_MAX_BODY_CHARS = int(os.getenv("THREAD_INDEX_MAX_BODY_CHARS", "20000"))
+# Least recently updated threads are evicted once the index holds more than this many
+_MAX_THREADS = int(os.getenv("THREAD_INDEX_MAX_THREADS", "20000"))
+_PRUNE_EVERY = 100
+
+_conn: Optional[sqlite3.Connection] = None
+_fts_available = False
+_inserts_since_prune = 0
+_lock = threading.Lock()
+
+
+def _index_path() -> str:
+	"""THREAD_INDEX_PATH, or a file in a private per-user cache directory (never a shared temp dir)."""
+	path = os.getenv("THREAD_INDEX_PATH")
+	if path:
+		return path
+	cache_dir = os.path.join(os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "emailreply")
+	os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+	return os.path.join(cache_dir, "thread_index.sqlite3")
+
+
+def _create_private(path: str) -> None:
+	# The index holds full email bodies: owner read/write only (SQLite gives its -wal/-shm
+	# files the same mode as the database)
+	os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o600))
+	os.chmod(path, 0o600)
+
+
+def _connection() -> sqlite3.Connection:
+	"""Open (once) the index database and create the schema. Call with _lock held."""
+	global _conn, _fts_available
+	if _conn is None:
+		path = _index_path()
+		_create_private(path)
+		conn = sqlite3.connect(path, check_same_thread=False)
+		conn.execute("PRAGMA journal_mode=WAL")
+		conn.execute("PRAGMA synchronous=NORMAL")
+		conn.execute(
+			"""
+			CREATE TABLE IF NOT EXISTS threads (
+				id INTEGER PRIMARY KEY,
+				project_id TEXT NOT NULL,
+				thread_id TEXT NOT NULL,
+				subject TEXT,
+				sender TEXT,
+				participants TEXT,
+				snippet TEXT,
+				body TEXT,
+				date TEXT,
+				updated_at INTEGER NOT NULL,
+				UNIQUE (project_id, thread_id)
+			)
+			"""
+		)
+		try:
+			conn.execute(
+				"CREATE VIRTUAL TABLE IF NOT EXISTS threads_fts USING fts5("
+				"subject, participants, snippet, body, content='threads', content_rowid='id', tokenize='unicode61')"
+			)
+			_fts_available = True
+		except sqlite3.OperationalError as e:
+			print(f"⚠️ SQLite FTS5 unavailable, thread search will use LIKE: {e}")
+			_fts_available = False
+		conn.commit()
+		_conn = conn
+	return _conn
+
+
+def reset(path: str | None = None) -> None:
+	"""Close the index (optionally switching THREAD_INDEX_PATH); mainly for tests."""
+	global _conn
+	with _lock:
+		if _conn is not None:
+			_conn.close()
+			_conn = None
+		if path is not None:
+			os.environ["THREAD_INDEX_PATH"] = path
+
+
+def upsert_thread(
+	project_id: str,
+	thread_id: str,
+	subject: str | None = None,
+	sender: str | None = None,
+	participants: List[str] | None = None,
+	snippet: str | None = None,
+	body: str | None = None,
+	date: str | None = None,
+) -> bool:
+	"""
+	Insert or update one thread. Fields passed as None keep their indexed value, so a
+	list-view entry (no body) never erases a body indexed from a full fetch.
+	"""
+	if body is not None and len(body) > _MAX_BODY_CHARS:
+		body = body[:_MAX_BODY_CHARS]
+	joined = ", ".join(p for p in (participants or []) if p) or None
+	try:
+		with _lock:
+			conn = _connection()
+			row = conn.execute(
+				"SELECT id, subject, sender, participants, snippet, body, date FROM threads WHERE project_id = ? AND thread_id = ?",
+				(project_id, thread_id),
+			).fetchone()
+			if row is None:
+				values = (subject, sender, joined, snippet, body, date)
+				cur = conn.execute(
+					"INSERT INTO threads (project_id, thread_id, subject, sender, participants, snippet, body, date, updated_at) "
+					"VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+					(project_id, thread_id, *values, int(time.time())),
+				)
+				rowid = cur.lastrowid
+				_note_insert(conn)
+			else:
+				rowid, old = row[0], row[1:]
+				values = tuple(new if new is not None else prev for new, prev in zip((subject, sender, joined, snippet, body, date), old))
+				if _fts_available:
+					conn.execute(
+						"INSERT INTO threads_fts (threads_fts, rowid, subject, participants, snippet, body) VALUES ('delete', ?, ?, ?, ?, ?)",
+						(rowid, old[0], old[2], old[3], old[4]),
+					)
+				conn.execute(
+					"UPDATE threads SET subject = ?, sender = ?, participants = ?, snippet = ?, body = ?, date = ?, updated_at = ? WHERE id = ?",
+					(*values, int(time.time()), rowid),
+				)
+			if _fts_available:
+				conn.execute(
+					"INSERT INTO threads_fts (rowid, subject, participants, snippet, body) VALUES (?, ?, ?, ?, ?)",
+					(rowid, values[0], values[2], values[3], values[4]),
+				)
+			conn.commit()
+		return True
+	except Exception as e:
+		print(f"⚠️ Failed to index thread {thread_id}: {e}")
+		return False
+
+
+def _note_insert(conn: sqlite3.Connection) -> None:
+	"""Every _PRUNE_EVERY new threads, evict the least recently updated beyond _MAX_THREADS. Call with _lock held."""
+	global _inserts_since_prune
+	_inserts_since_prune += 1
+	if _inserts_since_prune < _PRUNE_EVERY:
+		return
+	_inserts_since_prune = 0
+	excess = conn.execute("SELECT COUNT(*) FROM threads").fetchone()[0] - _MAX_THREADS
+	if excess <= 0:
+		return
+	rows = conn.execute(
+		"SELECT id, subject, participants, snippet, body FROM threads ORDER BY updated_at, id LIMIT ?",
+		(excess,),
+	).fetchall()
+	if _fts_available:
+		conn.executemany(
+			"INSERT INTO threads_fts (threads_fts, rowid, subject, participants, snippet, body) VALUES ('delete', ?, ?, ?, ?, ?)",
+			rows,
+		)
+	conn.executemany("DELETE FROM threads WHERE id = ?", [(row[0],) for row in rows])
+	print(f"🧹 Thread index: evicted {len(rows)} least recently updated thread(s)")
+
+
+def _fts_query(query: str) -> str:
+	# Quote every term (FTS5 syntax characters become literal) and prefix-match it
+	terms = re.findall(r"\w+", query, flags=re.UNICODE)
+	return " ".join(f'"{term}"*' for term in terms)
+
+
+def search(project_id: str, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+	"""
+	Search indexed threads for a project, best matches first.
+	Returns list-view items: { id, subject, from, date, snippet }.
+	"""
+	if not query.strip():
+		return []
+	try:
+		with _lock:
+			conn = _connection()
+			if _fts_available:
+				match = _fts_query(query)
+				if not match:
+					return []
+				rows = conn.execute(
+					"SELECT t.thread_id, t.subject, t.sender, t.date, t.snippet FROM threads_fts "
+					"JOIN threads t ON t.id = threads_fts.rowid "
+					"WHERE threads_fts MATCH ? AND t.project_id = ? "
+					"ORDER BY bm25(threads_fts, 10.0, 5.0, 2.0, 1.0) LIMIT ?",
+					(match, project_id, limit),
+				).fetchall()
+			else:
+				like = f"%{query.strip()}%"
+				rows = conn.execute(
+					"SELECT thread_id, subject, sender, date, snippet FROM threads WHERE project_id = ? AND "
+					"(subject LIKE ? OR participants LIKE ? OR snippet LIKE ? OR body LIKE ?) "
+					"ORDER BY updated_at DESC LIMIT ?",
+					(project_id, like, like, like, like, limit),
+				).fetchall()
+	except Exception as e:
+		print(f"⚠️ Thread index search failed: {e}")
+		return []
+	return [
+		{"id": r[0], "subject": r[1] or "No Subject", "from": r[2] or "", "date": r[3] or "", "snippet": r[4] or ""}
+		for r in rows
+	]
+
+
+def has_threads(project_id: str) -> bool:
+	"""True once anything has been indexed for the project."""
+	with _lock:
+		row = _connection().execute("SELECT 1 FROM threads WHERE project_id = ? LIMIT 1", (project_id,)).fetchone()
+	return row is not None
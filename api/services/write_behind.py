@@ -0,0 +1,143 @@
+"""
+Write-behind buffer: callers enqueue records and return immediately; a background
+thread flushes them in bulk when the batch fills up or the flush interval elapses.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Callable, List, Tuple
+import random
+import threading
+import time
+
+
+class PermanentFlushError(Exception):
+	"""Raised by a flush_fn when retrying cannot help (e.g. the server rejected the rows with a 4xx)."""
+
+
+class WriteBehindBuffer:
+	"""
+	Buffer records in memory and hand them to flush_fn in batches.
+
+	- A flush happens when batch_size records are pending or flush_interval seconds have
+	  passed since the oldest pending record was enqueued.
+	- flush_fn(records) returns True on success; False or an exception triggers a retry
+	  with exponential backoff (plus jitter) up to max_retries, after which the batch is dropped.
+	- flush_fn raising PermanentFlushError is not retried: a multi-record batch is split and
+	  retried record by record, so only the records that are rejected on their own get dropped.
+	- drain() stops the worker and flushes whatever is left (call on shutdown).
+	"""
+
+	def __init__(
+		self,
+		flush_fn: Callable[[List[Any]], bool],
+		batch_size: int = 50,
+		flush_interval: float = 1.0,
+		max_retries: int = 3,
+		backoff_seconds: float = 0.5,
+		max_pending: int = 10000,
+		name: str = "write-behind",
+	) -> None:
+		self.flush_fn = flush_fn
+		self.batch_size = max(1, batch_size)
+		self.flush_interval = flush_interval
+		self.max_retries = max_retries
+		self.backoff_seconds = backoff_seconds
+		self.max_pending = max_pending
+		self.name = name
+		# (enqueued_at, record), oldest first
+		self._pending: List[Tuple[float, Any]] = []
+		self._cond = threading.Condition()
+		self._thread: threading.Thread | None = None
+		self._stopping = False
+		self.dropped = 0
+
+	def enqueue(self, record: Any) -> bool:
+		"""Queue a record for the next flush. Returns False if the buffer is full and the record was dropped."""
+		with self._cond:
+			if len(self._pending) >= self.max_pending:
+				self.dropped += 1
+				print(f"⚠️ {self.name} buffer full ({self.max_pending}); dropping record")
+				return False
+			self._pending.append((time.monotonic(), record))
+			self._ensure_worker()
+			if len(self._pending) >= self.batch_size:
+				self._cond.notify()
+		return True
+
+	def pending(self) -> int:
+		with self._cond:
+			return len(self._pending)
+
+	def drain(self, timeout: float = 10.0) -> None:
+		"""Stop the background worker and flush all pending records."""
+		with self._cond:
+			self._stopping = True
+			self._cond.notify()
+			thread = self._thread
+		if thread is not None:
+			thread.join(timeout)
+		self.flush()
+		with self._cond:
+			self._thread = None
+			self._stopping = False
+
+	def flush(self) -> None:
+		"""Synchronously flush every pending record, batch by batch."""
+		while True:
+			batch = self._take()
+			if not batch:
+				return
+			self._flush_with_retry(batch)
+
+	def _ensure_worker(self) -> None:
+		if self._thread is None and not self._stopping:
+			self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+			self._thread.start()
+
+	def _take(self) -> List[Any]:
+		with self._cond:
+			batch = [record for _, record in self._pending[:self.batch_size]]
+			self._pending = self._pending[self.batch_size:]
+			return batch
+
+	def _run(self) -> None:
+		while True:
+			with self._cond:
+				while not self._stopping:
+					if len(self._pending) >= self.batch_size:
+						break
+					if self._pending:
+						remaining = self.flush_interval - (time.monotonic() - self._pending[0][0])
+						if remaining <= 0:
+							break
+						self._cond.wait(remaining)
+					else:
+						self._cond.wait()
+				if self._stopping:
+					return
+			batch = self._take()
+			if batch:
+				self._flush_with_retry(batch)
+
+	def _flush_with_retry(self, batch: List[Any]) -> None:
+		for attempt in range(self.max_retries + 1):
+			try:
+				if self.flush_fn(batch):
+					return
+			except PermanentFlushError as e:
+				if len(batch) == 1:
+					self.dropped += 1
+					print(f"❌ {self.name} dropped a rejected record: {e}")
+					return
+				print(f"⚠️ {self.name} batch of {len(batch)} rejected ({e}); retrying records one by one")
+				for record in batch:
+					self._flush_with_retry([record])
+				return
+			except Exception as e:
+				print(f"⚠️ {self.name} flush failed (attempt {attempt + 1}): {e}")
+			if attempt < self.max_retries:
+				delay = self.backoff_seconds * (2 ** attempt)
+				time.sleep(delay + random.uniform(0, delay / 2))
+		self.dropped += len(batch)
+		print(f"❌ {self.name} dropped {len(batch)} records after {self.max_retries + 1} attempts")
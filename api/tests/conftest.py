@@ -0,0 +1,51 @@
+import time
+
+import pytest
+
+from api.services import gmail_client, thread_index
+from api.services.mime import ParsedMessage, ParsedThread
+
+
+@pytest.fixture(autouse=True)
+def _reset_thread_cache():
+	# The thread cache is process-wide; keep threads cached by one test out of the next
+	gmail_client.reset_cache()
+	yield
+	gmail_client.reset_cache()
+
+
+@pytest.fixture(autouse=True)
+def _tmp_index(tmp_path, monkeypatch):
+	# Every test gets its own thread index file instead of the per-user default
+	monkeypatch.setenv("THREAD_INDEX_PATH", str(tmp_path / "threads.sqlite3"))
+	thread_index.reset()
+	yield
+	thread_index.reset()
+
+
+@pytest.fixture
+def make_thread():
+	"""Build a one-message ParsedThread, the shape gmail.fetch_thread returns."""
+	def _thread(thread_id: str, body: str) -> ParsedThread:
+		return ParsedThread(thread_id, [ParsedMessage(f"{thread_id}-m1", thread_id, 0, {"subject": "Hello"}, body)])
+	return _thread
+
+
+@pytest.fixture
+def wait_for_job():
+	"""Poll /jobs/{job_id} until the job is done or failed (or the timeout passes)."""
+	from fastapi.testclient import TestClient
+	from api.main import app
+
+	client = TestClient(app)
+
+	def _wait(job_id: str, timeout: float = 5.0) -> dict:
+		deadline = time.time() + timeout
+		while True:
+			jr = client.get(f"/jobs/{job_id}")
+			assert jr.status_code == 200
+			data = jr.json()
+			if data["status"] in ("done", "error") or time.time() > deadline:
+				return data
+			time.sleep(0.02)
+	return _wait
@@ -1,13 +1,16 @@
+import json
+import threading
+
 from fastapi.testclient import TestClient
 from api.main import app
 
 client = TestClient(app)
 
 
-def test_agent_flow_with_mocks(monkeypatch):
+def test_agent_flow_with_mocks(monkeypatch, make_thread, wait_for_job):
 	# Mock Gmail token + thread text
 	monkeypatch.setattr("api.services.gmail.resolve_oauth_token", lambda project_id: "tok_123")
-	monkeypatch.setattr("api.services.gmail.fetch_thread_text", lambda thread_id, token: "Sample thread content.")
+	monkeypatch.setattr("api.services.gmail.fetch_thread", lambda thread_id, token, **kwargs: make_thread(thread_id, "Sample thread content."))
 
 	# Mock OpenAI adapter to deterministic output
 	def mock_draft_reply(thread_text: str, controls: dict):
@@ -30,10 +33,8 @@ def test_agent_flow_with_mocks(monkeypatch):
 	assert r.status_code == 200
 	job_id = r.json()["jobId"]
 
-	# Poll once (synchronous completion in current scaffold)
-	jr = client.get(f"/jobs/{job_id}")
-	assert jr.status_code == 200
-	data = jr.json()
+	# Poll until the worker pool finishes the job
+	data = wait_for_job(job_id)
 	assert data["status"] == "done"
 	result = data["result"]
 	assert result["text"].startswith("Mock polite reply")
@@ -42,3 +43,118 @@ def test_agent_flow_with_mocks(monkeypatch):
 	assert result["projectId"] == "default"
 
 
+def test_agent_job_reports_error(monkeypatch, make_thread, wait_for_job):
+	monkeypatch.setattr("api.services.gmail.resolve_oauth_token", lambda project_id: "tok_123")
+	monkeypatch.setattr("api.services.gmail.fetch_thread", lambda thread_id, token, **kwargs: make_thread(thread_id, "Sample thread content."))
+
+	def failing_draft_reply(thread_text: str, controls: dict):
+		raise RuntimeError("model unavailable")
+
+	monkeypatch.setattr("api.adapters.openai_email_reply.draft_reply", failing_draft_reply)
+
+	r = client.post(
+		"/agent/run",
+		json={"projectId": "default", "input": "", "meta": {"threadId": "t-err"}},
+	)
+	assert r.status_code == 200
+	assert r.json()["status"] == "queued"
+
+	data = wait_for_job(r.json()["jobId"])
+	assert data["status"] == "error"
+	assert "model unavailable" in data["error"]
+
+
+def test_agent_stream_emits_deltas_then_done(monkeypatch, make_thread, wait_for_job):
+	async def mock_resolve(project_id: str):
+		return "tok_123"
+
+	monkeypatch.setattr("api.services.gmail.resolve_oauth_token_async", mock_resolve)
+	monkeypatch.setattr("api.services.gmail.fetch_thread", lambda thread_id, token, **kwargs: make_thread(thread_id, "Sample thread content."))
+
+	async def mock_stream(thread_text: str, controls: dict):
+		yield {"type": "delta", "text": "Mock "}
+		yield {"type": "delta", "text": "streamed reply."}
+		yield {"type": "done", "text": "Mock streamed reply.", "meta": {"subject": None, "participants": None, "token_usage": {"total_tokens": 12}}}
+
+	monkeypatch.setattr("api.adapters.openai_email_reply.astream_draft_reply", mock_stream)
+
+	with client.stream(
+		"POST",
+		"/agent/run/stream",
+		json={"projectId": "default", "input": "", "meta": {"threadId": "t-stream"}},
+	) as r:
+		assert r.status_code == 200
+		assert r.headers["content-type"].startswith("text/event-stream")
+		lines = [line for line in r.iter_lines() if line]
+
+	events = [line.split(": ", 1)[1] for line in lines if line.startswith("event: ")]
+	assert events == ["start", "delta", "delta", "done"]
+
+	# The streamed draft is recorded like a regular job, token usage included
+	start = json.loads(lines[1].split(": ", 1)[1])
+	data = wait_for_job(start["jobId"])
+	assert data["status"] == "done"
+	assert data["result"]["text"] == "Mock streamed reply."
+	assert data["result"]["meta"]["token_usage"] == {"total_tokens": 12}
+
+
+def test_agent_stream_client_disconnect_settles_job(monkeypatch, make_thread, wait_for_job):
+	import asyncio
+	from api.main import RunBody, run_agent_stream
+
+	async def mock_resolve(project_id: str):
+		return "tok_123"
+
+	monkeypatch.setattr("api.services.gmail.resolve_oauth_token_async", mock_resolve)
+	monkeypatch.setattr("api.services.gmail.fetch_thread", lambda thread_id, token, **kwargs: make_thread(thread_id, "Sample thread content."))
+
+	async def mock_stream(thread_text: str, controls: dict):
+		if controls["threadId"] == "t-saved":
+			yield {"type": "done", "text": "Saved reply", "meta": {"subject": None, "participants": None, "token_usage": None}}
+			return
+		yield {"type": "delta", "text": "Mock "}
+		yield {"type": "delta", "text": "never read"}
+
+	monkeypatch.setattr("api.adapters.openai_email_reply.astream_draft_reply", mock_stream)
+
+	async def disconnect_after_first_delta():
+		response = await run_agent_stream(RunBody(projectId="default", input="", meta={"threadId": "t-gone"}))
+		events = response.body_iterator
+		start = await events.__anext__()
+		await events.__anext__()
+		await events.aclose()  # what Starlette does when the client goes away
+		return json.loads(start.split("data: ", 1)[1])
+
+	start = asyncio.run(disconnect_after_first_delta())
+	data = wait_for_job(start["jobId"])
+	assert data["status"] == "error"
+	assert "disconnected" in data["error"]
+
+	# A disconnect while the finished draft is being persisted must not turn the job into an error
+	persisting = threading.Event()
+	release = threading.Event()
+
+	def slow_persist(*args):
+		persisting.set()
+		release.wait(2)
+
+	monkeypatch.setattr("api.main._persist_draft", slow_persist)
+
+	async def disconnect_while_persisting():
+		response = await run_agent_stream(RunBody(projectId="default", input="", meta={"threadId": "t-saved"}))
+		events = response.body_iterator
+		start = await events.__anext__()
+		pending = asyncio.ensure_future(events.__anext__())
+		await asyncio.to_thread(persisting.wait, 2)
+		pending.cancel()  # what Starlette does when the client goes away mid-await
+		try:
+			await pending
+		except asyncio.CancelledError:
+			pass
+		release.set()
+		return json.loads(start.split("data: ", 1)[1])
+
+	start = asyncio.run(disconnect_while_persisting())
+	data = wait_for_job(start["jobId"])
+	assert data["status"] == "done"
+	assert data["result"]["text"].startswith("Saved reply")
@@ -0,0 +1,129 @@
+import threading
+import time
+
+from fastapi.testclient import TestClient
+from api.main import app
+
+client = TestClient(app)
+
+
+def _wait_for_batch(batch_id: str, timeout: float = 5.0) -> dict:
+	deadline = time.time() + timeout
+	while True:
+		r = client.get(f"/agent/batch/{batch_id}")
+		assert r.status_code == 200
+		data = r.json()
+		if data["status"] in ("done", "partial", "error") or time.time() > deadline:
+			return data
+		time.sleep(0.02)
+
+
+def test_batch_resolves_token_once_and_drafts_concurrently(monkeypatch, make_thread):
+	token_calls = []
+	in_flight = [0]
+	peak = [0]
+	lock = threading.Lock()
+
+	def fake_resolve(project_id):
+		token_calls.append(project_id)
+		return "tok_123"
+
+	def fake_draft_reply(thread_text: str, controls: dict):
+		with lock:
+			in_flight[0] += 1
+			peak[0] = max(peak[0], in_flight[0])
+		time.sleep(0.05)
+		with lock:
+			in_flight[0] -= 1
+		if controls["threadId"] == "t-bad":
+			raise RuntimeError("boom")
+		return {"text": f"Reply to {thread_text.text}", "meta": {"subject": None, "participants": None, "token_usage": None}}
+
+	monkeypatch.setattr("api.services.gmail.resolve_oauth_token", fake_resolve)
+	monkeypatch.setattr("api.services.gmail.fetch_thread", lambda thread_id, token, **kwargs: make_thread(thread_id, f"thread {thread_id}"))
+	monkeypatch.setattr("api.adapters.openai_email_reply.draft_reply", fake_draft_reply)
+
+	thread_ids = ["t1", "t2", "t3", "t4", "t-bad"]
+	r = client.post(
+		"/agent/run/batch",
+		json={"projectId": "default", "threadIds": thread_ids, "meta": {"tone": "formal"}, "concurrency": 5},
+	)
+	assert r.status_code == 200
+	body = r.json()
+	assert body["status"] == "queued"
+	assert len(body["jobIds"]) == len(thread_ids)
+
+	data = _wait_for_batch(body["batchId"])
+	assert data["status"] == "partial"
+	assert data["error"] == "1 of 5 drafts failed"
+	assert data["total"] == 5
+	assert data["completed"] == 4
+	assert data["failed"] == 1
+	assert [item["threadId"] for item in data["results"]] == thread_ids
+	assert data["results"][0]["result"]["text"].endswith("\n\nthread t1")
+	assert data["results"][0]["result"]["meta"]["tone"] == "formal"
+	assert token_calls == ["default"]
+	assert peak[0] > 1
+
+	# Child jobs are pollable individually as well
+	jr = client.get(f"/jobs/{body['jobIds'][1]}")
+	assert jr.json()["status"] == "done"
+
+
+def test_batch_is_an_error_when_every_draft_fails(monkeypatch, make_thread):
+	def fail_draft(thread_text, controls):
+		raise RuntimeError("model unavailable")
+
+	monkeypatch.setattr("api.services.gmail.resolve_oauth_token", lambda project_id: "tok_123")
+	monkeypatch.setattr("api.services.gmail.fetch_thread", lambda thread_id, token, **kwargs: make_thread(thread_id, "body"))
+	monkeypatch.setattr("api.adapters.openai_email_reply.draft_reply", fail_draft)
+
+	r = client.post("/agent/run/batch", json={"projectId": "default", "threadIds": ["t1", "t2"]})
+	data = _wait_for_batch(r.json()["batchId"])
+	assert data["status"] == "error"
+	assert data["error"] == "2 of 2 drafts failed"
+	assert data["completed"] == 0 and data["failed"] == 2
+	assert all(item["error"] == "model unavailable" for item in data["results"])
+
+
+def test_batch_requires_thread_ids():
+	r = client.post("/agent/run/batch", json={"projectId": "default", "threadIds": []})
+	assert r.status_code == 400
+
+
+def test_batches_reuse_worker_threads_within_the_concurrency_bound(monkeypatch):
+	from api.services import jobs
+
+	# A two-thread batch pool, so reuse across batches is deterministic
+	monkeypatch.setattr(jobs, "AGENT_WORKERS", 1)
+	monkeypatch.setattr(jobs, "BATCH_MAX_CONCURRENCY", 2)
+	monkeypatch.setattr(jobs, "_batch_executor", None)
+	seen = []
+	in_flight = [0]
+	peak = [0]
+	lock = threading.Lock()
+
+	def work(item):
+		with lock:
+			in_flight[0] += 1
+			peak[0] = max(peak[0], in_flight[0])
+			seen.append(threading.current_thread())
+		time.sleep(0.02)
+		with lock:
+			in_flight[0] -= 1
+		if item == "bad":
+			raise RuntimeError("boom")
+		return item * 2
+
+	try:
+		first = jobs.run_bounded(work, [1, 2, 3, 4, "bad"], 2)
+		first_threads = set(seen)
+		seen.clear()
+		jobs.run_bounded(work, [5, 6, 7], 2)
+	finally:
+		jobs._batch_executor.shutdown(wait=True)
+
+	assert first[:4] == [2, 4, 6, 8] and isinstance(first[4], RuntimeError)
+	assert peak[0] <= 2
+	# Later batches land on the same long-lived workers (and their thread-local Gmail services)
+	assert set(seen) <= first_threads
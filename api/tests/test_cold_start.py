@@ -0,0 +1,12 @@
+import subprocess
+import sys
+from pathlib import Path
+
+from api.benchmarks.import_time import LAZY_MODULES
+
+
+def test_heavy_sdks_are_not_imported_at_startup():
+	code = f"import sys, api.main; print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+	proc = subprocess.run([sys.executable, "-c", code], cwd=Path(__file__).resolve().parents[2], capture_output=True, text=True)
+	assert proc.returncode == 0, proc.stderr
+	assert proc.stdout.strip() == ""
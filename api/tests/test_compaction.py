@@ -0,0 +1,75 @@
+from api.adapters import openai_email_reply as adapter
+from api.services import compaction
+from api.services.mime import ParsedMessage, ParsedThread
+
+
+def _msg(i, sender, body):
+	return ParsedMessage(f"m{i}", "t1", i * 1000, {"from": sender, "date": f"Day {i}", "subject": "Launch plan"}, body)
+
+
+def _thread():
+	first = "Can we ship the launch on Friday?\n\nThe checklist is in the shared doc.\n\n-- \nAlice\nVP Marketing\n+1 555 0100"
+	second = (
+		"Friday works for engineering.\n\nThe checklist is in the shared doc.\n\n"
+		"Sent from my iPhone\n\n"
+		"On Mon, Jan 1, 2024 at 9:00 AM Alice <alice@example.com> wrote:\n"
+		"> Can we ship the launch on Friday?\n> The checklist is in the shared doc."
+	)
+	third = "Great, confirming Friday 3pm.\n\n-----Original Message-----\nFrom: Bob\n" + "old text " * 200
+	return ParsedThread("t1", [_msg(1, "Alice", first), _msg(2, "Bob", second), _msg(3, "Alice", third)])
+
+
+def test_compaction_strips_quotes_signatures_and_duplicates():
+	compacted = compaction.compact_thread(_thread(), budget_tokens=1000)
+	text = compacted.to_text()
+
+	assert text.startswith("Subject: Launch plan")
+	assert "Friday works for engineering." in text
+	assert text.count("The checklist is in the shared doc.") == 1
+	assert "VP Marketing" not in text and "Sent from my iPhone" not in text
+	assert "> Can we ship" not in text and "old text" not in text
+	assert compacted.stats["messages_kept"] == 3
+	assert compacted.stats["thread_tokens_after"] < compacted.stats["thread_tokens_before"]
+
+
+def test_compaction_keeps_newest_messages_within_budget():
+	compacted = compaction.compact_thread(_thread(), budget_tokens=40)
+	text = compacted.to_text()
+
+	assert "confirming Friday 3pm" in text
+	assert "Can we ship the launch" not in text
+	assert "earlier message(s) omitted" in text
+	assert compacted.stats["messages_kept"] < compacted.stats["messages_total"]
+
+	# Plain text and failed fetches pass through untouched
+	assert compaction.compact_thread("raw text") == "raw text"
+	failed = ParsedThread("t2", [], error="[Thread t2] Unexpected error")
+	assert compaction.compact_thread(failed) is failed
+
+
+def test_adapter_reports_compaction_in_token_usage(monkeypatch):
+	# Mock draft path: no network call even when the environment has a real key
+	monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+	compacted = compaction.compact_thread(_thread(), budget_tokens=1000)
+	draft = adapter.draft_reply(compacted, {"tone": "friendly"})
+
+	usage = draft["meta"]["token_usage"]
+	assert usage["thread_tokens_before"] == compacted.stats["thread_tokens_before"]
+	assert usage["thread_tokens_after"] == compacted.stats["thread_tokens_after"]
+	assert draft["meta"]["subject"] == "Launch plan"
+
+
+def test_compaction_keeps_newest_copy_of_a_repeated_paragraph():
+	ask = "Can you approve the $5k budget by Friday?"
+	thread = ParsedThread("t1", [
+		_msg(1, "Alice", f"{ask}\n\n" + "Background on the vendor quote. " * 40),
+		_msg(2, "Alice", ask),
+	])
+
+	compacted = compaction.compact_thread(thread, budget_tokens=60)
+	text = compacted.to_text()
+
+	# The older message falls outside the budget; the newest still carries the question
+	assert "[1 earlier message(s) omitted]" in text
+	assert ask in text
+	assert "[No new content]" not in text
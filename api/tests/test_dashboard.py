@@ -0,0 +1,54 @@
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from api.main import _parse_draft_cursor, app
+
+client = TestClient(app)
+
+
+def test_recent_drafts_keyset_pagination(monkeypatch):
+	rows = [
+		{"id": f"00000000-0000-0000-0000-00000000000{i}", "subject": f"S{i}", "snippet": "", "threadId": "t", "tone": "friendly", "createdAt": f"2024-01-0{i}T10:00:00+00:00"}
+		for i in range(9, 0, -1)
+	]
+	calls = []
+
+	async def fake_recent(project_id, limit, before=None):
+		calls.append((limit, before))
+		start = 0 if before is None else next(i for i, d in enumerate(rows) if d["id"] == before[1]) + 1
+		return rows[start:start + limit]
+
+	monkeypatch.setattr("api.services.persistence.get_recent_drafts_async", fake_recent)
+
+	first = client.get("/dashboard/recent-drafts", params={"projectId": "p1", "limit": 4}).json()
+	assert [d["subject"] for d in first["items"]] == ["S9", "S8", "S7", "S6"]
+	assert first["nextCursor"] == f"{rows[3]['createdAt']},{rows[3]['id']}"
+
+	second = client.get("/dashboard/recent-drafts", params={"projectId": "p1", "limit": 4, "before": first["nextCursor"]}).json()
+	assert [d["subject"] for d in second["items"]] == ["S5", "S4", "S3", "S2"]
+	assert calls[1] == (5, ("2024-01-06T10:00:00+00:00", rows[3]["id"]))
+
+	last = client.get("/messages", params={"projectId": "p1", "limit": 4, "before": second["nextCursor"]}).json()
+	assert [d["subject"] for d in last["items"]] == ["S1"] and last["nextCursor"] is None
+
+
+@pytest.mark.parametrize("before", ["not-a-cursor", "2024-01-06T10:00:00+00:00,not-a-uuid", ",00000000-0000-0000-0000-000000000001"])
+def test_malformed_draft_cursor_is_rejected(monkeypatch, before):
+	async def fake_recent(project_id, limit, before=None):
+		pytest.fail("malformed cursors must not reach the database")
+
+	monkeypatch.setattr("api.services.persistence.get_recent_drafts_async", fake_recent)
+
+	with pytest.raises(HTTPException) as excinfo:
+		_parse_draft_cursor(before)
+	assert excinfo.value.status_code == 400
+
+	r = client.get("/dashboard/recent-drafts", params={"projectId": "p1", "before": before})
+	assert r.status_code == 400
+	assert "Invalid cursor" in r.json()["detail"]
+
+
+def test_draft_cursor_restores_unencoded_utc_offset():
+	draft_id = "00000000-0000-0000-0000-000000000001"
+	assert _parse_draft_cursor(None) is None
+	assert _parse_draft_cursor(f"2024-01-06T10:00:00 02:00,{draft_id}") == ("2024-01-06T10:00:00+02:00", draft_id)
@@ -0,0 +1,85 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api.main import app
+from api.services import gmail_quota
+
+client = TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def _small_bucket(monkeypatch):
+	monkeypatch.setattr(gmail_quota, "_QUOTA_ENABLED", True)
+	monkeypatch.setattr(gmail_quota, "_UNITS_PER_SECOND", 200.0)
+	monkeypatch.setattr(gmail_quota, "_BURST_UNITS", 20.0)
+	monkeypatch.setattr(gmail_quota, "_BACKOFF_SECONDS", 0.01)
+	gmail_quota.reset()
+	yield
+	gmail_quota.reset()
+
+
+class _FakeRequest:
+	def __init__(self, failures=0, status=429):
+		self.failures = failures
+		self.status = status
+		self.calls = 0
+
+	def execute(self):
+		self.calls += 1
+		if self.calls <= self.failures:
+			error = Exception("Rate Limit Exceeded")
+			error.resp = SimpleNamespace(status=self.status)
+			error.content = b'{"error": {"errors": [{"reason": "userRateLimitExceeded"}]}}'
+			raise error
+		return {"ok": True}
+
+
+def test_execute_charges_method_units_and_reports_snapshot():
+	assert gmail_quota.execute("p1", _FakeRequest(), "threads.get") == {"ok": True}
+	gmail_quota.execute("p1", _FakeRequest(), "history.list")
+
+	r = client.get("/gmail/quota")
+	assert r.status_code == 200
+	project = r.json()["projects"]["p1"]
+	assert project["unitsUsed"] == 12
+	assert project["waitingInteractive"] == 0 and project["throttled"] == 0
+
+
+def test_interactive_calls_go_before_queued_background_calls():
+	gmail_quota.acquire("p2", 20)  # drain the bucket
+	order = []
+
+	def background_call():
+		with gmail_quota.background():
+			gmail_quota.acquire("p2", 20)
+		order.append("background")
+
+	def interactive_call():
+		gmail_quota.acquire("p2", 20)
+		order.append("interactive")
+
+	bg = threading.Thread(target=background_call)
+	bg.start()
+	time.sleep(0.01)
+	fg = threading.Thread(target=interactive_call)
+	fg.start()
+	bg.join(2)
+	fg.join(2)
+	assert order == ["interactive", "background"]
+
+
+def test_rate_limited_calls_back_off_and_retry():
+	request = _FakeRequest(failures=2, status=403)
+	assert gmail_quota.execute("p3", request, "messages.get") == {"ok": True}
+	assert request.calls == 3
+	assert gmail_quota.snapshot()["projects"]["p3"]["throttled"] == 2
+
+	# Other errors are not retried
+	other = _FakeRequest(failures=1, status=500)
+	with pytest.raises(Exception):
+		gmail_quota.execute("p3", other, "threads.get")
+	assert other.calls == 1
@@ -0,0 +1,356 @@
+from api.services import gmail
+
+
+class _Request:
+	def __init__(self, service, kind, **kwargs):
+		self.service = service
+		self.kind = kind
+		self.kwargs = kwargs
+
+	def execute(self):
+		self.service.calls.append(self.kind)
+		return self.service.responses[self.kind](**self.kwargs)
+
+
+class _Batch:
+	def __init__(self, service, callback):
+		self.service = service
+		self.callback = callback
+		self.requests = []
+
+	def add(self, request, request_id):
+		self.requests.append((request_id, request))
+
+	def execute(self):
+		self.service.calls.append("batch")
+		for request_id, request in self.requests:
+			self.callback(request_id, self.service.responses[request.kind](**request.kwargs), None)
+
+
+class _Resource:
+	def __init__(self, service, name):
+		self.service = service
+		self.name = name
+
+	def list(self, **kwargs):
+		return _Request(self.service, f"{self.name}.list", **kwargs)
+
+	def get(self, **kwargs):
+		return _Request(self.service, f"{self.name}.get", **kwargs)
+
+	def send(self, **kwargs):
+		return _Request(self.service, f"{self.name}.send", **kwargs)
+
+
+class FakeGmailService:
+	"""Minimal stand-in for googleapiclient's Gmail resource tree."""
+
+	def __init__(self, threads):
+		self.threads_data = threads
+		self.calls = []
+		self.history_id = "100"
+		self.history_records = []
+		self.responses = {
+			"threads.list": lambda **kw: {"threads": [{"id": t["id"]} for t in self.threads_data]},
+			"threads.get": lambda **kw: next(t for t in self.threads_data if t["id"] == kw["id"]),
+			"messages.get": lambda **kw: next(m for t in self.threads_data for m in t["messages"] if m["id"] == kw["id"]),
+			"profile.get": lambda **kw: {"historyId": self.history_id},
+			"history.list": lambda **kw: {"history": self.history_records, "historyId": self.history_id},
+			"messages.send": lambda **kw: self.sent.append(kw["body"]) or {"id": "sent-1", "threadId": kw["body"]["threadId"]},
+		}
+		self.sent = []
+
+	def users(self):
+		return self
+
+	def threads(self):
+		return _Resource(self, "threads")
+
+	def messages(self):
+		return _Resource(self, "messages")
+
+	def history(self):
+		return _Resource(self, "history")
+
+	def getProfile(self, **kwargs):
+		return _Request(self, "profile.get", **kwargs)
+
+	def new_batch_http_request(self, callback):
+		return _Batch(self, callback)
+
+
+def _message(message_id, thread_id, subject, body="Hello", internal_date=1):
+	import base64
+
+	return {
+		"id": message_id,
+		"threadId": thread_id,
+		"internalDate": str(internal_date),
+		"payload": {
+			"headers": [
+				{"name": "Subject", "value": subject},
+				{"name": "From", "value": "a@example.com"},
+				{"name": "Date", "value": "Mon, 1 Jan 2024 10:00:00 +0000"},
+			],
+			"body": {"data": base64.urlsafe_b64encode(body.encode()).decode()},
+		},
+	}
+
+
+def _thread(thread_id, subject):
+	return {
+		"id": thread_id,
+		"snippet": f"snippet {thread_id}",
+		"messages": [_message(f"{thread_id}-m1", thread_id, subject)],
+	}
+
+
+def _use_fake_service(monkeypatch, service):
+	from api.services import gmail_sync
+
+	monkeypatch.setattr(gmail, "build", lambda *args, **kwargs: service, raising=False)
+	monkeypatch.setattr(gmail, "GMAIL_API_AVAILABLE", True)
+	monkeypatch.setattr(gmail._service_local, "services", {}, raising=False)
+	monkeypatch.setattr(gmail_sync, "_HISTORY_CHECK_SECONDS", 0.0)
+	gmail_sync.reset()
+
+
+def test_list_threads_fetches_metadata_in_one_batch(monkeypatch):
+	service = FakeGmailService([_thread(f"t{i}", f"Subject {i}") for i in range(20)])
+	monkeypatch.setattr(gmail, "resolve_oauth_token", lambda project_id: "tok_123")
+	_use_fake_service(monkeypatch, service)
+
+	threads = gmail.list_threads("default", max_results=20)
+
+	assert [t["id"] for t in threads] == [f"t{i}" for i in range(20)]
+	assert threads[3]["subject"] == "Subject 3"
+	assert threads[3]["from"] == "a@example.com"
+	assert service.calls == ["profile.get", "threads.list", "batch"]
+
+
+def test_list_threads_incremental_refetches_only_changed_threads(monkeypatch):
+	service = FakeGmailService([_thread(f"t{i}", f"Subject {i}") for i in range(5)])
+	monkeypatch.setattr(gmail, "resolve_oauth_token", lambda project_id: "tok_123")
+	_use_fake_service(monkeypatch, service)
+
+	gmail.list_threads("default", max_results=5)
+
+	# No mailbox changes: one history call, no list/get
+	service.calls.clear()
+	again = gmail.list_threads("default", max_results=5)
+	assert len(again) == 5
+	assert service.calls == ["history.list"]
+
+	# A new message in t2: relist, but only t2's metadata is fetched
+	service.threads_data[2]["messages"].append(_message("t2-m2", "t2", "Re: Subject 2", internal_date=2))
+	service.history_records = [{"messagesAdded": [{"message": {"id": "t2-m2", "threadId": "t2"}}]}]
+	service.history_id = "101"
+	service.calls.clear()
+	changed = []
+	monkeypatch.setattr("api.services.gmail_sync._change_listeners", [lambda project_id, ids: changed.append((project_id, ids))])
+	gmail.list_threads("default", max_results=5)
+	assert service.calls == ["history.list", "threads.list", "batch"]
+	assert changed == [("default", {"t2"})]
+
+
+def test_fetch_thread_text_fetches_only_new_messages(monkeypatch):
+	service = FakeGmailService([_thread("t1", "Planning")])
+	_use_fake_service(monkeypatch, service)
+
+	text = gmail.fetch_thread_text("t1", "tok_123", project_id="p-sync")
+	assert "Subject: Planning" in text and "Hello" in text
+	assert service.calls == ["profile.get", "threads.get"]
+
+	service.threads_data[0]["messages"].append(_message("t1-m2", "t1", "Re: Planning", body="Tuesday works", internal_date=2))
+	service.history_records = [{"messagesAdded": [{"message": {"id": "t1-m2", "threadId": "t1"}}]}]
+	service.history_id = "101"
+	service.calls.clear()
+
+	text = gmail.fetch_thread_text("t1", "tok_123", project_id="p-sync")
+	assert service.calls == ["history.list", "messages.get"]
+	assert text.index("Hello") < text.index("Tuesday works")
+
+
+def test_send_reply_uses_reply_meta_captured_at_fetch(monkeypatch):
+	import base64
+
+	monkeypatch.setattr(gmail, "persistence", None)
+	thread = _thread("t-send", "Offer")
+	thread["messages"][0]["payload"]["headers"].append({"name": "Message-ID", "value": "<orig@example.com>"})
+	service = FakeGmailService([thread])
+	_use_fake_service(monkeypatch, service)
+
+	gmail.fetch_thread("t-send", "tok_123", project_id="p-send")
+	meta = gmail.cached_reply_meta("p-send", "t-send")
+	assert meta == {"subject": "Offer", "from": "a@example.com", "messageId": "<orig@example.com>", "references": None}
+
+	service.calls.clear()
+	result = gmail.send_reply("t-send", "Sounds good", "tok_123", reply_meta=meta)
+	assert result["messageId"] == "sent-1"
+	assert service.calls == ["messages.send"]
+	raw = base64.urlsafe_b64decode(service.sent[0]["raw"]).decode()
+	assert "Subject: Re: Offer" in raw and "In-Reply-To: <orig@example.com>" in raw
+
+	# Cache miss falls back to the metadata lookup
+	service.calls.clear()
+	gmail.send_reply("t-send", "Sounds good", "tok_123")
+	assert service.calls == ["threads.get", "messages.send"]
+	assert gmail.cached_reply_meta("p-send", "t-unknown") is None
+
+
+def test_gmail_service_is_built_once_per_token(monkeypatch):
+	builds = []
+	monkeypatch.setattr(gmail, "build", lambda *args, **kwargs: builds.append(kwargs) or object(), raising=False)
+	monkeypatch.setattr(gmail, "Credentials", lambda token: token, raising=False)
+	monkeypatch.setattr(gmail._service_local, "services", {}, raising=False)
+
+	first = gmail._get_gmail_service("tok_cache_a")
+	assert gmail._get_gmail_service("tok_cache_a") is first
+	assert builds[0]["static_discovery"] is True
+
+	# A token known to be expired forces a rebuild
+	gmail._invalidate_gmail_service("tok_cache_a")
+	assert gmail._get_gmail_service("tok_cache_a") is not first
+	assert len(builds) == 2
+
+
+def test_resolve_oauth_token_caches_and_collapses_lookups(monkeypatch):
+	import threading
+	import time
+
+	lookups = []
+
+	def slow_lookup(project_id):
+		lookups.append(project_id)
+		time.sleep(0.05)
+		return "tok_cached", time.time() + 3600
+
+	monkeypatch.setattr(gmail, "_lookup_oauth_token", slow_lookup)
+	gmail.invalidate_oauth_token("proj-cache")
+
+	results = []
+	workers = [threading.Thread(target=lambda: results.append(gmail.resolve_oauth_token("proj-cache"))) for _ in range(5)]
+	for w in workers:
+		w.start()
+	for w in workers:
+		w.join()
+
+	assert results == ["tok_cached"] * 5
+	assert lookups == ["proj-cache"]
+
+	gmail.invalidate_oauth_token("proj-cache")
+	assert gmail.resolve_oauth_token("proj-cache") == "tok_cached"
+	assert len(lookups) == 2
+
+
+def test_resolve_oauth_token_does_not_cache_nearly_expired_tokens(monkeypatch):
+	import time
+
+	lookups = []
+
+	def lookup(project_id):
+		lookups.append(project_id)
+		return "tok_short", time.time() + 30
+
+	monkeypatch.setattr(gmail, "_lookup_oauth_token", lookup)
+	gmail.invalidate_oauth_token("proj-short")
+
+	gmail.resolve_oauth_token("proj-short")
+	gmail.resolve_oauth_token("proj-short")
+	assert len(lookups) == 2
+
+
+def test_batch_metadata_retries_rate_limited_items(monkeypatch):
+	from api.services import gmail_quota
+
+	class _RateLimited(Exception):
+		resp = type("Resp", (), {"status": 429})()
+
+	limited = {"t1"}
+
+	class _FlakyBatch(_Batch):
+		def execute(self):
+			self.service.calls.append("batch")
+			for request_id, request in self.requests:
+				if request_id in limited:
+					limited.discard(request_id)
+					self.callback(request_id, None, _RateLimited("rate limit exceeded"))
+				else:
+					self.callback(request_id, self.service.responses[request.kind](**request.kwargs), None)
+
+	service = FakeGmailService([_thread(f"t{i}", f"Subject {i}") for i in range(3)])
+	service.new_batch_http_request = lambda callback: _FlakyBatch(service, callback)
+	monkeypatch.setattr(gmail_quota, "_BACKOFF_SECONDS", 0.01)
+
+	results = gmail._batch_get_thread_metadata(service, ["t0", "t1", "t2"], ["Subject"], project_id="p-batch")
+
+	assert sorted(results) == ["t0", "t1", "t2"]
+	assert service.calls == ["batch", "batch"]
+
+
+def test_history_failure_falls_back_to_full_fetch(monkeypatch):
+	service = FakeGmailService([_thread("t1", "Planning")])
+	_use_fake_service(monkeypatch, service)
+	gmail.fetch_thread_text("t1", "tok_123", project_id="p-flaky")
+
+	class _ServerError(Exception):
+		resp = type("Resp", (), {"status": 500})()
+
+	def history_down(**kwargs):
+		raise _ServerError("backend error")
+
+	service.responses["history.list"] = history_down
+	service.calls.clear()
+
+	text = gmail.fetch_thread_text("t1", "tok_123", project_id="p-flaky")
+	assert "Subject: Planning" in text
+	assert service.calls == ["history.list", "threads.get"]
+
+
+def test_sync_and_async_token_lookups_share_one_fetch(monkeypatch):
+	import asyncio
+	import threading
+	import time
+
+	lookups = []
+
+	def slow_lookup(project_id):
+		lookups.append(project_id)
+		time.sleep(0.05)
+		return "tok_shared", time.time() + 3600
+
+	monkeypatch.setattr(gmail, "_lookup_oauth_token", slow_lookup)
+	monkeypatch.setattr(gmail, "_SUPA_REST_AVAILABLE", False)
+	gmail.invalidate_oauth_token("proj-shared")
+
+	results = []
+	worker = threading.Thread(target=lambda: results.append(gmail.resolve_oauth_token("proj-shared")))
+	worker.start()
+
+	async def async_callers():
+		return await asyncio.gather(*(gmail.resolve_oauth_token_async("proj-shared") for _ in range(3)))
+
+	results.extend(asyncio.run(async_callers()))
+	worker.join()
+
+	assert results == ["tok_shared"] * 4
+	assert lookups == ["proj-shared"]
+	# Only in-flight lookups are tracked
+	assert gmail._oauth_token_lookups == {}
+
+
+def test_thread_reads_share_one_recent_history_check(monkeypatch):
+	from api.services import gmail_sync
+
+	service = FakeGmailService([_thread("t1", "Planning"), _thread("t2", "Budget")])
+	_use_fake_service(monkeypatch, service)
+	monkeypatch.setattr(gmail_sync, "_HISTORY_CHECK_SECONDS", 60.0)
+	gmail.fetch_thread_text("t1", "tok_123", project_id="p-throttle")
+
+	# Within GMAIL_HISTORY_CHECK_SECONDS of the last sync, cache-hit checks and the miss after
+	# them make no further history.list calls
+	service.calls.clear()
+	gmail.sync_mailbox("p-throttle", "tok_123")
+	gmail.sync_mailbox("p-throttle", "tok_123")
+	gmail.fetch_thread_text("t2", "tok_123", project_id="p-throttle")
+	assert service.calls == ["threads.get"]
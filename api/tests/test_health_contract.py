@@ -1,3 +1,4 @@
+import pytest
 from fastapi.testclient import TestClient
 from api.main import app
 
@@ -23,7 +24,10 @@ def test_agent_run_requires_meta_thread_id():
 	assert r.status_code == 400
 
 
-def test_agent_run_and_job_status_contract(monkeypatch):
+def test_agent_run_and_job_status_contract(monkeypatch, make_thread, wait_for_job):
+	monkeypatch.setattr("api.services.gmail.resolve_oauth_token", lambda project_id: "tok_123")
+	monkeypatch.setattr("api.services.gmail.fetch_thread", lambda thread_id, token, **kwargs: make_thread(thread_id, "Can we meet Tuesday?"))
+
 	# Valid run
 	r = client.post(
 		"/agent/run",
@@ -37,10 +41,8 @@ def test_agent_run_and_job_status_contract(monkeypatch):
 	job_id = r.json().get("jobId")
 	assert isinstance(job_id, str) and job_id
 
-	# Poll job
-	jr = client.get(f"/jobs/{job_id}")
-	assert jr.status_code == 200
-	jd = jr.json()
+	# Poll job until the worker finishes
+	jd = wait_for_job(job_id)
 	assert jd.get("status") == "done"
 	assert "result" in jd
 	res = jd["result"]
@@ -49,3 +51,14 @@ def test_agent_run_and_job_status_contract(monkeypatch):
 	assert res.get("projectId") == "default"
 
 
+def test_agent_run_fails_job_when_thread_cannot_be_fetched(monkeypatch, wait_for_job):
+	monkeypatch.setattr("api.services.gmail.resolve_oauth_token", lambda project_id: None)
+	persisted = []
+	monkeypatch.setattr("api.services.persistence.enqueue_message_to_supabase", lambda *args: persisted.append(args))
+	monkeypatch.setattr("api.adapters.openai_email_reply.draft_reply", lambda **kwargs: pytest.fail("nothing to draft from"))
+
+	r = client.post("/agent/run", json={"projectId": "default", "input": "", "meta": {"threadId": "t-missing"}})
+	jd = wait_for_job(r.json()["jobId"])
+	assert jd["status"] == "error"
+	assert "No access token" in jd["error"]
+	assert persisted == []
@@ -0,0 +1,40 @@
+from fastapi.testclient import TestClient
+from api.main import app
+from api.services.jobs import JobStore
+
+client = TestClient(app)
+
+
+def test_job_store_caps_size_and_evicts_oldest():
+	store = JobStore(max_items=2, ttl_seconds=60)
+	store.create("a")
+	store.create("b")
+	store.create("c")
+	assert len(store) == 2
+	assert store.get("a") is None
+	assert store.get("c")["status"] == "queued"
+
+
+def test_job_store_expires_after_ttl(monkeypatch):
+	now = [1000.0]
+	monkeypatch.setattr("api.services.jobs.time.time", lambda: now[0])
+	store = JobStore(max_items=10, ttl_seconds=30)
+	store.create("a")
+	store.update("a", status="done", result={"text": "hi"})
+	assert store.get("a")["result"] == {"text": "hi"}
+	now[0] += 31
+	assert store.get("a") is None
+
+
+def test_get_job_reads_through_to_redis(monkeypatch):
+	stored = {"status": "done", "result": {"text": "from redis"}}
+	async def fake_read(job_id):
+		return stored if job_id == "remote-job" else None
+
+	monkeypatch.setattr("api.services.persistence.read_job_from_redis_async", fake_read)
+
+	r = client.get("/jobs/remote-job")
+	assert r.status_code == 200
+	assert r.json()["result"]["text"] == "from redis"
+
+	assert client.get("/jobs/missing-job").status_code == 404
@@ -0,0 +1,65 @@
+import base64
+
+from api.adapters import openai_email_reply as adapter
+from api.services import mime
+
+
+def _b64(text: str) -> str:
+	return base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _message(message_id, headers, payload_extra, internal_date="1000"):
+	return {
+		"id": message_id,
+		"threadId": "t1",
+		"internalDate": internal_date,
+		"payload": {"headers": [{"name": k, "value": v} for k, v in headers], **payload_extra},
+	}
+
+
+def test_parse_message_prefers_plain_text_in_nested_parts():
+	msg = _message("m1", [("Subject", "Kickoff"), ("From", "Alice <alice@example.com>"), ("SUBJECT", "ignored duplicate")], {
+		"mimeType": "multipart/mixed",
+		"parts": [
+			{"mimeType": "multipart/alternative", "parts": [
+				{"mimeType": "text/html", "body": {"data": _b64("<p>html version</p>")}},
+				{"mimeType": "text/plain", "body": {"data": _b64("plain version")}},
+			]},
+			{"mimeType": "application/pdf", "body": {"attachmentId": "a1"}},
+		],
+	})
+	parsed = mime.parse_message(msg)
+	assert parsed.subject == "Kickoff"
+	assert parsed.header("FROM") == "Alice <alice@example.com>"
+	assert parsed.body == "plain version"
+	assert parsed.internal_date == 1000
+
+
+def test_parse_message_falls_back_to_html_and_handles_missing_body():
+	html = "<html><head><style>p {}</style></head><body><p>Hello&nbsp;team</p><div>Second line</div><script>x()</script></body></html>"
+	parsed = mime.parse_message(_message("m1", [], {"mimeType": "text/html", "body": {"data": _b64(html)}}))
+	assert parsed.body == "Hello\xa0team\n\nSecond line"
+	assert parsed.subject == "No Subject"
+
+	empty = mime.parse_message(_message("m2", [], {"mimeType": "multipart/mixed", "parts": []}))
+	assert empty.body == mime.NO_BODY
+
+
+def test_thread_participants_and_adapter_meta(monkeypatch):
+	monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+	thread = mime.parse_thread({"id": "t1", "messages": [
+		_message("m1", [("Subject", "Budget"), ("From", "Alice <alice@example.com>"), ("To", "bob@example.com, Carol <carol@example.com>")],
+			{"mimeType": "text/plain", "body": {"data": _b64("Numbers attached")}}),
+		_message("m2", [("Subject", "Re: Budget"), ("From", "Bob <BOB@example.com>"), ("To", "alice@example.com")],
+			{"mimeType": "text/plain", "body": {"data": _b64("Thanks")}}),
+	]})
+	assert thread.subject == "Budget"
+	assert thread.participants == ["Alice <alice@example.com>", "bob@example.com", "Carol <carol@example.com>"]
+	assert "Subject: Re: Budget\n\nThanks" in thread.to_text()
+
+	draft = adapter.draft_reply(thread, {"tone": "friendly"})
+	assert draft["meta"]["subject"] == "Budget"
+	assert draft["meta"]["participants"] == thread.participants
+
+	failed = mime.ParsedThread("t2", [], error="[Thread t2] No access token available.")
+	assert failed.to_text() == "[Thread t2] No access token available."
@@ -0,0 +1,176 @@
+from types import SimpleNamespace
+import asyncio
+import weakref
+
+from api.adapters import openai_email_reply as adapter
+
+
+class FakeOpenAI:
+	calls = []
+	instances = []
+
+	def __init__(self, api_key=None, **kwargs):
+		FakeOpenAI.instances.append(api_key)
+		self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+	def _create(self, **kwargs):
+		FakeOpenAI.calls.append(kwargs)
+		usage = SimpleNamespace(
+			prompt_tokens=100,
+			completion_tokens=20,
+			total_tokens=120,
+			prompt_tokens_details=SimpleNamespace(cached_tokens=64),
+		)
+		message = SimpleNamespace(content=f"Draft #{len(FakeOpenAI.calls)}")
+		return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+
+def _use_fake_openai(monkeypatch):
+	FakeOpenAI.calls = []
+	FakeOpenAI.instances = []
+	monkeypatch.setattr(adapter, "_sync_client", None)
+	monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+	monkeypatch.setattr(adapter, "OPENAI_AVAILABLE", True)
+	monkeypatch.setattr(adapter, "OpenAI", FakeOpenAI, raising=False)
+	monkeypatch.setattr(adapter, "_PERSISTENCE_AVAILABLE", False)
+	monkeypatch.setattr(adapter, "_draft_cache", adapter.OrderedDict())
+
+
+def test_draft_cache_hits_on_same_thread_and_controls(monkeypatch):
+	_use_fake_openai(monkeypatch)
+	controls = {"tone": "formal", "length": 80, "bullets": False}
+
+	first = adapter.draft_reply("Hello   there\nteam", controls)
+	assert first["meta"]["cache"] == {"hit": False, "tier": None}
+
+	# Whitespace differences normalize to the same key
+	second = adapter.draft_reply("Hello there team", controls)
+	assert second["text"] == first["text"]
+	assert second["meta"]["cache"] == {"hit": True, "tier": "memory"}
+	assert len(FakeOpenAI.calls) == 1
+	# Usage reflects what this call spent (nothing), not the cached generation
+	assert first["meta"]["token_usage"]["total_tokens"] == 120
+	assert second["meta"]["token_usage"]["cached"] is True
+	assert second["meta"]["token_usage"]["prompt_tokens"] == second["meta"]["token_usage"]["completion_tokens"] == 0
+
+	# Different controls miss
+	adapter.draft_reply("Hello there team", {**controls, "tone": "friendly"})
+	assert len(FakeOpenAI.calls) == 2
+
+	# So does a prompt change (PROMPT_VERSION bump)
+	monkeypatch.setattr(adapter, "PROMPT_VERSION", adapter.PROMPT_VERSION + 1)
+	adapter.draft_reply("Hello there team", controls)
+	assert len(FakeOpenAI.calls) == 3
+
+
+def test_regenerate_bypasses_cache_and_stores_new_variant(monkeypatch):
+	_use_fake_openai(monkeypatch)
+	controls = {"tone": "friendly"}
+
+	first = adapter.draft_reply("Thread", controls)
+	fresh = adapter.draft_reply("Thread", {**controls, "regenerate": True})
+	assert fresh["text"] != first["text"]
+	assert fresh["meta"]["cache"]["hit"] is False
+
+	again = adapter.draft_reply("Thread", controls)
+	assert again["text"] == fresh["text"]
+	assert len(FakeOpenAI.calls) == 2
+
+
+def test_client_is_reused_until_key_changes(monkeypatch):
+	_use_fake_openai(monkeypatch)
+
+	adapter.draft_reply("Thread A", {"regenerate": True})
+	adapter.draft_reply("Thread B", {"regenerate": True})
+	assert FakeOpenAI.instances == ["sk-test"]
+
+	monkeypatch.setenv("OPENAI_API_KEY", "sk-rotated")
+	adapter.draft_reply("Thread C", {})
+	assert FakeOpenAI.instances == ["sk-test", "sk-rotated"]
+
+
+def test_astream_draft_reply_uses_shared_async_client_and_cache(monkeypatch):
+	_use_fake_openai(monkeypatch)
+	created = []
+
+	class FakeAsyncOpenAI:
+		def __init__(self, api_key=None, **kwargs):
+			created.append(api_key)
+			self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+		async def close(self):
+			pass
+
+		async def _create(self, **kwargs):
+			FakeOpenAI.calls.append(kwargs)
+
+			async def chunks():
+				for text in ("Streamed ", "draft"):
+					yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))], usage=None)
+				yield SimpleNamespace(choices=[], usage=SimpleNamespace(prompt_tokens=100, completion_tokens=2, total_tokens=102, prompt_tokens_details=None))
+			return chunks()
+
+	monkeypatch.setattr(adapter, "AsyncOpenAI", FakeAsyncOpenAI, raising=False)
+	monkeypatch.setattr(adapter, "_async_clients", weakref.WeakKeyDictionary())
+
+	async def run():
+		first = [event async for event in adapter.astream_draft_reply("Async thread", {"tone": "brief"})]
+		second = [event async for event in adapter.astream_draft_reply("Async thread", {"tone": "brief"})]
+		return first, second
+
+	first, second = asyncio.run(run())
+	assert [e["text"] for e in first if e["type"] == "delta"] == ["Streamed ", "draft"]
+	assert first[-1]["meta"]["cache"]["hit"] is False
+	assert first[-1]["meta"]["token_usage"]["completion_tokens"] == 2
+	assert second[-1]["text"] == "Streamed draft"
+	assert second[-1]["meta"]["cache"] == {"hit": True, "tier": "memory"}
+	assert len(FakeOpenAI.calls) == 1 and FakeOpenAI.calls[0]["stream"] is True
+	assert created == ["sk-test"]
+
+
+def test_async_client_is_per_event_loop_and_closed_on_key_change(monkeypatch):
+	_use_fake_openai(monkeypatch)
+	closed = []
+
+	class FakeAsyncOpenAI:
+		def __init__(self, api_key=None, **kwargs):
+			self.api_key = api_key
+
+		async def close(self):
+			closed.append(self.api_key)
+
+	monkeypatch.setattr(adapter, "AsyncOpenAI", FakeAsyncOpenAI, raising=False)
+	monkeypatch.setattr(adapter, "_async_clients", weakref.WeakKeyDictionary())
+
+	async def rotate():
+		first = adapter.get_async_client()
+		assert adapter.get_async_client() is first
+		monkeypatch.setenv("OPENAI_API_KEY", "sk-rotated")
+		rotated = adapter.get_async_client()
+		await asyncio.sleep(0)  # let the background close run
+		assert closed == ["sk-test"]
+		await adapter.aclose()
+		assert closed == ["sk-test", "sk-rotated"]
+		return rotated
+
+	async def current():
+		return adapter.get_async_client()
+
+	rotated = asyncio.run(rotate())
+	# A new event loop never reuses a client bound to an earlier one
+	assert asyncio.run(current()) is not rotated
+
+
+def test_prompt_layout_keeps_static_prefix_first_and_reports_cached_tokens(monkeypatch):
+	_use_fake_openai(monkeypatch)
+
+	draft = adapter.draft_reply("Thread X", {"tone": "formal", "length": 50, "bullets": True})
+	adapter.draft_reply("Thread X", {"tone": "brief", "length": 80})
+	first, second = (call["messages"] for call in FakeOpenAI.calls)
+
+	# Everything up to the controls message is byte-identical across control combinations
+	assert first[:2] == second[:2]
+	assert first[0]["content"] is adapter._SYSTEM_PROMPT
+	assert "formal" not in first[0]["content"] and "Tone:" in first[-1]["content"]
+	assert "bullet points" in first[-1]["content"] and "bullet points" not in second[-1]["content"]
+	assert draft["meta"]["token_usage"]["cached_tokens"] == 64
@@ -0,0 +1,143 @@
+import json
+
+from api.services import persistence
+
+
+class _Resp:
+	def __init__(self, data):
+		self._data = data
+
+	def raise_for_status(self):
+		pass
+
+	def json(self):
+		return self._data
+
+
+class FakeUpstash:
+	def __init__(self):
+		self.store = {}
+		self.requests = []
+
+	def post(self, url, headers=None, json=None, timeout=None):
+		self.requests.append(json)
+		out = []
+		for cmd in json:
+			if cmd[0] == "SETEX":
+				self.store[cmd[1]] = cmd[3]
+				out.append({"result": "OK"})
+			elif cmd[0] == "GET":
+				out.append({"result": self.store.get(cmd[1])})
+			elif cmd[0] == "MGET":
+				out.append({"result": [self.store.get(k) for k in cmd[1:]]})
+		return _Resp(out)
+
+
+def _configure(monkeypatch):
+	fake = FakeUpstash()
+	monkeypatch.setenv("UPSTASH_REDIS_REST_URL", "https://redis.example.com")
+	monkeypatch.setenv("UPSTASH_REDIS_REST_TOKEN", "token")
+	monkeypatch.setattr(persistence, "_upstash_session", lambda: fake)
+	return fake
+
+
+def test_multi_key_helpers_use_one_pipeline_request(monkeypatch):
+	fake = _configure(monkeypatch)
+
+	assert persistence.redis_msetex_json({"k1": {"a": 1}, "k2": {"b": 2}}, 60)
+	assert len(fake.requests) == 1
+	assert [cmd[0] for cmd in fake.requests[0]] == ["SETEX", "SETEX"]
+
+	found = persistence.redis_mget_json(["k1", "missing", "k2"])
+	assert found == {"k1": {"a": 1}, "k2": {"b": 2}}
+	assert len(fake.requests) == 2
+
+
+def test_jobs_round_trip_with_ttl(monkeypatch):
+	fake = _configure(monkeypatch)
+
+	assert persistence.write_job_to_redis("j1", {"status": "done"}, ttl_seconds=30)
+	assert fake.requests[0][0][:3] == ["SETEX", "emailreply:job:j1", "30"]
+	assert json.loads(fake.requests[0][0][3]) == {"status": "done"}
+	assert persistence.read_job_from_redis("j1") == {"status": "done"}
+
+
+def test_redis_helpers_are_noops_without_config(monkeypatch):
+	monkeypatch.delenv("UPSTASH_REDIS_REST_URL", raising=False)
+	assert persistence.redis_get_json("k") is None
+	assert persistence.redis_mget_json(["k"]) == {}
+	assert persistence.redis_setex_json("k", 10, {}) is False
+
+
+def test_write_behind_buffer_flushes_in_bulk_and_retries():
+	import time
+	from api.services.write_behind import WriteBehindBuffer
+
+	batches = []
+	failures = [1]
+
+	def flush(records):
+		if failures[0]:
+			failures[0] -= 1
+			raise RuntimeError("db down")
+		batches.append(list(records))
+		return True
+
+	buffer = WriteBehindBuffer(flush, batch_size=3, flush_interval=60, backoff_seconds=0.01)
+	for i in range(3):
+		assert buffer.enqueue({"n": i})
+
+	deadline = time.time() + 2
+	while not batches and time.time() < deadline:
+		time.sleep(0.01)
+	assert batches == [[{"n": 0}, {"n": 1}, {"n": 2}]]
+
+	# Below batch size and before the interval: only drain flushes it
+	buffer.enqueue({"n": 3})
+	time.sleep(0.05)
+	assert len(batches) == 1
+	buffer.drain()
+	assert batches[-1] == [{"n": 3}]
+	assert buffer.pending() == 0
+
+
+def test_write_behind_buffer_isolates_rejected_records():
+	from api.services.write_behind import PermanentFlushError, WriteBehindBuffer
+
+	calls = []
+
+	def flush(records):
+		calls.append([r["n"] for r in records])
+		if any(r.get("bad") for r in records):
+			raise PermanentFlushError("400 bad row")
+		return True
+
+	buffer = WriteBehindBuffer(flush, batch_size=3, flush_interval=60, backoff_seconds=0.01)
+	for record in ({"n": 0}, {"n": 1, "bad": True}, {"n": 2}):
+		buffer.enqueue(record)
+	buffer.drain()
+
+	# One bulk attempt, then one attempt per record: no backoff retries for a rejected row
+	assert calls == [[0, 1, 2], [0], [1], [2]]
+	assert buffer.dropped == 1
+
+
+def test_persist_messages_does_not_retry_client_errors(monkeypatch):
+	import pytest
+	from api.services.write_behind import PermanentFlushError
+
+	class _Session:
+		status = 400
+
+		def post(self, url, headers=None, json=None, timeout=None):
+			return type("R", (), {"status_code": self.status, "text": "bad"})()
+
+	session = _Session()
+	monkeypatch.setenv("SUPABASE_URL", "https://db.example.com")
+	monkeypatch.setenv("SUPABASE_SERVICE_ROLE", "key")
+	monkeypatch.setattr(persistence, "_supabase_session", lambda: session)
+
+	with pytest.raises(PermanentFlushError):
+		persistence.persist_messages_to_supabase([{"content": "x"}])
+	session.status = 503
+	assert persistence.persist_messages_to_supabase([{"content": "x"}]) is False
@@ -0,0 +1,68 @@
+from api.services import supabase_rest
+
+
+class _Resp:
+	def __init__(self, status_code, data=None):
+		self.status_code = status_code
+		self.reason = "OK" if status_code < 400 else "Not Found"
+		self.text = ""
+		self._data = data
+
+	def json(self):
+		return self._data
+
+
+class FakeSession:
+	def __init__(self):
+		self.urls = []
+
+	def get(self, url, **kwargs):
+		self.urls.append(url)
+		return _Resp(404)
+
+	def post(self, url, **kwargs):
+		self.urls.append(url)
+		if url.endswith("/rpc/get_oauth_token"):
+			return _Resp(200, [{"access_token": "tok_rpc"}])
+		return _Resp(404)
+
+
+def test_select_oauth_token_remembers_working_strategy(monkeypatch):
+	session = FakeSession()
+	monkeypatch.setenv("SUPABASE_URL", "https://db.example.com")
+	monkeypatch.setenv("SUPABASE_SERVICE_ROLE", "service-key")
+	monkeypatch.setattr(supabase_rest, "get_session", lambda: session)
+	monkeypatch.setitem(supabase_rest._sticky_strategy, "select", None)
+
+	assert supabase_rest.select_oauth_token("p1")["access_token"] == "tok_rpc"
+	assert [u.rsplit("/", 1)[-1] for u in session.urls] == ["oauth_tokens", "emailreply.oauth_tokens", "get_oauth_token"]
+
+	session.urls.clear()
+	assert supabase_rest.select_oauth_token("p1")["access_token"] == "tok_rpc"
+	assert [u.rsplit("/", 1)[-1] for u in session.urls] == ["get_oauth_token"]
+
+
+def test_select_oauth_token_async_shares_sticky_strategy(monkeypatch):
+	import asyncio
+	import httpx
+
+	urls = []
+
+	def handler(request):
+		urls.append(request.url.path)
+		if request.url.path.endswith("/rpc/get_oauth_token"):
+			return httpx.Response(200, json=[{"access_token": "tok_async"}])
+		return httpx.Response(404)
+
+	monkeypatch.setenv("SUPABASE_URL", "https://db.example.com")
+	monkeypatch.setenv("SUPABASE_SERVICE_ROLE", "service-key")
+	monkeypatch.setattr(supabase_rest, "get_async_client", lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+	monkeypatch.setitem(supabase_rest._sticky_strategy, "select", None)
+
+	assert asyncio.run(supabase_rest.select_oauth_token_async("p1"))["access_token"] == "tok_async"
+	assert [u.rsplit("/", 1)[-1] for u in urls] == ["oauth_tokens", "emailreply.oauth_tokens", "get_oauth_token"]
+	assert supabase_rest._sticky_strategy["select"] == "rpc"
+
+	urls.clear()
+	assert asyncio.run(supabase_rest.select_oauth_token_async("p1"))["access_token"] == "tok_async"
+	assert [u.rsplit("/", 1)[-1] for u in urls] == ["get_oauth_token"]
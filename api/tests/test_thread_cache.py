@@ -0,0 +1,166 @@
+import time
+from concurrent.futures import wait
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api.main import app
+from api.services import gmail_client, gmail_quota
+from api.services.mime import ParsedMessage, ParsedThread
+
+client = TestClient(app)
+
+
+def test_threads_listing_prefetches_top_threads_in_background(monkeypatch):
+	fetched = []
+
+	def fake_get_thread(profile_id, thread_id):
+		fetched.append((profile_id, thread_id, gmail_quota._priority.get()))
+		return {"id": thread_id}
+
+	submitted = []
+	real_prefetch = gmail_client.prefetch_threads
+	monkeypatch.setattr(gmail_client, "get_thread", fake_get_thread)
+	monkeypatch.setattr(gmail_client, "list_threads", lambda project_id, max_results=20: [{"id": f"t{i}"} for i in range(6)])
+	monkeypatch.setattr(gmail_client, "prefetch_threads", lambda *a, **kw: submitted.extend(real_prefetch(*a, **kw)))
+
+	r = client.get("/threads", params={"projectId": "p1", "prefetch": 2})
+	assert r.status_code == 200 and len(r.json()["items"]) == 6
+	wait(submitted, timeout=5)
+	assert sorted(fetched) == [("p1", "t0", gmail_quota.BACKGROUND), ("p1", "t1", gmail_quota.BACKGROUND)]
+
+	# Listing again within the cache TTL does not refetch the same threads
+	submitted.clear()
+	client.get("/threads", params={"projectId": "p1", "prefetch": 2})
+	assert submitted == []
+
+
+def test_prefetch_respects_per_project_budget(monkeypatch):
+	monkeypatch.setattr(gmail_client, "get_thread", lambda profile_id, thread_id: None)
+	monkeypatch.setattr(gmail_client, "_PREFETCH_BUDGET", 3)
+
+	first = gmail_client.prefetch_threads("p2", ["a", "b"], count=5)
+	second = gmail_client.prefetch_threads("p2", ["c", "d", "e"], count=5)
+	other = gmail_client.prefetch_threads("p3", ["a"], count=5)
+	wait(first + second + other, timeout=5)
+	assert (len(first), len(second), len(other)) == (2, 1, 1)
+	assert gmail_client.prefetch_threads("p2", ["f"], count=0) == []
+
+
+def _parsed(thread_id, body):
+	headers = {"from": "Ann <ann@example.com>", "subject": "Quote", "message-id": f"<{thread_id}@mail>"}
+	return ParsedThread(thread_id, [ParsedMessage(f"{thread_id}-m1", thread_id, 1700000000000, headers, body)])
+
+
+def _count_fetches(monkeypatch, body="v1"):
+	fetches = []
+
+	def fake_fetch(thread_id, token, project_id=None):
+		fetches.append(thread_id)
+		return _parsed(thread_id, body if isinstance(body, str) else body[len(fetches) - 1])
+
+	monkeypatch.setattr("api.services.gmail.resolve_oauth_token", lambda project_id: "tok_123")
+	monkeypatch.setattr("api.services.gmail.fetch_thread", fake_fetch)
+	monkeypatch.setattr("api.services.gmail.sync_mailbox", lambda project_id, access_token=None: None)
+	return fetches
+
+
+def test_parsed_thread_is_served_from_local_cache(monkeypatch):
+	fetches = _count_fetches(monkeypatch)
+	first = gmail_client.get_parsed_thread("p1", "t1", access_token="tok_123")
+
+	monkeypatch.setattr(gmail_client, "redis_get_json", lambda key: pytest.fail("local hit should not reach Redis"))
+	second = gmail_client.get_parsed_thread("p1", "t1")
+	assert fetches == ["t1"]
+	assert second.to_text() == first.to_text()
+	assert (second.subject, second.participants) == ("Quote", ["Ann <ann@example.com>"])
+	assert second.messages[0].header("message-id") == "<t1@mail>"
+
+
+def test_stale_thread_is_served_while_refreshing(monkeypatch):
+	fetches = _count_fetches(monkeypatch, body=["old", "new"])
+	now = [1000.0]
+	monkeypatch.setattr("api.services.gmail_client.time.time", lambda: now[0])
+	submitted = []
+	executor = gmail_client._get_background_executor()
+	monkeypatch.setattr(gmail_client, "_get_background_executor", lambda: SimpleNamespace(submit=lambda *a: submitted.append(executor.submit(*a))))
+
+	assert gmail_client.get_thread("p1", "t1")["messages"][0]["text"] == "old"
+	now[0] += gmail_client._THREAD_CACHE_FRESH_SECONDS + 1
+	assert gmail_client.get_thread("p1", "t1")["messages"][0]["text"] == "old"
+	wait(submitted, timeout=5)
+	assert fetches == ["t1", "t1"]
+	assert gmail_client.get_thread("p1", "t1")["messages"][0]["text"] == "new"
+
+	# Past the TTL the entry is gone and the read fetches synchronously
+	now[0] += gmail_client._THREAD_CACHE_TTL_SECONDS
+	monkeypatch.setattr("api.services.gmail.fetch_thread", lambda thread_id, token, project_id=None: _parsed(thread_id, "newest"))
+	assert gmail_client.get_thread("p1", "t1")["messages"][0]["text"] == "newest"
+
+
+def test_local_cache_is_bounded_and_skips_failed_fetches(monkeypatch):
+	fetches = _count_fetches(monkeypatch)
+	monkeypatch.setattr(gmail_client, "_THREAD_CACHE_SIZE", 2)
+	for thread_id in ("a", "b", "c"):
+		gmail_client.get_thread("p1", thread_id)
+	assert list(gmail_client._thread_cache) == [gmail_client._cache_key_for_thread("p1", t) for t in ("b", "c")]
+
+	monkeypatch.setattr("api.services.gmail.fetch_thread", lambda thread_id, token, project_id=None: ParsedThread(thread_id, [], error="boom"))
+	assert gmail_client.get_parsed_thread("p1", "bad").error == "boom"
+	assert gmail_client._cache_key_for_thread("p1", "bad") not in gmail_client._thread_cache
+	assert fetches == ["a", "b", "c"]
+
+
+def test_send_invalidates_cached_thread(monkeypatch):
+	fetches = _count_fetches(monkeypatch)
+	gmail_client.get_parsed_thread("p1", "t-sent")
+
+	async def fake_resolve(project_id):
+		return "tok_123"
+
+	async def fake_send(**kwargs):
+		return {"success": True, "messageId": "m-new", "threadId": kwargs["thread_id"]}
+
+	monkeypatch.setattr("api.services.gmail.resolve_oauth_token_async", fake_resolve)
+	monkeypatch.setattr("api.services.gmail.send_reply_async", fake_send)
+	r = client.post("/gmail/send", json={"projectId": "p1", "threadId": "t-sent", "draftText": "Thanks!"})
+	assert r.status_code == 200
+
+	gmail_client.get_parsed_thread("p1", "t-sent")
+	assert fetches == ["t-sent", "t-sent"]
+
+
+def test_draft_path_drops_cached_thread_changed_in_mailbox_history(monkeypatch):
+	fetches = _count_fetches(monkeypatch, body=["v1", "v2", "v3"])
+	gmail_client.get_parsed_thread("p1", "t1")
+	gmail_client.get_parsed_thread("p1", "t2")
+
+	def fake_sync(project_id, access_token=None):
+		# What gmail_sync.sync_history reports when a new message landed in t1
+		gmail_client._on_threads_changed(project_id, {"t1"})
+		return 0.0
+
+	monkeypatch.setattr("api.services.gmail.sync_mailbox", fake_sync)
+	assert gmail_client.get_parsed_thread("p1", "t1").messages[0].body == "v3"
+	assert gmail_client.get_parsed_thread("p1", "t2").messages[0].body == "v2"
+	assert fetches == ["t1", "t2", "t1"]
+
+	# A cached copy older than the tracked history window is refetched as well
+	monkeypatch.setattr("api.services.gmail.sync_mailbox", lambda project_id, access_token=None: time.time() + 5)
+	monkeypatch.setattr("api.services.gmail.fetch_thread", lambda thread_id, token, project_id=None: _parsed(thread_id, "v4"))
+	assert gmail_client.get_parsed_thread("p1", "t2").messages[0].body == "v4"
+
+
+def test_invalidation_during_fetch_is_not_overwritten(monkeypatch):
+	writes = []
+
+	def fetch_then_invalidate(thread_id, token, project_id=None):
+		gmail_client.invalidate_thread(project_id, thread_id)
+		return _parsed(thread_id, "old")
+
+	monkeypatch.setattr("api.services.gmail.fetch_thread", fetch_then_invalidate)
+	monkeypatch.setattr(gmail_client, "redis_setex_json", lambda *args: writes.append(args))
+	assert gmail_client.get_parsed_thread("p1", "t1", access_token="tok_123").messages[0].body == "old"
+	assert gmail_client._cache_key_for_thread("p1", "t1") not in gmail_client._thread_cache
+	assert writes == []
@@ -0,0 +1,123 @@
+import time
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+from api.main import app
+from api.services import gmail_client, persistence, thread_index
+from api.services.mime import ParsedMessage, ParsedThread
+
+client = TestClient(app)
+
+
+def test_index_search_ranks_and_keeps_body_on_list_update():
+	persistence.persist_gmail_thread_index("p1", {
+		"id": "t1",
+		"subject": "Quarterly invoice",
+		"participants": ["Alice <alice@example.com>"],
+		"snippet": "Please find attached",
+		"messages": [{"text": "The payment terms are net 30."}],
+	})
+	thread_index.upsert_thread("p1", "t2", subject="Lunch plans", sender="Bob", snippet="invoice mentioned in passing")
+	thread_index.upsert_thread("p2", "t3", subject="Invoice for another project")
+
+	results = thread_index.search("p1", "invoice")
+	assert [r["id"] for r in results] == ["t1", "t2"]
+
+	# A list-view update (no body) must not wipe the indexed body
+	thread_index.upsert_thread("p1", "t1", subject="Quarterly invoice (updated)", snippet="new snippet")
+	assert [r["id"] for r in thread_index.search("p1", "payment term")] == ["t1"]
+	assert thread_index.search("p1", "quarter")[0]["subject"] == "Quarterly invoice (updated)"
+	assert thread_index.search("p1", "alice")[0]["id"] == "t1"
+	assert thread_index.search("p1", '"unbalanced OR (') == []
+
+
+def test_search_endpoint_answers_from_index_without_gmail(monkeypatch):
+	thread_index.upsert_thread("default", "t1", subject="Contract renewal", sender="Carol", snippet="renewal terms")
+	submitted = []
+	monkeypatch.setattr(gmail_client, "_get_background_executor", lambda: SimpleNamespace(submit=lambda fn, *a: submitted.append((fn, a))))
+
+	def fail_list(*args, **kwargs):
+		raise AssertionError("Gmail should not be queried")
+
+	monkeypatch.setattr("api.services.gmail.list_threads", fail_list)
+	r = client.get("/threads/search", params={"projectId": "default", "q": "renewal", "limit": 1})
+	assert r.status_code == 200
+	body = r.json()
+	assert body["source"] == "index"
+	assert body["items"][0] == {"id": "t1", "subject": "Contract renewal", "from": "Carol", "date": "", "snippet": "renewal terms"}
+	# A full index answer only schedules a background refresh
+	assert [fn for fn, _ in submitted] == [gmail_client._search_topup]
+
+
+def test_search_falls_back_to_gmail_and_indexes_results(monkeypatch):
+	calls = []
+
+	def fake_list(project_id, max_results=20, query=None):
+		calls.append(query)
+		return [{"id": "g1", "subject": "Renewal quote", "from": "Dan", "date": "Mon", "snippet": "quote attached"}]
+
+	monkeypatch.setattr("api.services.gmail.list_threads", fake_list)
+	result = gmail_client.search_threads("default", "renewal quote", limit=5)
+	assert result["source"] == "index+gmail"
+	assert [item["id"] for item in result["items"]] == ["g1"]
+	assert calls == ["renewal quote"]
+
+	# Now indexed: answered locally
+	assert [r["id"] for r in thread_index.search("default", "quote")] == ["g1"]
+
+
+def test_search_merges_gmail_matches_not_indexed_yet(monkeypatch):
+	thread_index.upsert_thread("default", "t1", subject="Renewal terms", sender="Carol", snippet="renewal")
+	monkeypatch.setattr("api.services.gmail.list_threads", lambda project_id, max_results=20, query=None: [
+		{"id": "t1", "subject": "Renewal terms", "from": "Carol", "date": "", "snippet": "renewal"},
+		{"id": "g2", "subject": "Renewal invoice", "from": "Dan", "date": "Tue", "snippet": "renewal invoice"},
+	])
+
+	result = gmail_client.search_threads("default", "renewal", limit=5)
+	assert result["source"] == "index+gmail"
+	assert [item["id"] for item in result["items"]] == ["t1", "g2"]
+	assert {r["id"] for r in thread_index.search("default", "renewal")} == {"t1", "g2"}
+
+
+def test_slow_gmail_search_answers_from_index_and_indexes_later(monkeypatch):
+	import threading
+
+	thread_index.upsert_thread("default", "t1", subject="Renewal terms", sender="Carol", snippet="renewal")
+	release = threading.Event()
+
+	def slow_list(project_id, max_results=20, query=None):
+		release.wait(2)
+		return [{"id": "g2", "subject": "Renewal invoice", "from": "Dan", "date": "Tue", "snippet": "renewal invoice"}]
+
+	monkeypatch.setattr("api.services.gmail.list_threads", slow_list)
+	monkeypatch.setattr(gmail_client, "_SEARCH_GMAIL_TIMEOUT_SECONDS", 0.05)
+
+	result = gmail_client.search_threads("default", "renewal", limit=5)
+	assert result == {"items": [thread_index.search("default", "renewal")[0]], "source": "index"}
+
+	release.set()
+	deadline = time.time() + 2
+	while len(thread_index.search("default", "renewal")) < 2 and time.time() < deadline:
+		time.sleep(0.01)
+	assert {r["id"] for r in thread_index.search("default", "renewal")} == {"t1", "g2"}
+
+
+def test_threads_cached_by_get_thread_are_indexed_with_sender_and_date(monkeypatch):
+	headers = {"from": "Erin <erin@example.com>", "date": "Wed, 1 May 2024", "subject": "Budget"}
+	monkeypatch.setattr("api.services.gmail.fetch_thread", lambda thread_id, token, project_id=None: ParsedThread(thread_id, [ParsedMessage("m1", thread_id, 0, headers, "numbers")]))
+	gmail_client.get_thread("default", "t-budget", access_token="tok_123")
+	assert thread_index.search("default", "budget")[0] == {"id": "t-budget", "subject": "Budget", "from": "Erin <erin@example.com>", "date": "Wed, 1 May 2024", "snippet": "numbers"}
+
+
+def test_index_file_is_private_and_evicts_least_recently_updated(monkeypatch):
+	import os
+	import stat
+
+	monkeypatch.setattr(thread_index, "_MAX_THREADS", 2)
+	monkeypatch.setattr(thread_index, "_PRUNE_EVERY", 1)
+	for i in range(3):
+		thread_index.upsert_thread("p-cap", f"t{i}", subject=f"Capped thread {i}")
+
+	assert stat.S_IMODE(os.stat(os.environ["THREAD_INDEX_PATH"]).st_mode) == 0o600
+	assert sorted(item["id"] for item in thread_index.search("p-cap", "capped")) == ["t1", "t2"]
@@ -0,0 +1,241 @@
+-- Migration: Incrementally maintained dashboard counters
+-- get_dashboard_stats (011) scanned all of emailreply.messages / emailreply.jobs on every call.
+-- Counters now live in a rollup table kept current by triggers, so the RPC reads one row.
+
+-- Triggers, lock and backfill run in one transaction: no write can land between the
+-- backfill snapshot and the triggers taking over, and a failure leaves nothing half-applied.
+BEGIN;
+
+CREATE SCHEMA IF NOT EXISTS emailreply;
+
+-- One row per project (meta->>'projectId') plus the '*' row aggregating every project
+CREATE TABLE IF NOT EXISTS emailreply.dashboard_counters (
+    project_key TEXT PRIMARY KEY,
+    replies_count BIGINT NOT NULL DEFAULT 0,
+    total_length BIGINT NOT NULL DEFAULT 0,
+    jobs_done BIGINT NOT NULL DEFAULT 0,
+    jobs_error BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Apply one statement's per-project deltas: a single upsert touching each project row once
+-- and the '*' row once with the summed totals (NULL keys only count towards '*')
+DROP FUNCTION IF EXISTS emailreply.bump_dashboard_counters(TEXT, BIGINT, BIGINT, BIGINT, BIGINT);
+CREATE OR REPLACE FUNCTION emailreply.bump_dashboard_counters(
+    p_keys TEXT[],
+    p_replies BIGINT[],
+    p_length BIGINT[],
+    p_done BIGINT[],
+    p_error BIGINT[]
+)
+RETURNS VOID
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+BEGIN
+    INSERT INTO emailreply.dashboard_counters AS c (project_key, replies_count, total_length, jobs_done, jobs_error)
+    SELECT
+        CASE WHEN GROUPING(d.k) = 1 THEN '*' ELSE d.k END,
+        SUM(d.replies), SUM(d.len), SUM(d.done), SUM(d.error)
+    FROM unnest(p_keys, p_replies, p_length, p_done, p_error) AS d(k, replies, len, done, error)
+    GROUP BY GROUPING SETS ((d.k), ())
+    HAVING (GROUPING(d.k) = 1 OR d.k IS NOT NULL)
+        AND (SUM(d.replies) <> 0 OR SUM(d.len) <> 0 OR SUM(d.done) <> 0 OR SUM(d.error) <> 0)
+    ON CONFLICT (project_key) DO UPDATE SET
+        replies_count = c.replies_count + EXCLUDED.replies_count,
+        total_length = c.total_length + EXCLUDED.total_length,
+        jobs_done = c.jobs_done + EXCLUDED.jobs_done,
+        jobs_error = c.jobs_error + EXCLUDED.jobs_error,
+        updated_at = now();
+END;
+$$;
+
+-- Assistant messages (generated replies): count and total length.
+-- Statement-level: rows entering the counted set (new_rows) add, rows leaving it (old_rows)
+-- subtract, so an UPDATE that changes role/content/projectId moves the counts correctly.
+CREATE OR REPLACE FUNCTION emailreply.trg_messages_dashboard_counters()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_keys TEXT[];
+    v_replies BIGINT[];
+    v_length BIGINT[];
+BEGIN
+    IF TG_OP <> 'DELETE' THEN
+        SELECT array_agg(k), array_agg(n), array_agg(len)
+        INTO v_keys, v_replies, v_length
+        FROM (
+            SELECT meta->>'projectId' AS k, COUNT(*) AS n, SUM(LENGTH(content)) AS len
+            FROM new_rows WHERE role = 'assistant' GROUP BY 1
+        ) d;
+    END IF;
+    IF TG_OP <> 'INSERT' THEN
+        SELECT v_keys || array_agg(k), v_replies || array_agg(-n), v_length || array_agg(-len)
+        INTO v_keys, v_replies, v_length
+        FROM (
+            SELECT meta->>'projectId' AS k, COUNT(*) AS n, SUM(LENGTH(content)) AS len
+            FROM old_rows WHERE role = 'assistant' GROUP BY 1
+        ) d;
+    END IF;
+    IF cardinality(v_keys) > 0 THEN
+        PERFORM emailreply.bump_dashboard_counters(
+            v_keys, v_replies, v_length,
+            array_fill(0::BIGINT, ARRAY[cardinality(v_keys)]),
+            array_fill(0::BIGINT, ARRAY[cardinality(v_keys)])
+        );
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- Transition tables require one trigger per event
+DROP TRIGGER IF EXISTS messages_dashboard_counters ON emailreply.messages;
+DROP TRIGGER IF EXISTS messages_dashboard_counters_insert ON emailreply.messages;
+DROP TRIGGER IF EXISTS messages_dashboard_counters_update ON emailreply.messages;
+DROP TRIGGER IF EXISTS messages_dashboard_counters_delete ON emailreply.messages;
+CREATE TRIGGER messages_dashboard_counters_insert
+AFTER INSERT ON emailreply.messages
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION emailreply.trg_messages_dashboard_counters();
+CREATE TRIGGER messages_dashboard_counters_update
+AFTER UPDATE ON emailreply.messages
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION emailreply.trg_messages_dashboard_counters();
+CREATE TRIGGER messages_dashboard_counters_delete
+AFTER DELETE ON emailreply.messages
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION emailreply.trg_messages_dashboard_counters();
+
+-- draft_reply jobs: net transitions into (and out of) done / error per statement.
+-- An UPDATE that leaves status unchanged nets to zero and writes nothing.
+CREATE OR REPLACE FUNCTION emailreply.trg_jobs_dashboard_counters()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_keys TEXT[];
+    v_done BIGINT[];
+    v_error BIGINT[];
+BEGIN
+    IF TG_OP <> 'DELETE' THEN
+        SELECT array_agg(k), array_agg(done), array_agg(error)
+        INTO v_keys, v_done, v_error
+        FROM (
+            SELECT COALESCE(payload->>'projectId', project_id::TEXT) AS k,
+                COUNT(*) FILTER (WHERE status = 'done') AS done,
+                COUNT(*) FILTER (WHERE status = 'error') AS error
+            FROM new_rows WHERE kind = 'draft_reply' AND status IN ('done', 'error') GROUP BY 1
+        ) d;
+    END IF;
+    IF TG_OP <> 'INSERT' THEN
+        SELECT v_keys || array_agg(k), v_done || array_agg(-done), v_error || array_agg(-error)
+        INTO v_keys, v_done, v_error
+        FROM (
+            SELECT COALESCE(payload->>'projectId', project_id::TEXT) AS k,
+                COUNT(*) FILTER (WHERE status = 'done') AS done,
+                COUNT(*) FILTER (WHERE status = 'error') AS error
+            FROM old_rows WHERE kind = 'draft_reply' AND status IN ('done', 'error') GROUP BY 1
+        ) d;
+    END IF;
+    IF cardinality(v_keys) > 0 THEN
+        PERFORM emailreply.bump_dashboard_counters(
+            v_keys,
+            array_fill(0::BIGINT, ARRAY[cardinality(v_keys)]),
+            array_fill(0::BIGINT, ARRAY[cardinality(v_keys)]),
+            v_done, v_error
+        );
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS jobs_dashboard_counters ON emailreply.jobs;
+DROP TRIGGER IF EXISTS jobs_dashboard_counters_insert ON emailreply.jobs;
+DROP TRIGGER IF EXISTS jobs_dashboard_counters_update ON emailreply.jobs;
+DROP TRIGGER IF EXISTS jobs_dashboard_counters_delete ON emailreply.jobs;
+CREATE TRIGGER jobs_dashboard_counters_insert
+AFTER INSERT ON emailreply.jobs
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION emailreply.trg_jobs_dashboard_counters();
+CREATE TRIGGER jobs_dashboard_counters_update
+AFTER UPDATE ON emailreply.jobs
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION emailreply.trg_jobs_dashboard_counters();
+CREATE TRIGGER jobs_dashboard_counters_delete
+AFTER DELETE ON emailreply.jobs
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION emailreply.trg_jobs_dashboard_counters();
+
+-- One-time backfill from existing history (the triggers keep it current from here on).
+-- SHARE mode blocks writers until COMMIT, so the snapshot and the triggers line up exactly.
+LOCK TABLE emailreply.messages, emailreply.jobs IN SHARE MODE;
+TRUNCATE emailreply.dashboard_counters;
+
+INSERT INTO emailreply.dashboard_counters (project_key, replies_count, total_length)
+SELECT
+    CASE WHEN GROUPING(meta->>'projectId') = 1 THEN '*' ELSE meta->>'projectId' END,
+    COUNT(*),
+    COALESCE(SUM(LENGTH(content)), 0)
+FROM emailreply.messages
+WHERE role = 'assistant'
+GROUP BY GROUPING SETS ((meta->>'projectId'), ())
+HAVING GROUPING(meta->>'projectId') = 1 OR meta->>'projectId' IS NOT NULL;
+
+INSERT INTO emailreply.dashboard_counters AS c (project_key, jobs_done, jobs_error)
+SELECT
+    CASE WHEN GROUPING(COALESCE(payload->>'projectId', project_id::TEXT)) = 1 THEN '*'
+         ELSE COALESCE(payload->>'projectId', project_id::TEXT) END,
+    COUNT(*) FILTER (WHERE status = 'done'),
+    COUNT(*) FILTER (WHERE status = 'error')
+FROM emailreply.jobs
+WHERE kind = 'draft_reply'
+GROUP BY GROUPING SETS ((COALESCE(payload->>'projectId', project_id::TEXT)), ())
+ON CONFLICT (project_key) DO UPDATE SET
+    jobs_done = EXCLUDED.jobs_done,
+    jobs_error = EXCLUDED.jobs_error;
+
+COMMIT;
+
+-- Dashboard statistics: O(1) read of one counters row.
+-- 'default' keeps its meaning of "all projects" (the '*' row).
+-- Behaviour change from 011: successRate and avgDraftLength are now scoped to the requested
+-- project like repliesGenerated. 011 always computed those two across every project, so for
+-- a specific projectId the dashboard now shows that project's rate and average instead.
+CREATE OR REPLACE FUNCTION public.get_dashboard_stats(
+    p_project_id TEXT DEFAULT 'default'
+)
+RETURNS JSON
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    v_row emailreply.dashboard_counters%ROWTYPE;
+    v_success_rate NUMERIC;
+BEGIN
+    SELECT * INTO v_row
+    FROM emailreply.dashboard_counters
+    WHERE project_key = CASE WHEN p_project_id = 'default' THEN '*' ELSE p_project_id END;
+
+    IF COALESCE(v_row.jobs_done + v_row.jobs_error, 0) > 0 THEN
+        v_success_rate := ROUND((v_row.jobs_done::NUMERIC / (v_row.jobs_done + v_row.jobs_error)) * 100, 0);
+    ELSE
+        v_success_rate := 100;
+    END IF;
+
+    RETURN json_build_object(
+        'repliesGenerated', COALESCE(v_row.replies_count, 0),
+        'successRate', v_success_rate,
+        'avgDraftLength', CASE WHEN COALESCE(v_row.replies_count, 0) > 0
+            THEN ROUND(v_row.total_length::NUMERIC / v_row.replies_count, 0) ELSE 0 END,
+        'timeSavedMinutes', COALESCE(v_row.replies_count, 0) * 5, -- Estimate 5 min saved per reply
+        'activeProjects', 1 -- TODO: count distinct projects when multi-project support added
+    );
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.get_dashboard_stats(TEXT) TO service_role, anon, authenticated;
+GRANT SELECT ON emailreply.dashboard_counters TO service_role;
+
+-- Reload PostgREST configuration
+NOTIFY pgrst, 'reload config';
@@ -0,0 +1,73 @@
+-- Migration: Keyset pagination for recent drafts
+-- get_recent_drafts (011) filtered on the unindexed meta->>'projectId' expression and could only
+-- return the first N rows. The composite expression index below serves the filter and the
+-- (created_at, id) ordering, so every page is an index range scan no matter how deep it is.
+
+CREATE SCHEMA IF NOT EXISTS emailreply;
+
+-- Per-project listing: WHERE projectId = ? AND role = 'assistant' ORDER BY created_at DESC, id DESC
+CREATE INDEX IF NOT EXISTS idx_messages_projectid_role_created
+ON emailreply.messages ((meta->>'projectId'), role, created_at DESC, id DESC);
+
+-- 'default' (all projects) listing with the same tie-breaker
+CREATE INDEX IF NOT EXISTS idx_messages_role_created_id
+ON emailreply.messages (role, created_at DESC, id DESC);
+
+-- Recent drafts, one page at a time. Pass the created_at/id of the last row of the previous
+-- page as p_before_created_at/p_before_id (both NULL for the first page).
+CREATE OR REPLACE FUNCTION public.get_recent_drafts_page(
+    p_project_id TEXT DEFAULT 'default',
+    p_limit INT DEFAULT 10,
+    p_before_created_at TIMESTAMPTZ DEFAULT NULL,
+    p_before_id UUID DEFAULT NULL
+)
+RETURNS TABLE(
+    id UUID,
+    subject TEXT,
+    snippet TEXT,
+    thread_id TEXT,
+    tone TEXT,
+    created_at TIMESTAMPTZ
+)
+LANGUAGE plpgsql
+STABLE
+SECURITY DEFINER
+AS $$
+BEGIN
+    IF p_project_id = 'default' THEN
+        RETURN QUERY
+        SELECT
+            m.id,
+            COALESCE(m.meta->>'subject', 'No Subject') AS subject,
+            LEFT(m.content, 100) AS snippet,
+            COALESCE(m.meta->>'threadId', '') AS thread_id,
+            COALESCE(m.meta->>'tone', 'friendly') AS tone,
+            m.created_at
+        FROM emailreply.messages m
+        WHERE m.role = 'assistant'
+        AND (p_before_created_at IS NULL OR (m.created_at, m.id) < (p_before_created_at, p_before_id))
+        ORDER BY m.created_at DESC, m.id DESC
+        LIMIT LEAST(GREATEST(p_limit, 1), 200);
+    ELSE
+        RETURN QUERY
+        SELECT
+            m.id,
+            COALESCE(m.meta->>'subject', 'No Subject') AS subject,
+            LEFT(m.content, 100) AS snippet,
+            COALESCE(m.meta->>'threadId', '') AS thread_id,
+            COALESCE(m.meta->>'tone', 'friendly') AS tone,
+            m.created_at
+        FROM emailreply.messages m
+        WHERE m.meta->>'projectId' = p_project_id
+        AND m.role = 'assistant'
+        AND (p_before_created_at IS NULL OR (m.created_at, m.id) < (p_before_created_at, p_before_id))
+        ORDER BY m.created_at DESC, m.id DESC
+        LIMIT LEAST(GREATEST(p_limit, 1), 200);
+    END IF;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.get_recent_drafts_page(TEXT, INT, TIMESTAMPTZ, UUID) TO service_role, anon, authenticated;
+
+-- Reload PostgREST configuration
+NOTIFY pgrst, 'reload config';
@@ -42,6 +42,9 @@ export function useAgent(projectId: string) {
 					finalResult = data.result;
 					break;
 				}
+				if (data.status === "error") {
+					throw new Error(data.error || "Draft generation failed");
+				}
 				await new Promise((res) => setTimeout(res, 800));
 			}
 